@@ -0,0 +1,10 @@
+"""AgroPulse's building blocks: the upstream client, caches, stores, indexes and job queue behind app.py's routes.
+
+Kept in one package so generic module names (cache, logs, metrics, jobs, ...)
+can't shadow, or be shadowed by, installed packages of the same name.
+"""
+import os
+
+
+# The repository root, where prices.json, market_locations.json and fixtures/ live.
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
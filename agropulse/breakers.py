@@ -0,0 +1,182 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+import requests
+from prometheus_client import Counter
+from agropulse import logs
+
+
+log = logging.getLogger(__name__)
+
+BREAKER_ENABLED = os.getenv("BREAKER_ENABLED", "1").lower() not in ("0", "false", "no")
+# The failure rate is taken over the last BREAKER_WINDOW calls, once at least BREAKER_MIN_CALLS were made.
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "5"))
+BREAKER_FAILURE_RATE = float(os.getenv("BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+BREAKER_HALF_OPEN_PROBES = int(os.getenv("BREAKER_HALF_OPEN_PROBES", "1"))
+# Successful calls slower than this count as failures too; 0 disables it.
+BREAKER_SLOW_CALL_SECONDS = float(os.getenv("BREAKER_SLOW_CALL_SECONDS", "0"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+TRANSITIONS = Counter("agropulse_breaker_transitions_total", "Circuit breaker state changes.", ["upstream", "state"])
+REJECTED = Counter("agropulse_breaker_rejected_total", "Calls refused without reaching the upstream because its breaker was open.", ["upstream"])
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised instead of calling an upstream whose breaker is open.
+
+    It is a RequestException, so every route that already handles a failed
+    upstream call (falling back, serving stale data or answering 5xx) does the
+    same here, only without waiting for a timeout first.
+    """
+
+    def __init__(self, upstream, retry_after):
+        super().__init__(f"{upstream} is unavailable (circuit open, retry in {retry_after:.0f}s)")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Failure-rate breaker for one upstream, per process.
+
+    Closed: calls go through and their outcomes fill a rolling window. Once the
+    window's failure rate reaches the threshold the breaker opens and calls
+    fail immediately. After open_seconds it turns half-open and lets up to
+    `probes` calls through: a success closes it with a fresh window, a failure
+    opens it again.
+    """
+
+    def __init__(self, name, window=BREAKER_WINDOW, min_calls=BREAKER_MIN_CALLS, failure_rate=BREAKER_FAILURE_RATE,
+                 open_seconds=BREAKER_OPEN_SECONDS, probes=BREAKER_HALF_OPEN_PROBES, slow_call_seconds=BREAKER_SLOW_CALL_SECONDS):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.probes = probes
+        self.slow_call_seconds = slow_call_seconds
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window)
+        self.state = CLOSED
+        self.opened_at = None
+        self._probes_in_flight = 0
+        self.rejected = 0
+        self.times_opened = 0
+        self.last_failure = None
+
+    def _transition(self, state):
+        """Caller must hold _lock."""
+        self.state = state
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+            self.times_opened += 1
+        elif state == CLOSED:
+            self._outcomes.clear()
+            self.opened_at = None
+        self._probes_in_flight = 0
+        TRANSITIONS.labels(self.name, state).inc()
+        log.warning("Circuit breaker state changed", extra={"upstream": self.name, "state": state, "last_failure": self.last_failure})
+
+    def _retry_after(self):
+        return max(self.open_seconds - (time.monotonic() - self.opened_at), 0.0)
+
+    def before_call(self):
+        """Admits a call or raises CircuitOpenError. Returns True if the call is a half-open probe."""
+        with self._lock:
+            if self.state == OPEN and self._retry_after() <= 0:
+                self._transition(HALF_OPEN)
+            if self.state == CLOSED:
+                return False
+            if self.state == HALF_OPEN and self._probes_in_flight < self.probes:
+                self._probes_in_flight += 1
+                return True
+            self.rejected += 1
+            retry_after = self._retry_after() if self.state == OPEN else 1.0
+        REJECTED.labels(self.name).inc()
+        raise CircuitOpenError(self.name, retry_after)
+
+    def record(self, ok, seconds=None, probe=False, error=None):
+        """Records a finished call admitted by before_call()."""
+        if ok and self.slow_call_seconds and seconds is not None and seconds > self.slow_call_seconds:
+            ok, error = False, f"slow call ({seconds:.1f}s)"
+        with self._lock:
+            if not ok:
+                self.last_failure = error
+            if probe:
+                if self.state == HALF_OPEN:
+                    self._transition(CLOSED if ok else OPEN)
+                return
+            if self.state != CLOSED:
+                return  # a call admitted before the breaker opened
+            self._outcomes.append(ok)
+            calls = len(self._outcomes)
+            failures = calls - sum(self._outcomes)
+            if calls >= self.min_calls and failures / calls >= self.failure_rate:
+                self._transition(OPEN)
+
+    def stats(self):
+        with self._lock:
+            calls = len(self._outcomes)
+            failures = calls - sum(self._outcomes)
+            return {
+                "state": self.state,
+                "window_calls": calls,
+                "window_failure_rate": round(failures / calls, 3) if calls else 0.0,
+                "retry_after_seconds": round(self._retry_after(), 1) if self.state == OPEN else None,
+                "times_opened": self.times_opened,
+                "rejected": self.rejected,
+                "last_failure": self.last_failure,
+            }
+
+
+_registry_lock = threading.Lock()
+_registry = {}
+
+
+def get(name):
+    """The breaker for an upstream label (see metrics.upstream_name), created on first use."""
+    breaker = _registry.get(name)
+    if breaker is None:
+        with _registry_lock:
+            breaker = _registry.setdefault(name, CircuitBreaker(name))
+    return breaker
+
+
+@contextmanager
+def guard(name):
+    """Runs the block through the upstream's breaker: refused while open, any exception counts as a failure."""
+    if not BREAKER_ENABLED:
+        yield
+        return
+    breaker = get(name)
+    probe = breaker.before_call()
+    started = time.monotonic()
+    try:
+        yield
+    except BaseException as e:
+        breaker.record(False, probe=probe, error=logs.describe_error(e))
+        raise
+    breaker.record(True, time.monotonic() - started, probe=probe)
+
+
+def stats():
+    with _registry_lock:
+        breakers = dict(_registry)
+    return {
+        "enabled": BREAKER_ENABLED,
+        "settings": {
+            "window": BREAKER_WINDOW,
+            "min_calls": BREAKER_MIN_CALLS,
+            "failure_rate": BREAKER_FAILURE_RATE,
+            "open_seconds": BREAKER_OPEN_SECONDS,
+            "half_open_probes": BREAKER_HALF_OPEN_PROBES,
+            "slow_call_seconds": BREAKER_SLOW_CALL_SECONDS,
+        },
+        "upstreams": {name: breaker.stats() for name, breaker in sorted(breakers.items())},
+    }
@@ -0,0 +1,200 @@
+"""Per-route-class concurrency limits (bulkheads) with bounded wait queues.
+
+Expensive routes are grouped into classes, and each class gets its own
+semaphore: /predict (large uploads plus a 60s Gemini call) and the other
+Gemini-backed routes. Once a class's limit is reached, requests wait in a
+queue of bounded length for at most BULKHEAD_MAX_WAIT seconds. Beyond that
+they are shed with a fast 503 and Retry-After instead of tying up a worker.
+Every other route is never held, so /weather and /get-items keep their
+latency while the expensive classes are saturated.
+
+Off unless BULKHEADS_ENABLED=1. Limits are per process, so they only engage
+with gevent workers (AGRO_SERVING_MODE=async), where one process serves many
+requests at once; gunicorn.conf.py warns at startup when they are turned on
+under sync.
+"""
+import os
+import math
+import time
+import logging
+import threading
+from prometheus_client import Counter, Gauge, Histogram
+
+
+log = logging.getLogger(__name__)
+
+BULKHEADS_ENABLED = os.getenv("BULKHEADS_ENABLED", "0").lower() not in ("0", "false", "no")
+# Longest a request waits for a slot before it is shed.
+BULKHEAD_MAX_WAIT = float(os.getenv("BULKHEAD_MAX_WAIT", "10"))
+
+# Route rule -> class. Routes not listed run without a bulkhead.
+ROUTE_CLASSES = {
+    "/predict": "predict",
+    "/ask-agro-assistant": "gemini",
+    "/planner": "gemini",
+    "/vegetable-info": "gemini",
+    "/prices/batch": "gemini",
+}
+# Class -> (concurrent requests, waiting requests); BULKHEAD_<CLASS>_LIMIT / _QUEUE override them.
+DEFAULT_LIMITS = {
+    "predict": (4, 8),
+    "gemini": (16, 32),
+}
+
+IN_FLIGHT = Gauge("agropulse_bulkhead_in_flight", "Requests holding a bulkhead slot.", ["bulkhead"],
+                  multiprocess_mode="livesum")
+QUEUE_DEPTH = Gauge("agropulse_bulkhead_queue_depth", "Requests waiting for a bulkhead slot.", ["bulkhead"],
+                    multiprocess_mode="livesum")
+WAIT_SECONDS = Histogram("agropulse_bulkhead_wait_seconds", "Time a request waited for a bulkhead slot.", ["bulkhead"],
+                         buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+REJECTED = Counter("agropulse_bulkhead_rejected_total", "Requests shed by a bulkhead.", ["bulkhead", "reason"])
+
+
+class BulkheadFull(Exception):
+    """Raised by acquire() when the queue is full or the wait ran out."""
+
+    def __init__(self, name, reason, retry_after):
+        super().__init__(f"{name} bulkhead is full ({reason})")
+        self.name = name
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Bulkhead:
+    """A counting semaphore with a bounded, timed wait queue and the numbers to report on it."""
+
+    def __init__(self, name, limit, max_queue, max_wait=BULKHEAD_MAX_WAIT):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        # Moving average of how long a slot is held, for Retry-After.
+        self.hold_seconds = None
+
+    def _retry_after(self):
+        """Caller must hold _cond. Roughly how long until the queue ahead has drained."""
+        hold = self.hold_seconds or 1.0
+        return max(math.ceil(hold * (self.waiting + 1) / self.limit), 1)
+
+    def _reject(self, reason):
+        """Caller must hold _cond."""
+        self.rejected += 1
+        REJECTED.labels(self.name, reason).inc()
+        return BulkheadFull(self.name, reason, self._retry_after())
+
+    def acquire(self):
+        """Takes a slot, waiting up to max_wait. Returns the seconds waited; raises BulkheadFull."""
+        started = time.monotonic()
+        with self._cond:
+            if self.active >= self.limit:
+                if self.waiting >= self.max_queue:
+                    raise self._reject("queue_full")
+                self.waiting += 1
+                QUEUE_DEPTH.labels(self.name).inc()
+                try:
+                    deadline = started + self.max_wait
+                    while self.active >= self.limit:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise self._reject("timeout")
+                        self._cond.wait(remaining)
+                finally:
+                    self.waiting -= 1
+                    QUEUE_DEPTH.labels(self.name).dec()
+            self.active += 1
+            self.admitted += 1
+        IN_FLIGHT.labels(self.name).inc()
+        waited = time.monotonic() - started
+        WAIT_SECONDS.labels(self.name).observe(waited)
+        return waited
+
+    def release(self, held_seconds=None):
+        with self._cond:
+            self.active -= 1
+            if held_seconds is not None:
+                self.hold_seconds = held_seconds if self.hold_seconds is None else 0.8 * self.hold_seconds + 0.2 * held_seconds
+            self._cond.notify()
+        IN_FLIGHT.labels(self.name).dec()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "limit": self.limit,
+                "max_queue": self.max_queue,
+                "active": self.active,
+                "waiting": self.waiting,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "avg_hold_seconds": round(self.hold_seconds, 3) if self.hold_seconds is not None else None,
+            }
+
+
+def _build():
+    bulkheads = {}
+    for name, (limit, max_queue) in DEFAULT_LIMITS.items():
+        limit = int(os.getenv(f"BULKHEAD_{name.upper()}_LIMIT", str(limit)))
+        max_queue = int(os.getenv(f"BULKHEAD_{name.upper()}_QUEUE", str(max_queue)))
+        if limit > 0:
+            bulkheads[name] = Bulkhead(name, limit, max_queue)
+    return bulkheads
+
+
+_bulkheads = _build()
+
+
+def for_route(rule):
+    """The bulkhead guarding a route rule, or None."""
+    if not BULKHEADS_ENABLED:
+        return None
+    return _bulkheads.get(ROUTE_CLASSES.get(rule))
+
+
+def init_app(app):
+    """Holds a slot from before the view runs until the response (including a streamed body) is closed."""
+    from flask import g, jsonify, request
+
+    @app.before_request
+    def _admit():
+        bulkhead = for_route(request.url_rule.rule) if request.url_rule is not None else None
+        if bulkhead is None:
+            return None
+        try:
+            bulkhead.acquire()
+        except BulkheadFull as e:
+            log.warning("Request shed by bulkhead", extra={"bulkhead": e.name, "reason": e.reason, "route": request.url_rule.rule})
+            response = jsonify({"error": "The server is busy with similar requests. Please try again shortly."})
+            response.status_code = 503
+            response.headers["Retry-After"] = str(e.retry_after)
+            return response
+        g.bulkhead = (bulkhead, time.monotonic())
+        return None
+
+    @app.after_request
+    def _release_on_close(response):
+        held = g.pop("bulkhead", None)
+        if held is not None:
+            bulkhead, started = held
+            response.call_on_close(lambda: bulkhead.release(time.monotonic() - started))
+        return response
+
+    @app.teardown_request
+    def _release_on_error(exc):
+        # Only reached with the slot still held if after_request never ran.
+        held = g.pop("bulkhead", None)
+        if held is not None:
+            bulkhead, started = held
+            bulkhead.release(time.monotonic() - started)
+
+
+def stats():
+    return {
+        "enabled": BULKHEADS_ENABLED,
+        "max_wait": BULKHEAD_MAX_WAIT,
+        "routes": ROUTE_CLASSES,
+        "bulkheads": {name: bulkhead.stats() for name, bulkhead in sorted(_bulkheads.items())},
+    }
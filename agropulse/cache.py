@@ -0,0 +1,183 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+
+log = logging.getLogger(__name__)
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory").lower()
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "2048"))
+CACHE_SQLITE_PATH = os.getenv("CACHE_SQLITE_PATH", "agropulse_cache.sqlite3")
+
+
+# --- Key normalization ---
+
+_ACRES_PER_UNIT = {
+    "acre": 1.0, "acres": 1.0, "ac": 1.0,
+    "hectare": 2.47105, "hectares": 2.47105, "ha": 2.47105,
+    "cent": 0.01, "cents": 0.01,
+    "sqft": 1 / 43560, "sq ft": 1 / 43560, "square feet": 1 / 43560,
+    "sqm": 1 / 4046.86, "sq m": 1 / 4046.86, "square meters": 1 / 4046.86,
+}
+
+
+def normalize_text(value):
+    """Lowercases and collapses whitespace so 'Tomato ' and ' tomato' share a key."""
+    return re.sub(r"\s+", " ", str(value or "")).strip().lower()
+
+
+def normalize_area(value):
+    """Converts an area like '2 Acres', '1 ha' or '50 cents' to a canonical acre string."""
+    text = normalize_text(value).replace(",", "")
+    match = re.fullmatch(r"([0-9]*\.?[0-9]+)\s*([a-z. ]*)", text)
+    if not match:
+        return text
+    unit = match.group(2).replace(".", "").strip() or "acres"
+    factor = _ACRES_PER_UNIT.get(unit)
+    if factor is None:
+        return text
+    return f"{float(match.group(1)) * factor:g}"
+
+
+def make_key(namespace, *parts):
+    """Builds a cache key from already-normalized parts."""
+    return namespace + ":" + "|".join(str(p) for p in parts)
+
+
+# --- Backends ---
+
+class MemoryBackend:
+    """Bounded LRU store; each entry carries its own expiry time."""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (value, time.time() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteBackend:
+    """On-disk store that survives restarts, fronted by a MemoryBackend for hot keys."""
+
+    def __init__(self, path=CACHE_SQLITE_PATH, max_entries=CACHE_MAX_ENTRIES):
+        self._memory = MemoryBackend(max_entries)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+            self._conn.commit()
+
+    def get(self, key):
+        value = self._memory.get(key)
+        if value is not None:
+            return value
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        value = json.loads(row[0])
+        self._memory.set(key, value, row[1] - time.time())
+        return value
+
+    def set(self, key, value, ttl):
+        self._memory.set(key, value, ttl)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), time.time() + ttl),
+            )
+            self._conn.commit()
+
+    def delete(self, key):
+        self._memory.delete(key)
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+
+def build_backend(kind=CACHE_BACKEND, path=CACHE_SQLITE_PATH):
+    """Creates a 'memory' or 'sqlite' backend, falling back to memory if the file can't be opened."""
+    if kind == "sqlite":
+        try:
+            return SQLiteBackend(path)
+        except sqlite3.Error as e:
+            log.warning("Could not open cache database, using in-memory cache", extra={"path": path, "error": str(e)})
+    return MemoryBackend()
+
+
+backend = build_backend()
+
+
+class ResponseCache:
+    """A namespaced view over the shared backend with its own TTL and hit/miss counters."""
+
+    def __init__(self, namespace, ttl, store=None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.store = store if store is not None else backend
+        # Guards the counters, which threaded and gevent workers update concurrently.
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, *parts):
+        value = self.store.get(make_key(self.namespace, *parts))
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, value, *parts, ttl=None):
+        self.store.set(make_key(self.namespace, *parts), value, self.ttl if ttl is None else ttl)
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "ttl_seconds": self.ttl,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / total, 3) if total else 0.0,
+        }
@@ -0,0 +1,111 @@
+import os
+import time
+import logging
+import threading
+from agropulse import upstream
+
+
+log = logging.getLogger(__name__)
+
+
+class Lazy:
+    """A client built on first use rather than at import.
+
+    Thread-safe: concurrent first callers wait for a single build and then all
+    get the same object. If the factory raises, nothing is stored and the next
+    call tries again.
+    """
+
+    def __init__(self, factory, name=None):
+        self.factory = factory
+        self.name = name or factory.__name__
+        self._lock = threading.Lock()
+        self._built = False
+        self._value = None
+        self.init_seconds = None
+
+    def get(self):
+        if self._built:
+            return self._value
+        with self._lock:
+            if not self._built:
+                started = time.perf_counter()
+                self._value = self.factory()
+                self.init_seconds = time.perf_counter() - started
+                self._built = True
+        return self._value
+
+    def get_or_none(self):
+        """get(), but a failed build is logged and returns None. Nothing is stored, so the next call tries again."""
+        try:
+            return self.get()
+        except Exception as e:
+            log.error("Could not initialize client", extra={"client": self.name, "error": str(e)})
+            return None
+
+    def use(self, factory):
+        """Builds the client with `factory` from now on; the benchmarks swap in fakes this way. Call before first use."""
+        with self._lock:
+            self.factory = factory
+            self._built = False
+            self._value = None
+
+    @property
+    def initialized(self):
+        return self._built
+
+
+_registry = []
+
+
+def lazy(name):
+    """Decorator registering a factory function as a named Lazy client."""
+    def wrap(factory):
+        client = Lazy(factory, name)
+        _registry.append(client)
+        return client
+    return wrap
+
+
+@lazy("firestore")
+def firestore_db():
+    """The Firestore client. Raises if it cannot be initialized; see Lazy.get_or_none()."""
+    credentials_path = os.getenv("FIREBASE_CREDENTIALS_PATH")
+    if not credentials_path or not os.path.exists(credentials_path):
+        raise FileNotFoundError(f"Firebase credentials file not found at path: {credentials_path}. Check your .env file.")
+    # firebase_admin pulls in gRPC and the Firestore protos, the single most expensive import here.
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+    if not firebase_admin._apps:
+        firebase_admin.initialize_app(credentials.Certificate(credentials_path))
+    db = firestore.client()
+    log.info("Firestore initialized")
+    return db
+
+
+@lazy("cloudinary")
+def cloudinary_uploader():
+    """The configured cloudinary.uploader module."""
+    import cloudinary
+    import cloudinary.uploader
+    cloudinary.config(
+        cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
+        api_key=os.getenv("CLOUDINARY_API_KEY"),
+        api_secret=os.getenv("CLOUDINARY_API_SECRET"),
+        secure=True,
+        # Cloudinary has its own HTTP client, so the load-test override is applied here.
+        upload_prefix=upstream.UPSTREAM_BASE_URL_OVERRIDE,
+    )
+    log.info("Cloudinary configured")
+    return cloudinary.uploader
+
+
+def stats():
+    """Which clients this process has built so far, and how long each took."""
+    return {
+        client.name: {
+            "initialized": client.initialized,
+            "init_ms": round(client.init_seconds * 1000, 1) if client.init_seconds is not None else None,
+        }
+        for client in _registry
+    }
@@ -0,0 +1,138 @@
+import io
+import os
+import threading
+from collections import Counter
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+try:
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+    HEIF_SUPPORT = True
+except ImportError:
+    HEIF_SUPPORT = False
+
+
+IMAGE_MAX_EDGE = int(os.getenv("PREDICT_IMAGE_MAX_EDGE", "1024"))
+IMAGE_FORMAT = os.getenv("PREDICT_IMAGE_FORMAT", "jpeg").lower()
+IMAGE_QUALITY = int(os.getenv("PREDICT_IMAGE_QUALITY", "85"))
+
+HASH_SIZE = 8  # 8x8 gradient bits -> a 64-bit hash
+
+OUTPUT_FORMATS = {
+    "jpeg": ("JPEG", "image/jpeg"),
+    "webp": ("WEBP", "image/webp"),
+}
+
+
+class ImageRejected(ValueError):
+    """The upload is not an image we can decode."""
+
+
+_lock = threading.Lock()
+_counters = Counter()
+_formats = Counter()
+
+
+def _stream_size(stream):
+    position = stream.tell()
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(position)
+    return size
+
+
+def _to_rgb(image):
+    """Flattens transparency onto white, since neither output format needs an alpha channel for a leaf photo."""
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+    return image.convert("RGB") if image.mode != "RGB" else image
+
+
+def dhash(image):
+    """64-bit difference hash: whether each pixel is brighter than its right neighbour on a 9x8 grayscale thumbnail.
+
+    Survives recompression, resizing, small crops and brightness changes, which
+    is what separates a re-shared WhatsApp copy from a genuinely different leaf.
+    """
+    small = image.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BILINEAR)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def prepare(stream, max_edge=None, output_format=None, quality=None):
+    """Decodes an uploaded image and re-encodes it small enough to send to Gemini.
+
+    Reads from the upload's file object (Werkzeug spools large uploads to a
+    temporary file), so the original is never held in memory as one bytes
+    object. JPEGs are decoded at a reduced DCT scale where possible. The image
+    is rotated upright, downscaled to max_edge, stripped of EXIF and other
+    metadata, and saved as JPEG or WebP.
+
+    Returns (data, mime_type, info), where info has the detected source format,
+    the before/after sizes and the perceptual hash of the normalized image.
+    """
+    max_edge = max_edge or IMAGE_MAX_EDGE
+    save_format, mime_type = OUTPUT_FORMATS.get(output_format or IMAGE_FORMAT, OUTPUT_FORMATS["jpeg"])
+    quality = quality or IMAGE_QUALITY
+
+    bytes_in = _stream_size(stream)
+    try:
+        image = Image.open(stream)
+        source_format = image.format or "unknown"
+        # Lets the JPEG decoder skip detail we are about to throw away (1/2, 1/4 or 1/8 scale).
+        image.draft("RGB", (max_edge, max_edge))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+        image = _to_rgb(image)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError) as e:
+        with _lock:
+            _counters["rejected"] += 1
+        raise ImageRejected("Could not read the uploaded image; send a JPEG, PNG, WebP or HEIC photo.") from e
+
+    output = io.BytesIO()
+    # No exif= argument, so nothing from the original metadata is written back.
+    if save_format == "JPEG":
+        image.save(output, "JPEG", quality=quality, optimize=True, progressive=True)
+    else:
+        image.save(output, "WEBP", quality=quality, method=4)
+    data = output.getvalue()
+
+    info = {
+        "source_format": source_format,
+        "width": image.width,
+        "height": image.height,
+        "bytes_in": bytes_in,
+        "bytes_out": len(data),
+        "dhash": dhash(image),
+    }
+    with _lock:
+        _counters["images"] += 1
+        _counters["bytes_in"] += bytes_in
+        _counters["bytes_out"] += len(data)
+        _formats[source_format] += 1
+    return data, mime_type, info
+
+
+def stats():
+    with _lock:
+        bytes_in, bytes_out = _counters["bytes_in"], _counters["bytes_out"]
+        return {
+            "images": _counters["images"],
+            "rejected": _counters["rejected"],
+            "bytes_in": bytes_in,
+            "bytes_out": bytes_out,
+            "reduction_ratio": round(bytes_in / bytes_out, 2) if bytes_out else None,
+            "source_formats": dict(_formats),
+            "heif_support": HEIF_SUPPORT,
+            "max_edge": IMAGE_MAX_EDGE,
+            "output_format": IMAGE_FORMAT,
+            "quality": IMAGE_QUALITY,
+        }
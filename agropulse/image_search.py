@@ -0,0 +1,157 @@
+import os
+import sys
+import json
+import logging
+import threading
+from agropulse import REPO_ROOT
+from agropulse import cache
+from agropulse import singleflight
+from agropulse import upstream
+
+
+log = logging.getLogger(__name__)
+
+IMAGE_CACHE_BACKEND = os.getenv("IMAGE_CACHE_BACKEND", "sqlite")
+IMAGE_CACHE_PATH = os.getenv("IMAGE_CACHE_PATH", "agropulse_images.sqlite3")
+CACHE_TTL_IMAGE_URL = int(os.getenv("CACHE_TTL_IMAGE_URL", str(30 * 24 * 3600)))
+# Terms CSE found nothing for are remembered too, but retried sooner.
+CACHE_TTL_IMAGE_MISS = int(os.getenv("CACHE_TTL_IMAGE_MISS", str(24 * 3600)))
+
+NO_IMAGE = ""
+
+
+def image_key(name):
+    """Caches by the English vegetable name, so 'Tomato (தக்காளி)', 'tomato' and ' Tomato ' share one entry."""
+    return cache.normalize_text(str(name or "").split("(", 1)[0])
+
+
+class ImageSearch:
+    """Resolves vegetable names to a photo URL via Google Custom Search, with a persistent cache.
+
+    The discovery client is built once, on the first cache miss, so the slow
+    googleapiclient import stays out of startup. Each thread gets its own
+    httplib2 connection since those are not thread-safe. Results, including
+    "no image", are stored in their own SQLite file so they survive restarts
+    and are shared by every worker. Concurrent lookups for one name share one
+    CSE query.
+    """
+
+    def __init__(self, api_key, cse_id, store=None):
+        self.api_key = api_key
+        self.cse_id = cse_id
+        self.urls = cache.ResponseCache(
+            "image-url",
+            CACHE_TTL_IMAGE_URL,
+            store=store if store is not None else cache.build_backend(IMAGE_CACHE_BACKEND, IMAGE_CACHE_PATH),
+        )
+        self._flights = singleflight.Group("google-cse")
+        self._service = None
+        self._service_lock = threading.Lock()
+        self._local = threading.local()
+        # Guards the counters, which threaded and gevent workers update concurrently.
+        self._counter_lock = threading.Lock()
+        self.cse_calls = 0
+        self.cse_errors = 0
+
+    def _cse(self):
+        with self._service_lock:
+            if self._service is None:
+                from googleapiclient.discovery import build
+                # googleapiclient does not use upstream.session, so the load-test override is applied here.
+                client_options = {"api_endpoint": upstream.UPSTREAM_BASE_URL_OVERRIDE} if upstream.UPSTREAM_BASE_URL_OVERRIDE else None
+                self._service = build("customsearch", "v1", developerKey=self.api_key, cache_discovery=False,
+                                      client_options=client_options)
+            return self._service.cse()
+
+    def _http(self):
+        http = getattr(self._local, "http", None)
+        if http is None:
+            from googleapiclient.http import build_http
+            http = self._local.http = build_http()
+        return http
+
+    def search(self, query):
+        """Queries CSE for one image. Returns its URL, NO_IMAGE if there is none, or None if the call failed."""
+        if not self.api_key or not self.cse_id:
+            log.warning("Google CSE API key or ID is not set, cannot search for image")
+            return None
+        with self._counter_lock:
+            self.cse_calls += 1
+        try:
+            with upstream.tracked("cse"):
+                res = self._cse().list(
+                    q=query,
+                    cx=self.cse_id,
+                    searchType='image',
+                    num=1,
+                    safe='high'
+                ).execute(http=self._http())
+        except Exception as e:
+            with self._counter_lock:
+                self.cse_errors += 1
+            log.error("Google image search failed", extra={"query": query, "error": str(e)})
+            return None
+        items = res.get('items') or []
+        return items[0]['link'] if items else NO_IMAGE
+
+    def lookup(self, name, search_term=None):
+        """Returns an image URL for a vegetable name, or None. Only cache misses reach CSE."""
+        key = image_key(name)
+        if not key:
+            return None
+        cached = self.urls.get(key)
+        if cached is not None:
+            return cached or None
+
+        def resolve():
+            url = self.search(search_term or f"Fresh {key}")
+            if url is not None:  # failed calls are not cached, so the next request retries
+                self.urls.set(url, key, ttl=CACHE_TTL_IMAGE_URL if url else CACHE_TTL_IMAGE_MISS)
+            return url or None
+
+        return self._flights.do(key, resolve, label="customsearch")
+
+    def warm(self, names, force=False):
+        """Resolves every name not already cached. Returns (resolved, without_image, failed, skipped) counts."""
+        counts = {"resolved": 0, "without_image": 0, "failed": 0, "skipped": 0}
+        for key in sorted({image_key(name) for name in names} - {""}):
+            if not force and self.urls.store.get(cache.make_key(self.urls.namespace, key)) is not None:
+                counts["skipped"] += 1
+                continue
+            url = self.search(f"Fresh {key}")
+            if url is None:
+                counts["failed"] += 1
+                continue
+            self.urls.set(url, key, ttl=CACHE_TTL_IMAGE_URL if url else CACHE_TTL_IMAGE_MISS)
+            counts["resolved" if url else "without_image"] += 1
+            log.info("Image cached", extra={"vegetable": key, "url": url or None})
+        return counts
+
+    def stats(self):
+        with self._counter_lock:
+            calls, errors = self.cse_calls, self.cse_errors
+        return dict(self.urls.stats(), cse_calls=calls, cse_errors=errors)
+
+
+def vegetable_names(prices_path):
+    with open(prices_path, encoding="utf-8") as f:
+        data = json.load(f)
+    return {
+        veg["name"]
+        for district in data.get("district_prices", [])
+        for veg in district.get("vegetables", [])
+    }
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] != ["warm"]:
+        print("Usage: python -m agropulse.image_search warm [--force]")
+        sys.exit(1)
+    from dotenv import load_dotenv
+    from agropulse import logs
+    load_dotenv()
+    logs.configure()
+    searcher = ImageSearch(os.getenv("GOOGLE_CSE_API_KEY"), os.getenv("GOOGLE_CSE_ID"))
+    prices_path = os.path.join(REPO_ROOT, 'prices.json')
+    result = searcher.warm(vegetable_names(prices_path), force="--force" in sys.argv[2:])
+    print(f"Image cache warm-up: {result}")
@@ -0,0 +1,325 @@
+"""Durable background jobs for the slow Gemini routes.
+
+With ?async=1 (or `Prefer: respond-async`), /predict and /planner store the
+request in a SQLite queue and answer 202 with a job id right away. Each
+process runs a small pool of worker threads that claim queued jobs, so no
+request thread waits on the model. Clients poll GET /jobs/<id> until the job
+is done. Jobs survive restarts. One whose worker died is picked up again once
+its lease runs out. Finished results are kept for JOB_RESULT_TTL seconds.
+"""
+import os
+import json
+import time
+import uuid
+import socket
+import logging
+import sqlite3
+import threading
+from prometheus_client import Counter, Histogram
+from agropulse import breakers
+
+
+log = logging.getLogger(__name__)
+
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "agropulse_jobs.sqlite3")
+# Worker threads per process, i.e. how many jobs one process runs at once.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# Queued plus running jobs across all processes; submissions beyond it get a 503.
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", "500"))
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", "3600"))
+# A running job not finished within this many seconds is assumed lost with its worker and queued again.
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "180"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_WORKER_LOST = "The job was interrupted too many times. Please submit it again."
+
+FINISHED = Counter("agropulse_jobs_finished_total", "Background jobs finished, by outcome.", ["kind", "status"])
+WAIT_SECONDS = Histogram("agropulse_job_wait_seconds", "Time a job spent queued before a worker started it.", ["kind"],
+                         buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300))
+RUN_SECONDS = Histogram("agropulse_job_run_seconds", "Time a worker spent running a job.", ["kind"],
+                        buckets=(0.5, 1, 2.5, 5, 10, 20, 30, 45, 60, 90, 120))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    run_after REAL NOT NULL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    lease_expires_at REAL,
+    owner TEXT,
+    status_code INTEGER,
+    result TEXT,
+    error TEXT,
+    expires_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, run_after, created_at);
+CREATE INDEX IF NOT EXISTS jobs_by_expiry ON jobs (expires_at);
+"""
+
+
+class QueueFull(Exception):
+    """Raised by submit() when JOB_MAX_PENDING jobs are already waiting or running."""
+
+    def __init__(self, pending, retry_after):
+        super().__init__(f"{pending} jobs are already pending")
+        self.retry_after = retry_after
+
+
+def wants_async(request):
+    """True when the client asked for a job id instead of waiting: ?async=1 or `Prefer: respond-async`."""
+    if request.args.get("async", "").lower() in ("1", "true", "yes"):
+        return True
+    return "respond-async" in request.headers.get("Prefer", "").lower()
+
+
+class JobQueue:
+    """The jobs table. Every process shares it; claiming a job is a single write transaction."""
+
+    def __init__(self, path=JOBS_DB_PATH, max_pending=JOB_MAX_PENDING, result_ttl=JOB_RESULT_TTL,
+                 lease_seconds=JOB_LEASE_SECONDS, max_attempts=JOB_MAX_ATTEMPTS):
+        self.path = path
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+        # Wakes this process's idle workers on submit; other processes notice on their next poll.
+        self._wake = threading.Event()
+        self.submitted = 0
+        self.rejected = 0
+
+    def _write(self, statements):
+        """Runs statements(conn) inside BEGIN IMMEDIATE, so concurrent processes serialize on it."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = statements(self._conn)
+                self._conn.execute("COMMIT")
+                return result
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def submit(self, kind, payload):
+        """Queues a job and returns its id. Raises QueueFull when the queue is at max_pending."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+
+        def insert(conn):
+            pending = conn.execute("SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)).fetchone()[0]
+            if pending >= self.max_pending:
+                return pending
+            conn.execute("INSERT INTO jobs (id, kind, payload, status, run_after, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                         (job_id, kind, json.dumps(payload), QUEUED, now, now))
+            return None
+
+        pending = self._write(insert)
+        if pending is not None:
+            self.rejected += 1
+            raise QueueFull(pending, retry_after=max(JOB_POLL_INTERVAL, 1) * 5)
+        self.submitted += 1
+        self._wake.set()
+        return job_id
+
+    def claim(self, owner):
+        """Marks the oldest runnable job as running for `owner` and returns it as a dict, or None."""
+        now = time.time()
+
+        def take(conn):
+            # Jobs whose worker vanished mid-run go back in the queue, or fail once out of attempts.
+            conn.execute(
+                "UPDATE jobs SET status = ?, owner = NULL WHERE status = ? AND lease_expires_at < ? AND attempts < ?",
+                (QUEUED, RUNNING, now, self.max_attempts))
+            conn.execute(
+                "UPDATE jobs SET status = ?, status_code = 500, error = ?, result = ?, payload = '{}', "
+                "finished_at = ?, expires_at = ? WHERE status = ? AND lease_expires_at < ?",
+                (FAILED, _WORKER_LOST, json.dumps({"error": _WORKER_LOST}), now, now + self.result_ttl, RUNNING, now))
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = ? AND run_after <= ? ORDER BY created_at LIMIT 1", (QUEUED, now)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, owner = ?, attempts = attempts + 1, "
+                "started_at = ?, lease_expires_at = ? WHERE id = ?",
+                (RUNNING, owner, now, now + self.lease_seconds, row["id"]))
+            return dict(row, status=RUNNING, attempts=row["attempts"] + 1, started_at=now)
+
+        return self._write(take)
+
+    def finish(self, job_id, owner, status_code, body):
+        """Stores a job's response and starts its retention clock. The payload is dropped to save space.
+
+        Only the owner that claimed the job can finish it; returns False if the job has since been
+        claimed by another worker (its lease expired), whose result is left alone.
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, status_code = ?, result = ?, error = ?, payload = '{}', "
+                "finished_at = ?, expires_at = ?, lease_expires_at = NULL WHERE id = ? AND owner = ?",
+                (DONE if status_code < 400 else FAILED, status_code, json.dumps(body),
+                 body.get("error") if status_code >= 400 else None, now, now + self.result_ttl, job_id, owner))
+        return cursor.rowcount > 0
+
+    def retry_later(self, job_id, owner, delay):
+        """Puts a running job back in the queue, not to be claimed for `delay` seconds. Same owner rule as finish()."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, owner = NULL, lease_expires_at = NULL, run_after = ? WHERE id = ? AND owner = ?",
+                (QUEUED, time.time() + delay, job_id, owner))
+        return cursor.rowcount > 0
+
+    def get(self, job_id):
+        """The job's public view, or None if it never existed or its result has expired."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, kind, status, attempts, created_at, started_at, finished_at, status_code, result, expires_at "
+                "FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None or (row["expires_at"] is not None and row["expires_at"] < time.time()):
+                return None
+            job = {
+                "job_id": row["id"],
+                "kind": row["kind"],
+                "status": row["status"],
+                "attempts": row["attempts"],
+                "created_at": row["created_at"],
+                "started_at": row["started_at"],
+                "finished_at": row["finished_at"],
+            }
+            if row["status"] == QUEUED:
+                job["position"] = self._conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = ? AND created_at < ?", (QUEUED, row["created_at"])
+                ).fetchone()[0] + 1
+        if row["result"] is not None:
+            job["status_code"] = row["status_code"]
+            job["result"] = json.loads(row["result"])
+        return job
+
+    def purge_expired(self):
+        """Deletes finished jobs past their retention. Returns how many were removed."""
+        with self._lock:
+            return self._conn.execute("DELETE FROM jobs WHERE expires_at < ?", (time.time(),)).rowcount
+
+    def wait_for_work(self, timeout):
+        self._wake.wait(timeout)
+        self._wake.clear()
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            oldest = self._conn.execute("SELECT MIN(created_at) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+        return {
+            "path": self.path,
+            "counts": {status: counts.get(status, 0) for status in (QUEUED, RUNNING, DONE, FAILED)},
+            "oldest_queued_seconds": round(time.time() - oldest, 1) if oldest else None,
+            "max_pending": self.max_pending,
+            "result_ttl": self.result_ttl,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+        }
+
+
+class JobWorkers:
+    """A fixed pool of daemon threads running jobs from a JobQueue through per-kind handlers.
+
+    A handler takes the job payload and returns (status_code, body), the same
+    response the synchronous route would have sent. If it raises
+    CircuitOpenError the job is queued again for when the breaker may have
+    closed, up to JOB_MAX_ATTEMPTS.
+    """
+
+    def __init__(self, queue, handlers, workers=JOB_WORKERS, poll_interval=JOB_POLL_INTERVAL):
+        self.queue = queue
+        self.handlers = handlers
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._threads = []
+        self._lock = threading.Lock()
+        self._purged_at = 0.0
+        self.busy = 0
+
+    def _maybe_purge(self):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._purged_at < 60:
+                return
+            self._purged_at = now
+        removed = self.queue.purge_expired()
+        if removed:
+            log.info("Expired job results removed", extra={"removed": removed})
+
+    def _run_job(self, job):
+        kind = job["kind"]
+        WAIT_SECONDS.labels(kind).observe(max(job["started_at"] - job["created_at"], 0.0))
+        handler = self.handlers.get(kind)
+        started = time.perf_counter()
+        try:
+            if handler is None:
+                status_code, body = 500, {"error": f"No handler for job kind '{kind}'."}
+            else:
+                status_code, body = handler(json.loads(job["payload"]))
+        except breakers.CircuitOpenError as e:
+            if job["attempts"] < self.queue.max_attempts:
+                log.info("Job deferred while upstream circuit is open", extra={"job_id": job["id"], "kind": kind, "upstream": e.upstream})
+                self.queue.retry_later(job["id"], self.owner, max(e.retry_after, 1.0))
+                return
+            status_code, body = 503, {"error": f"The {e.upstream} service is temporarily unavailable. Please try again shortly."}
+        except Exception:
+            log.exception("Job failed", extra={"job_id": job["id"], "kind": kind})
+            status_code, body = 500, {"error": "An unexpected error occurred on the server."}
+        RUN_SECONDS.labels(kind).observe(time.perf_counter() - started)
+        if not self.queue.finish(job["id"], self.owner, status_code, body):
+            log.warning("Job was taken over by another worker, result dropped", extra={"job_id": job["id"], "kind": kind})
+            return
+        FINISHED.labels(kind, DONE if status_code < 400 else FAILED).inc()
+
+    def _run(self):
+        while True:
+            try:
+                self._maybe_purge()
+                job = self.queue.claim(self.owner)
+            except sqlite3.Error as e:
+                log.warning("Could not claim a job", extra={"error": str(e)})
+                job = None
+            if job is None:
+                self.queue.wait_for_work(self.poll_interval)
+                continue
+            with self._lock:
+                self.busy += 1
+            try:
+                self._run_job(job)
+            finally:
+                with self._lock:
+                    self.busy -= 1
+
+    def start(self):
+        """Starts the pool once per process (lazily, so it survives gunicorn's fork)."""
+        with self._lock:
+            if self._threads:
+                return self
+            for number in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"job-worker-{number}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        return self
+
+    def stats(self):
+        return dict(self.queue.stats(), workers=len(self._threads), busy=self.busy, owner=self.owner)
@@ -0,0 +1,109 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+
+PREDICT_CACHE_ENABLED = os.getenv("PREDICT_CACHE_ENABLED", "1").lower() not in ("0", "false", "no")
+PREDICT_CACHE_MAX_DISTANCE = int(os.getenv("PREDICT_CACHE_MAX_DISTANCE", "6"))
+PREDICT_CACHE_MAX_ENTRIES = int(os.getenv("PREDICT_CACHE_MAX_ENTRIES", "1024"))
+PREDICT_CACHE_TTL = int(os.getenv("PREDICT_CACHE_TTL", str(7 * 24 * 3600)))
+# Blank, dark or heavily blurred photos have almost no gradients, so their hashes are (nearly) all zeros or all
+# ones and sit within max_distance of each other. A hash needs at least this many set and unset bits to be cached.
+PREDICT_CACHE_MIN_BITS = int(os.getenv("PREDICT_CACHE_MIN_BITS", "10"))
+HASH_BITS = 64
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def is_distinctive(image_hash, min_bits=PREDICT_CACHE_MIN_BITS):
+    """True if the hash has enough texture in it to tell this image from other photos."""
+    set_bits = bin(image_hash).count("1")
+    return min_bits <= set_bits <= HASH_BITS - min_bits
+
+
+class PredictionCache:
+    """Bounded LRU of /predict results keyed by perceptual hash, matched within a Hamming distance.
+
+    Hashes of near-featureless images are neither stored nor looked up, so a
+    blank or pitch-dark photo never gets another user's diagnosis.
+
+    Lookups scan every entry, which for a store of a few thousand 64-bit ints
+    is well under a millisecond next to a multi-second Gemini call.
+    """
+
+    def __init__(self, max_distance=PREDICT_CACHE_MAX_DISTANCE, max_entries=PREDICT_CACHE_MAX_ENTRIES,
+                 ttl=PREDICT_CACHE_TTL, enabled=PREDICT_CACHE_ENABLED):
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # hash -> (expires_at, result)
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.indistinct = 0
+        self.evictions = 0
+        self._hit_distance_total = 0
+
+    def get(self, image_hash):
+        """Returns (result, distance) for the closest stored hash within max_distance, else (None, None)."""
+        if not self.enabled:
+            return None, None
+        if not is_distinctive(image_hash):
+            with self._lock:
+                self.indistinct += 1
+            return None, None
+        now = time.time()
+        with self._lock:
+            best, best_distance = None, None
+            for stored_hash, (expires_at, _) in list(self._entries.items()):
+                if expires_at <= now:
+                    del self._entries[stored_hash]
+                    continue
+                distance = hamming(image_hash, stored_hash)
+                if distance <= self.max_distance and (best_distance is None or distance < best_distance):
+                    best, best_distance = stored_hash, distance
+                    if distance == 0:
+                        break
+            if best is None:
+                self.misses += 1
+                return None, None
+            self._entries.move_to_end(best)
+            self.hits += 1
+            self._hit_distance_total += best_distance
+            return self._entries[best][1], best_distance
+
+    def set(self, image_hash, result):
+        if not self.enabled or not is_distinctive(image_hash):
+            return
+        with self._lock:
+            self._entries[image_hash] = (time.time() + self.ttl, result)
+            self._entries.move_to_end(image_hash)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def record_bypass(self):
+        with self._lock:
+            self.bypassed += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "max_distance": self.max_distance,
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "indistinct": self.indistinct,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "avg_hit_distance": round(self._hit_distance_total / self.hits, 2) if self.hits else None,
+            }
@@ -0,0 +1,70 @@
+import os
+import re
+import sys
+import json
+import time
+import logging
+
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# json: one object per line for log shippers; text: human-readable with key=value extras.
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+
+# Attributes every LogRecord has; anything else on a record came from `extra=`.
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+# Query parameters the upstreams take API keys in (OpenWeatherMap, Gemini, data.gov.in, NewsAPI, Google CSE).
+# requests puts the full URL into its exception messages, so anything built from one is masked.
+_SECRET_PARAM = re.compile(r"\b(appid|key|api-key|api_key|apikey)=[^&\s'\")]+", re.IGNORECASE)
+
+
+def redact(text):
+    """text with the value of every API-key query parameter masked."""
+    return _SECRET_PARAM.sub(r"\1=REDACTED", text)
+
+
+def describe_error(e):
+    """'Type: message' for an exception, safe to log, store or serve."""
+    return redact(f"{type(e).__name__}: {e}")
+
+
+def _extras(record):
+    return {key: value for key, value in vars(record).items() if key not in _STANDARD_ATTRS}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(_extras(record))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return redact(json.dumps(entry, ensure_ascii=False, default=str))
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record):
+        line = super().format(record)
+        extras = _extras(record)
+        if extras:
+            line += " " + " ".join(f"{key}={value}" for key, value in extras.items())
+        return redact(line)
+
+
+def configure(level=LOG_LEVEL, fmt=LOG_FORMAT):
+    """Sends every logger's records to stderr in the chosen format. Safe to call more than once."""
+    root = logging.getLogger()
+    for handler in root.handlers:
+        if getattr(handler, "agropulse", False):
+            return
+    handler = logging.StreamHandler(sys.stderr)
+    handler.agropulse = True
+    handler.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+    root.addHandler(handler)
+    root.setLevel(level)
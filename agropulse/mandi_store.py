@@ -0,0 +1,500 @@
+"""Local copy of the data.gov.in mandi price resource, filled by a scheduled ingestion job.
+
+    python -m agropulse.mandi_store ingest              # page through data.gov.in (cron-friendly)
+    python -m agropulse.mandi_store ingest --fixture fixtures/mandi_records.json
+    python -m agropulse.mandi_store ingest --snapshot   # also append the new prices to price_history
+    python -m agropulse.mandi_store status
+
+Rows are keyed by (market, commodity, arrival_date, variety, grade), so a
+re-run only rewrites rows whose prices changed, and /prices answers "latest
+price for this market and commodity" with one indexed lookup instead of a live
+call. Each page is written in the same transaction as the run's checkpoint, so
+a run that dies part-way resumes from the last stored page.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from agropulse import cache
+from agropulse import logs
+
+
+log = logging.getLogger(__name__)
+
+MANDI_DB_PATH = os.getenv("MANDI_DB_PATH", "agropulse_mandi.sqlite3")
+MANDI_RESOURCE_ID = "9ef84268-d588-465a-a308-a864a43d0070"
+MANDI_PAGE_LIMIT = int(os.getenv("MANDI_PAGE_LIMIT", "1000"))
+MANDI_PAGE_TIMEOUT = float(os.getenv("MANDI_PAGE_TIMEOUT", "30"))
+# Seconds between background ingestion runs in the web workers; 0 leaves it to cron.
+MANDI_INGEST_INTERVAL = int(os.getenv("MANDI_INGEST_INTERVAL", "0"))
+MANDI_RETRY_INTERVAL = int(os.getenv("MANDI_RETRY_INTERVAL", "300"))
+# A failed run younger than this is resumed from its checkpoint rather than restarted.
+MANDI_RESUME_MAX_AGE = int(os.getenv("MANDI_RESUME_MAX_AGE", str(6 * 3600)))
+# Only one process ingests at a time; its claim lapses if it stops renewing it.
+MANDI_LEASE_SECONDS = int(os.getenv("MANDI_LEASE_SECONDS", "300"))
+# /prices reads the store only while its newest arrival_date or last complete run is younger than this.
+MANDI_STORE_MAX_AGE = int(os.getenv("MANDI_STORE_MAX_AGE", str(2 * 24 * 3600)))
+# latest() and latest_by_commodity() ignore records whose arrival_date is older than this many seconds.
+MANDI_RECORD_MAX_AGE = int(os.getenv("MANDI_RECORD_MAX_AGE", str(7 * 24 * 3600)))
+# Seconds between re-reads of the store's age; another process may be the one ingesting.
+MANDI_FRESHNESS_CHECK = 60
+
+RUNNING = "running"
+FAILED = "failed"
+COMPLETE = "complete"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS mandi_prices (
+    market_key TEXT NOT NULL,
+    commodity_key TEXT NOT NULL,
+    arrival_date TEXT NOT NULL,
+    variety TEXT NOT NULL,
+    grade TEXT NOT NULL,
+    state TEXT,
+    district TEXT,
+    market TEXT,
+    commodity TEXT,
+    min_price REAL,
+    max_price REAL,
+    modal_price REAL,
+    ingested_at REAL NOT NULL,
+    -- The key's leading columns are the (market, commodity, arrival_date) index /prices reads.
+    PRIMARY KEY (market_key, commodity_key, arrival_date, variety, grade)
+);
+CREATE TABLE IF NOT EXISTS ingest_runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    resource_id TEXT NOT NULL,
+    updated_date TEXT,
+    total INTEGER,
+    next_offset INTEGER NOT NULL DEFAULT 0,
+    upserted INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    error TEXT,
+    started_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS ingest_lease (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+_UPSERT = """
+INSERT INTO mandi_prices (market_key, commodity_key, arrival_date, variety, grade, state, district, market,
+                          commodity, min_price, max_price, modal_price, ingested_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (market_key, commodity_key, arrival_date, variety, grade) DO UPDATE SET
+    min_price = excluded.min_price, max_price = excluded.max_price, modal_price = excluded.modal_price,
+    state = excluded.state, district = excluded.district, ingested_at = excluded.ingested_at
+WHERE min_price IS NOT excluded.min_price OR max_price IS NOT excluded.max_price
+   OR modal_price IS NOT excluded.modal_price
+"""
+
+
+def iso_date(value):
+    """data.gov.in's dd/mm/yyyy arrival_date as yyyy-mm-dd (which sorts), or None if unparseable."""
+    try:
+        return datetime.strptime(str(value or "").strip(), "%d/%m/%Y").strftime("%Y-%m-%d")
+    except ValueError:
+        return None
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _oldest_arrival(max_age):
+    """The earliest yyyy-mm-dd arrival_date still younger than max_age seconds."""
+    return (datetime.now() - timedelta(seconds=max_age)).strftime("%Y-%m-%d")
+
+
+class LeaseLost(RuntimeError):
+    """Another process took over the ingestion lease while this one was still running."""
+
+
+def _price_text(value):
+    """Formats a stored price the way data.gov.in sends it ('2500', not '2500.0')."""
+    return "N/A" if value is None else f"{value:g}"
+
+
+class MandiStore:
+    """SQLite table of mandi records plus the bookkeeping for incremental, resumable ingestion."""
+
+    def __init__(self, path=MANDI_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            # WAL lets every worker read while the ingesting one writes.
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+        self._updated_at = None
+        self._updated_checked = None
+        self.lookups = 0
+        self.lookup_hits = 0
+
+    # --- Reads ---
+
+    def updated_at(self):
+        """Unix time of the store's newest data: the later of its last complete run and newest arrival_date.
+
+        None while the store is empty. Re-read at most every MANDI_FRESHNESS_CHECK seconds.
+        """
+        now = time.monotonic()
+        if self._updated_checked is None or now - self._updated_checked >= MANDI_FRESHNESS_CHECK:
+            with self._lock:
+                newest = self._conn.execute("SELECT MAX(arrival_date) FROM mandi_prices").fetchone()[0]
+                finished = self._conn.execute(
+                    "SELECT MAX(finished_at) FROM ingest_runs WHERE status = ?", (COMPLETE,)).fetchone()[0]
+            if newest is None:
+                self._updated_at = None
+            else:
+                self._updated_at = max(datetime.strptime(newest, "%Y-%m-%d").timestamp(), finished or 0)
+            self._updated_checked = now
+        return self._updated_at
+
+    def is_fresh(self, max_age=MANDI_STORE_MAX_AGE):
+        """True while the store has rows no older than max_age. Otherwise /prices calls data.gov.in live."""
+        updated_at = self.updated_at()
+        return updated_at is not None and time.time() - updated_at <= max_age
+
+    @staticmethod
+    def _record(row):
+        """A row in data.gov.in's own record shape, so callers format it like a live result."""
+        return {
+            "state": row["state"],
+            "district": row["district"],
+            "market": row["market"],
+            "commodity": row["commodity"],
+            "variety": row["variety"],
+            "grade": row["grade"],
+            "arrival_date": datetime.strptime(row["arrival_date"], "%Y-%m-%d").strftime("%d/%m/%Y"),
+            "min_price": _price_text(row["min_price"]),
+            "max_price": _price_text(row["max_price"]),
+            "modal_price": _price_text(row["modal_price"]),
+        }
+
+    def latest(self, market, commodity, max_age=MANDI_RECORD_MAX_AGE):
+        """The most recent record for a market and commodity (by arrival date), or None if none is within max_age."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM mandi_prices WHERE market_key = ? AND commodity_key = ? AND arrival_date >= ? "
+                "ORDER BY arrival_date DESC, modal_price DESC LIMIT 1",
+                (cache.normalize_text(market), cache.normalize_text(commodity), _oldest_arrival(max_age)),
+            ).fetchone()
+        self.lookups += 1
+        if row is None:
+            return None
+        self.lookup_hits += 1
+        return self._record(row)
+
+    def latest_by_commodity(self, market, max_age=MANDI_RECORD_MAX_AGE):
+        """{normalized commodity: latest record} for every commodity traded at a market within max_age."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM mandi_prices WHERE market_key = ? AND arrival_date >= ? "
+                "ORDER BY commodity_key, arrival_date DESC, modal_price DESC",
+                (cache.normalize_text(market), _oldest_arrival(max_age)),
+            ).fetchall()
+        latest = {}
+        for row in rows:
+            latest.setdefault(row["commodity_key"], self._record(row))
+        return latest
+
+    def arrival_dates(self):
+        """[(yyyy-mm-dd, last ingested_at)] for every arrival date held, for snapshotting into price_history."""
+        with self._lock:
+            return [tuple(row) for row in self._conn.execute(
+                "SELECT arrival_date, MAX(ingested_at) FROM mandi_prices GROUP BY arrival_date ORDER BY arrival_date")]
+
+    def markets(self):
+        """[(state, district, market)] for every market held, for market_geo.py's coordinate file."""
+        with self._lock:
+            return [tuple(row) for row in self._conn.execute(
+                "SELECT DISTINCT state, district, market FROM mandi_prices ORDER BY state, district, market")]
+
+    def rows_for_date(self, arrival_date):
+        """[(state, market, commodity, modal_price)] for one yyyy-mm-dd arrival date."""
+        with self._lock:
+            return [tuple(row) for row in self._conn.execute(
+                "SELECT state, market, commodity, modal_price FROM mandi_prices WHERE arrival_date = ?", (arrival_date,))]
+
+    # --- Ingestion bookkeeping ---
+
+    def acquire_lease(self, owner, ttl=MANDI_LEASE_SECONDS):
+        """Claims (or renews) the right to ingest. Returns False if another live process holds it."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT owner, expires_at FROM ingest_lease WHERE name = 'ingest'").fetchone()
+                if row is not None and row["owner"] != owner and row["expires_at"] > now:
+                    self._conn.execute("ROLLBACK")
+                    return False
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO ingest_lease (name, owner, expires_at) VALUES ('ingest', ?, ?)",
+                    (owner, now + ttl),
+                )
+                self._conn.execute("COMMIT")
+                return True
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def release_lease(self, owner):
+        with self._lock:
+            self._conn.execute("DELETE FROM ingest_lease WHERE name = 'ingest' AND owner = ?", (owner,))
+
+    def resumable_run(self, resource_id, max_age=MANDI_RESUME_MAX_AGE):
+        """The newest unfinished run of this resource started within max_age seconds, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM ingest_runs WHERE resource_id = ? ORDER BY id DESC LIMIT 1", (resource_id,)
+            ).fetchone()
+        if row is None or row["status"] == COMPLETE or time.time() - row["started_at"] > max_age:
+            return None
+        return dict(row)
+
+    def last_complete_run(self, resource_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM ingest_runs WHERE resource_id = ? AND status = ? ORDER BY id DESC LIMIT 1",
+                (resource_id, COMPLETE),
+            ).fetchone()
+        return dict(row) if row is not None else None
+
+    def start_run(self, resource_id, updated_date, total):
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO ingest_runs (resource_id, updated_date, total, status, started_at) VALUES (?, ?, ?, ?, ?)",
+                (resource_id, updated_date, total, RUNNING, time.time()),
+            )
+            return cursor.lastrowid
+
+    def resume_run(self, run_id):
+        with self._lock:
+            self._conn.execute("UPDATE ingest_runs SET status = ?, error = NULL WHERE id = ?", (RUNNING, run_id))
+
+    def save_page(self, run_id, records, next_offset):
+        """Upserts one page and advances the run's checkpoint in a single transaction. Returns rows written."""
+        now = time.time()
+        rows = []
+        for record in records:
+            arrival_date = iso_date(record.get("arrival_date"))
+            market_key = cache.normalize_text(record.get("market"))
+            commodity_key = cache.normalize_text(record.get("commodity"))
+            if not arrival_date or not market_key or not commodity_key:
+                continue
+            rows.append((
+                market_key, commodity_key, arrival_date,
+                str(record.get("variety") or ""), str(record.get("grade") or ""),
+                record.get("state"), record.get("district"), record.get("market"), record.get("commodity"),
+                _number(record.get("min_price")), _number(record.get("max_price")), _number(record.get("modal_price")),
+                now,
+            ))
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                before = self._conn.total_changes
+                self._conn.executemany(_UPSERT, rows)
+                written = self._conn.total_changes - before
+                self._conn.execute(
+                    "UPDATE ingest_runs SET next_offset = ?, upserted = upserted + ? WHERE id = ?",
+                    (next_offset, written, run_id),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        if written:
+            self._updated_checked = None
+        return written
+
+    def confirm_run(self, run_id):
+        """Records that a complete run is still current: the resource was checked and hadn't been republished."""
+        with self._lock:
+            self._conn.execute("UPDATE ingest_runs SET finished_at = ? WHERE id = ?", (time.time(), run_id))
+        self._updated_checked = None
+
+    def finish_run(self, run_id, status, error=None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE ingest_runs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, error, time.time(), run_id),
+            )
+        self._updated_checked = None
+
+    def stats(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT COUNT(*) FROM mandi_prices").fetchone()[0]
+            newest = self._conn.execute("SELECT MAX(arrival_date) FROM mandi_prices").fetchone()[0]
+            last_run = self._conn.execute("SELECT * FROM ingest_runs ORDER BY id DESC LIMIT 1").fetchone()
+        return {
+            "rows": rows,
+            "newest_arrival_date": newest,
+            "fresh": self.is_fresh(),
+            "last_run": dict(last_run) if last_run is not None else None,
+            "lookups": self.lookups,
+            "lookup_hits": self.lookup_hits,
+        }
+
+
+# --- Page sources ---
+
+def data_gov_pages(api_key, resource_id=MANDI_RESOURCE_ID, timeout=MANDI_PAGE_TIMEOUT):
+    """fetch(offset, limit) -> one data.gov.in response envelope, via the shared upstream session."""
+    from agropulse import upstream
+
+    def fetch(offset, limit):
+        url = (f"https://api.data.gov.in/resource/{resource_id}?"
+               f"api-key={api_key}&format=json&limit={limit}&offset={offset}")
+        response = upstream.get(url, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+
+    return fetch
+
+
+def fixture_pages(path):
+    """fetch(offset, limit) over a recorded data.gov.in response (see fixtures/mandi_records.json)."""
+    with open(path, encoding="utf-8") as f:
+        recorded = json.load(f)
+    records = recorded.get("records", [])
+
+    def fetch(offset, limit):
+        return dict(recorded, records=records[offset:offset + limit], offset=offset, limit=limit,
+                    count=len(records[offset:offset + limit]), total=len(records))
+
+    return fetch
+
+
+# --- Ingestion ---
+
+def ingest(store, fetch, resource_id=MANDI_RESOURCE_ID, page_limit=MANDI_PAGE_LIMIT, force=False, owner=None):
+    """Pages through the whole resource into the store, one page in memory at a time.
+
+    Skips the run when the resource's updated_date matches the last complete
+    run (unless force), marking that run as checked just now. Resumes a recent
+    failed run from its checkpoint. Returns a summary dict; raises if a page
+    fails (the checkpoint is kept), or LeaseLost if another process took over.
+    """
+    owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+    if not store.acquire_lease(owner):
+        return {"status": "skipped", "reason": "another process is ingesting"}
+    try:
+        run = store.resumable_run(resource_id)
+        offset = run["next_offset"] if run else 0
+        page = fetch(offset, page_limit)
+        updated_date = page.get("updated_date")
+
+        if run and run["updated_date"] != updated_date:
+            # The resource was republished since that run failed; its checkpoint no longer lines up.
+            store.finish_run(run["id"], FAILED, "superseded by a newer resource version")
+            run, offset = None, 0
+            page = fetch(0, page_limit)
+        if run is None and not force:
+            last = store.last_complete_run(resource_id)
+            if last and updated_date and last["updated_date"] == updated_date:
+                # data.gov.in often goes days without republishing; the store is still current.
+                store.confirm_run(last["id"])
+                return {"status": "unchanged", "updated_date": updated_date}
+
+        if run is None:
+            run_id = store.start_run(resource_id, updated_date, page.get("total"))
+        else:
+            run_id = run["id"]
+            store.resume_run(run_id)
+            log.info("Resuming mandi ingestion", extra={"run_id": run_id, "offset": offset})
+
+        upserted = 0
+        try:
+            while True:
+                if not store.acquire_lease(owner):
+                    raise LeaseLost(f"ingestion lease taken over at offset {offset}")
+                records = page.get("records") or []
+                offset += len(records)
+                upserted += store.save_page(run_id, records, offset)
+                total = page.get("total")
+                if len(records) < page_limit or (total is not None and offset >= int(total)):
+                    break
+                page = fetch(offset, page_limit)
+        except LeaseLost:
+            # The run and its checkpoint now belong to the process that took the lease.
+            log.warning("Mandi ingestion lease lost, stopping", extra={"run_id": run_id, "offset": offset})
+            raise
+        except Exception as e:
+            store.finish_run(run_id, FAILED, logs.describe_error(e))
+            log.warning("Mandi ingestion failed, will resume from checkpoint",
+                        extra={"run_id": run_id, "offset": offset, "error": str(e)})
+            raise
+        store.finish_run(run_id, COMPLETE)
+        log.info("Mandi ingestion complete", extra={"run_id": run_id, "records": offset, "upserted": upserted})
+        return {"status": COMPLETE, "run_id": run_id, "records": offset, "upserted": upserted, "updated_date": updated_date}
+    finally:
+        store.release_lease(owner)
+
+
+class IngestScheduler:
+    """Runs ingest() every MANDI_INGEST_INTERVAL seconds on a daemon thread (retrying sooner after a failure)."""
+
+    def __init__(self, store, fetch, interval=MANDI_INGEST_INTERVAL, retry_interval=MANDI_RETRY_INTERVAL, on_complete=None):
+        self.store = store
+        self.fetch = fetch
+        self.on_complete = on_complete
+        self.interval = interval
+        self.retry_interval = retry_interval
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _run(self):
+        while True:
+            try:
+                result = ingest(self.store, self.fetch)
+                if result["status"] == COMPLETE and self.on_complete is not None:
+                    self.on_complete()
+                delay = self.interval
+            except Exception:
+                delay = self.retry_interval
+            time.sleep(delay)
+
+    def start(self):
+        """Starts the thread once per process (lazily, so it survives gunicorn's fork)."""
+        with self._lock:
+            if self._thread is not None or self.interval <= 0:
+                return
+            self._thread = threading.Thread(target=self._run, name="mandi-ingest", daemon=True)
+            self._thread.start()
+
+
+if __name__ == "__main__":
+    command = sys.argv[1:2]
+    if command not in (["ingest"], ["status"]):
+        print("Usage: python -m agropulse.mandi_store ingest [--force] [--snapshot] [--fixture PATH] | status")
+        sys.exit(1)
+    from dotenv import load_dotenv
+    load_dotenv()
+    logs.configure()
+    store = MandiStore()
+    if command == ["status"]:
+        print(json.dumps(store.stats(), indent=2))
+        sys.exit(0)
+    args = sys.argv[2:]
+    if "--fixture" in args:
+        source = fixture_pages(args[args.index("--fixture") + 1])
+    else:
+        source = data_gov_pages(os.getenv("DATA_GOV_API_KEY"))
+    result = ingest(store, source, force="--force" in args)
+    if result["status"] == COMPLETE and "--snapshot" in args:
+        from agropulse import price_history
+        result["snapshot_rows"] = price_history.snapshot_mandi(price_history.PRICE_HISTORY_DIR, store)
+    print(json.dumps(result))
@@ -0,0 +1,206 @@
+"""Nearest-market lookup over a precomputed KD-tree of market coordinates.
+
+    python -m agropulse.market_geo build     # add prices.json districts and mandi markets, geocoding new ones
+
+market_locations.json lists every market with its coordinates, stored in
+KD-tree order: each slice's middle element splits the rest of the slice on
+x, y, then z of the points' unit vectors. Straight-line distance between
+unit vectors grows with great-circle distance, so the tree answers haversine
+nearest-neighbour queries exactly, with no map projection and no build step
+at startup.
+"""
+import os
+import sys
+import json
+import math
+import heapq
+import logging
+import threading
+from datetime import datetime, timezone
+from agropulse import REPO_ROOT
+from agropulse import cache
+
+
+log = logging.getLogger(__name__)
+
+MARKET_LOCATIONS_PATH = os.getenv(
+    "MARKET_LOCATIONS_PATH", os.path.join(REPO_ROOT, "market_locations.json"))
+EARTH_RADIUS_KM = 6371.0088
+LAYOUT = "kdtree-unit-xyz"
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points, in km."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _unit_vector(lat, lon):
+    lat, lon = math.radians(lat), math.radians(lon)
+    return (math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat))
+
+
+def _chord(km):
+    """Straight-line distance between two unit vectors that are `km` apart along the surface."""
+    return 2 * math.sin(min(km / EARTH_RADIUS_KM, math.pi) / 2)
+
+
+def kd_order(markets):
+    """Reorders markets into the implicit KD-tree layout MarketLocations searches."""
+    def build(items, depth):
+        if len(items) <= 1:
+            return items
+        axis = depth % 3
+        items = sorted(items, key=lambda market: _unit_vector(market["lat"], market["lon"])[axis])
+        middle = len(items) // 2
+        return build(items[:middle], depth + 1) + [items[middle]] + build(items[middle + 1:], depth + 1)
+
+    return build(list(markets), 0)
+
+
+class MarketLocations:
+    """The market coordinate file, loaded once per process."""
+
+    def __init__(self, path=MARKET_LOCATIONS_PATH):
+        self.path = path
+        self.markets = []
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            log.warning("Market locations file not found, /prices cannot look up nearby markets", extra={"path": path})
+            data = {}
+        markets = data.get("markets", [])
+        if markets and data.get("layout") != LAYOUT:
+            # A hand-edited file; still correct, it just costs a sort per process.
+            log.warning("Market locations file is not in KD-tree order, run `python -m agropulse.market_geo build`", extra={"path": path})
+            markets = kd_order(markets)
+        self.markets = markets
+        self._points = [_unit_vector(market["lat"], market["lon"]) for market in markets]
+        self._lock = threading.Lock()
+        self.queries = 0
+
+    def nearest(self, lat, lon, max_km=None):
+        """Yields (market, distance_km) closest first, out to max_km.
+
+        A best-first walk: the heap holds subtrees keyed by a lower bound on
+        their distance and points keyed by their exact distance, so each point
+        comes off the heap only once nothing left can be closer. Callers stop
+        iterating as soon as they have enough.
+        """
+        with self._lock:
+            self.queries += 1
+        query = _unit_vector(lat, lon)
+        limit = _chord(max_km) if max_km is not None else 2.0
+        points = self._points
+        heap = [(0.0, 0, 0, len(points), 0)]  # (distance bound, sequence, lo, hi, depth); hi == -1 marks a point
+        sequence = 1
+        while heap:
+            bound, _, lo, hi, depth = heapq.heappop(heap)
+            if bound > limit:
+                return
+            if hi == -1:
+                market = self.markets[lo]
+                yield market, haversine_km(lat, lon, market["lat"], market["lon"])
+                continue
+            if lo >= hi:
+                continue
+            middle = (lo + hi) // 2
+            axis = depth % 3
+            heapq.heappush(heap, (math.dist(query, points[middle]), sequence, middle, -1, depth))
+            offset = query[axis] - points[middle][axis]
+            near, far = ((lo, middle), (middle + 1, hi)) if offset < 0 else ((middle + 1, hi), (lo, middle))
+            heapq.heappush(heap, (bound, sequence + 1, near[0], near[1], depth + 1))
+            heapq.heappush(heap, (max(bound, abs(offset)), sequence + 2, far[0], far[1], depth + 1))
+            sequence += 3
+
+    def stats(self):
+        return {"markets": len(self.markets), "path": os.path.basename(self.path), "queries": self.queries}
+
+
+# --- Building the file ---
+
+def owm_geocoder(api_key):
+    """geocode(market, district, state) -> (lat, lon) or None, via OpenWeatherMap's direct geocoding."""
+    from agropulse import upstream
+
+    def geocode(market, district, state):
+        for place in dict.fromkeys((market, district)):
+            if not place:
+                continue
+            url = f"http://api.openweathermap.org/geo/1.0/direct?q={place},IN&limit=1&appid={api_key}"
+            response = upstream.get(url)
+            response.raise_for_status()
+            found = response.json()
+            if found:
+                return round(found[0]["lat"], 4), round(found[0]["lon"], 4)
+        return None
+
+    return geocode
+
+
+def candidate_markets(price_file, store=None):
+    """(state, district, market) for every prices.json district and every market in the mandi store."""
+    candidates = []
+    try:
+        with open(price_file, encoding="utf-8") as f:
+            data = json.load(f)
+        state = data.get("state")
+        candidates.extend((state, district.get("district"), district.get("district"))
+                          for district in data.get("district_prices", []))
+    except (OSError, ValueError) as e:
+        log.warning("Could not read price file", extra={"path": price_file, "error": str(e)})
+    if store is not None:
+        candidates.extend(store.markets())
+    return candidates
+
+
+def build(path, candidates, geocode):
+    """Merges candidates into the coordinate file, geocoding only markets it doesn't have yet."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            markets = json.load(f).get("markets", [])
+    except FileNotFoundError:
+        markets = []
+    known = {(cache.normalize_text(m["state"]), cache.normalize_text(m["market"])) for m in markets}
+    added, not_found = [], []
+    for state, district, market in candidates:
+        key = (cache.normalize_text(state), cache.normalize_text(market))
+        if not market or key in known:
+            continue
+        known.add(key)
+        coordinates = geocode(market, district, state)
+        if coordinates is None:
+            not_found.append(market)
+            continue
+        markets.append({"market": market, "district": district, "state": state,
+                        "lat": coordinates[0], "lon": coordinates[1]})
+        added.append(market)
+
+    data = {
+        "layout": LAYOUT,
+        "generated_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "markets": kd_order(markets),
+    }
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, path)
+    return {"markets": len(markets), "added": added, "not_found": not_found}
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["build"]:
+        print("Usage: python -m agropulse.market_geo build")
+        sys.exit(1)
+    from dotenv import load_dotenv
+    from agropulse import logs
+    from agropulse import mandi_store
+    load_dotenv()
+    logs.configure()
+    prices_path = os.path.join(REPO_ROOT, 'prices.json')
+    result = build(MARKET_LOCATIONS_PATH, candidate_markets(prices_path, mandi_store.MandiStore()),
+                   owm_geocoder(os.getenv("OPENWEATHER_API_KEY")))
+    print(json.dumps(result))
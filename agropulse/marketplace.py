@@ -0,0 +1,256 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import threading
+from agropulse import upstream
+
+
+PRODUCTS_COLLECTION = 'products'
+MARKETPLACE_DEFAULT_PAGE_SIZE = int(os.getenv("MARKETPLACE_DEFAULT_PAGE_SIZE", "50"))
+MARKETPLACE_MAX_PAGE_SIZE = int(os.getenv("MARKETPLACE_MAX_PAGE_SIZE", "200"))
+CATALOG_MAX_AGE = float(os.getenv("CATALOG_MAX_AGE", "60"))
+CATALOG_LISTENER = os.getenv("CATALOG_LISTENER", "").lower() in ("1", "true", "yes")
+
+# Firestore's Query.ASCENDING / Query.DESCENDING values, spelled out so importing
+# this module does not load the Firestore SDK.
+ASCENDING = "ASCENDING"
+DESCENDING = "DESCENDING"
+
+# Sort options for /get-items -> (field, direction). The buyer page has always
+# shown the newest-looking ids first, so that stays the default.
+SORT_ORDERS = {
+    "id_desc": ("__name__", DESCENDING),
+    "id_asc": ("__name__", ASCENDING),
+    "price_asc": ("itemPrice", ASCENDING),
+    "price_desc": ("itemPrice", DESCENDING),
+    "name_asc": ("itemNameLower", ASCENDING),
+}
+DEFAULT_SORT = "id_desc"
+# Query parameters that ask /get-items for a filtered page; any other (a cache-buster, say) still gets the snapshot.
+PAGE_PARAMS = ("category", "name", "location", "sort", "page_size", "start_after")
+
+# Lowercased copies of the searchable fields, written alongside every item so
+# case-insensitive filters can be answered by Firestore itself.
+SEARCH_FIELDS = {
+    "itemName": "itemNameLower",
+    "sellerLocation": "sellerLocationLower",
+}
+
+
+def search_fields(item):
+    """Returns the lowercased search fields for a product dict."""
+    return {
+        lower_field: str(item.get(field) or "").strip().lower()
+        for field, lower_field in SEARCH_FIELDS.items()
+    }
+
+
+def _field_filter(field, op, value):
+    from google.cloud.firestore_v1 import FieldFilter  # already loaded by the time a query is built
+    return FieldFilter(field, op, value)
+
+
+def _prefix_range(query, field, prefix):
+    """Restricts query to documents whose field starts with prefix."""
+    return (query
+            .where(filter=_field_filter(field, ">=", prefix))
+            .where(filter=_field_filter(field, "<", prefix + "\uf8ff")))
+
+
+def build_products_query(db, category=None, name_prefix=None, location_prefix=None,
+                         sort=DEFAULT_SORT, page_size=MARKETPLACE_DEFAULT_PAGE_SIZE, start_after=None):
+    """Builds the Firestore query behind /get-items.
+
+    Name and location are prefix matches on the lowercased search fields. Firestore
+    requires range-filtered fields to be ordered first, so when either prefix is
+    given the results are ordered by those fields and `sort` only breaks ties.
+    Fetches one extra document so the caller can tell whether another page exists.
+    """
+    query = db.collection(PRODUCTS_COLLECTION)
+    if category:
+        query = query.where(filter=_field_filter("category", "==", category.strip().lower()))
+
+    range_fields = []
+    if name_prefix:
+        query = _prefix_range(query, "itemNameLower", name_prefix.strip().lower())
+        range_fields.append("itemNameLower")
+    if location_prefix:
+        query = _prefix_range(query, "sellerLocationLower", location_prefix.strip().lower())
+        range_fields.append("sellerLocationLower")
+
+    for field in range_fields:
+        query = query.order_by(field)
+    sort_field, direction = SORT_ORDERS[sort]
+    if sort_field not in range_fields:
+        query = query.order_by(sort_field, direction=direction)
+
+    if start_after is not None:
+        query = query.start_after(start_after)
+    return query.limit(page_size + 1)
+
+
+def fetch_products_page(db, page_size=MARKETPLACE_DEFAULT_PAGE_SIZE, start_after_id=None, **filters):
+    """Runs a /get-items query and returns (products, next_cursor).
+
+    Raises KeyError if start_after_id does not name an existing product.
+    """
+    cursor = None
+    if start_after_id:
+        with upstream.tracked("firestore"):
+            cursor = db.collection(PRODUCTS_COLLECTION).document(start_after_id).get()
+        if not cursor.exists:
+            raise KeyError(start_after_id)
+
+    query = build_products_query(db, page_size=page_size, start_after=cursor, **filters)
+    products = []
+    with upstream.tracked("firestore"):
+        for doc in query.stream():
+            product_data = doc.to_dict()
+            product_data['id'] = doc.id
+            products.append(product_data)
+
+    next_cursor = None
+    if len(products) > page_size:
+        products = products[:page_size]
+        next_cursor = products[-1]['id']
+    return products, next_cursor
+
+
+def backfill_search_fields(db):
+    """Adds the lowercased search fields to products written before they existed."""
+    updated = 0
+    for doc in db.collection(PRODUCTS_COLLECTION).stream():
+        data = doc.to_dict()
+        fields = search_fields(data)
+        if any(data.get(field) != value for field, value in fields.items()):
+            doc.reference.update(fields)
+            updated += 1
+    return updated
+
+
+class CatalogCache:
+    """In-process snapshot of the products collection behind the unfiltered /get-items.
+
+    The snapshot is serialized once per change and tagged with a content hash,
+    so every worker holding the same products hands out the same ETag. Writes
+    made through /add-item are applied in place. Without a Firestore listener
+    the snapshot is re-read after CATALOG_MAX_AGE seconds, which bounds how
+    stale a worker can be when other workers write.
+    """
+
+    def __init__(self, db, max_age=CATALOG_MAX_AGE):
+        self.db = db
+        self.max_age = max_age
+        self._products = None
+        self._body = None
+        self.etag = None
+        self.loaded_at = None
+        self._lock = threading.Lock()
+        # Held while re-reading Firestore, so a stale snapshot is reloaded by one request, not all of them.
+        self._reload_lock = threading.Lock()
+        self._watch = None
+        self._subscribers = []
+        # Guards the counters, which threaded and gevent workers update concurrently.
+        self._counter_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def _count(self, counter):
+        with self._counter_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def count_not_modified(self):
+        """Records a /get-items request answered with 304."""
+        self._count("not_modified")
+
+    def _rebuild(self):
+        """Re-serializes the snapshot. Caller must hold self._lock."""
+        products = [dict(self._products[doc_id], id=doc_id) for doc_id in sorted(self._products)]
+        self._body = json.dumps(products, ensure_ascii=False, sort_keys=True).encode("utf-8")
+        self.etag = hashlib.sha1(self._body).hexdigest()
+
+    def subscribe(self, subscriber):
+        """Registers an object with replace(products) and add(doc_id, data) to mirror the snapshot."""
+        self._subscribers.append(subscriber)
+        if self._products is not None:
+            subscriber.replace(dict(self._products))
+
+    def _replace(self, docs):
+        with self._lock:
+            self._products = {doc.id: doc.to_dict() for doc in docs}
+            self.loaded_at = time.time()
+            self._rebuild()
+            products = dict(self._products)
+        for subscriber in self._subscribers:
+            subscriber.replace(products)
+
+    def _is_fresh(self):
+        if self._products is None:
+            return False
+        return self._watch is not None or time.time() - self.loaded_at < self.max_age
+
+    def get(self):
+        """Returns (json_body_bytes, etag), reading Firestore only when the snapshot is missing or stale."""
+        if self._is_fresh():
+            self._count("hits")
+        else:
+            with self._reload_lock:
+                if self._is_fresh():
+                    # Reloaded by another request while this one waited.
+                    self._count("hits")
+                else:
+                    self._count("misses")
+                    with upstream.tracked("firestore"):
+                        self._replace(self.db.collection(PRODUCTS_COLLECTION).stream())
+        with self._lock:
+            return self._body, self.etag
+
+    def add(self, doc_id, data):
+        """Applies a write made by this worker without re-reading the collection."""
+        with self._lock:
+            if self._products is None:
+                return
+            self._products[doc_id] = dict(data)
+            self._rebuild()
+        for subscriber in self._subscribers:
+            subscriber.add(doc_id, data)
+
+    def start_listener(self):
+        """Keeps the snapshot in sync with writes from every worker via on_snapshot."""
+        def on_change(docs, changes, read_time):
+            self._replace(docs)
+
+        self._watch = self.db.collection(PRODUCTS_COLLECTION).on_snapshot(on_change)
+
+    def stats(self):
+        with self._counter_lock:
+            hits, misses, not_modified = self.hits, self.misses, self.not_modified
+        requests_served = hits + misses
+        return {
+            "size": len(self._products) if self._products is not None else 0,
+            "age_seconds": round(time.time() - self.loaded_at, 3) if self.loaded_at else None,
+            "listener": self._watch is not None,
+            "hits": hits,
+            "misses": misses,
+            "not_modified": not_modified,
+            "hit_rate": round(hits / requests_served, 3) if requests_served else 0.0,
+        }
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["backfill"]:
+        print("Usage: python -m agropulse.marketplace backfill")
+        sys.exit(1)
+    from dotenv import load_dotenv
+    from agropulse import clients
+    from agropulse import logs
+    load_dotenv()
+    logs.configure()
+    db = clients.firestore_db.get_or_none()
+    if not db:
+        print("ERROR: Database not initialized.")
+        sys.exit(1)
+    print(f"Backfilled search fields on {backfill_search_fields(db)} products.")
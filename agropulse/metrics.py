@@ -0,0 +1,136 @@
+import os
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest
+
+
+# Under gunicorn, point this at an empty directory (shared by every worker) so
+# one scrape of /metrics sums all workers instead of whichever one answered.
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 45, 90)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+REQUEST_LATENCY = Histogram(
+    "agropulse_http_request_duration_seconds", "Time to build each response, by route.",
+    ["route", "method", "status"], buckets=LATENCY_BUCKETS,
+)
+RESPONSE_BYTES = Histogram(
+    "agropulse_http_response_bytes", "Response body size, by route (streamed responses excluded).",
+    ["route"], buckets=SIZE_BUCKETS,
+)
+UPSTREAM_LATENCY = Histogram(
+    "agropulse_upstream_request_duration_seconds", "Latency of calls to each upstream, errors included.",
+    ["upstream"], buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_ERRORS = Counter(
+    "agropulse_upstream_errors_total", "Failed upstream calls, by exception type or http_<status>.",
+    ["upstream", "kind"],
+)
+UPSTREAM_REQUEST_BYTES = Histogram(
+    "agropulse_upstream_request_bytes", "Size of request bodies sent to each upstream.",
+    ["upstream"], buckets=SIZE_BUCKETS,
+)
+UPSTREAM_RESPONSE_BYTES = Histogram(
+    "agropulse_upstream_response_bytes", "Size of response bodies received from each upstream.",
+    ["upstream"], buckets=SIZE_BUCKETS,
+)
+PREDICT_IMAGE_BYTES = Histogram(
+    "agropulse_predict_image_bytes", "Size of /predict uploads as received (original) and as sent to Gemini (prepared).",
+    ["stage"], buckets=SIZE_BUCKETS,
+)
+RESPONSE_SOURCE = Counter(
+    "agropulse_response_source_total", "Where a route's answer came from (local data, an upstream, a cache or a fallback).",
+    ["route", "source"],
+)
+
+# Outbound URLs -> upstream label, matched on the path so the names survive
+# UPSTREAM_BASE_URL_OVERRIDE. First match wins.
+_UPSTREAM_PATHS = (
+    (":streamGenerateContent", "gemini_stream"),
+    (":generateContent", "gemini"),
+    ("/geo/1.0/", "owm_geo"),
+    ("/onecall/timemachine", "owm_timemachine"),
+    ("/onecall", "owm_onecall"),
+    ("/air_pollution", "owm_air"),
+    ("/resource/", "data_gov"),
+    ("/v2/everything", "newsapi"),
+)
+
+
+def upstream_name(url):
+    """The upstream label for an outbound URL ('other' for anything unrecognized, to keep label values bounded)."""
+    path = urlsplit(url).path
+    for fragment, name in _UPSTREAM_PATHS:
+        if fragment in path:
+            return name
+    return "other"
+
+
+def observe_upstream(name, seconds, status=None, error=None, request_bytes=None, response_bytes=None):
+    """Records one finished upstream call. `error` is an exception type name; statuses >= 400 count as errors too."""
+    UPSTREAM_LATENCY.labels(name).observe(seconds)
+    if error is None and status is not None and status >= 400:
+        error = f"http_{status}"
+    if error is not None:
+        UPSTREAM_ERRORS.labels(name, error).inc()
+    if request_bytes is not None:
+        UPSTREAM_REQUEST_BYTES.labels(name).observe(request_bytes)
+    if response_bytes is not None:
+        UPSTREAM_RESPONSE_BYTES.labels(name).observe(response_bytes)
+
+
+@contextmanager
+def track_upstream(name, request_bytes=None):
+    """Times a call to an upstream that has its own client (CSE, Cloudinary, Firestore); exceptions count as errors."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        observe_upstream(name, time.perf_counter() - started, error=type(e).__name__, request_bytes=request_bytes)
+        raise
+    observe_upstream(name, time.perf_counter() - started, request_bytes=request_bytes)
+
+
+def observe_predict_image(bytes_in, bytes_out):
+    """Records one /predict upload's size before and after image_prep shrank it."""
+    PREDICT_IMAGE_BYTES.labels("original").observe(bytes_in)
+    PREDICT_IMAGE_BYTES.labels("prepared").observe(bytes_out)
+
+
+def record_source(route, source):
+    """Counts which source answered a request, e.g. how often /prices falls back to Gemini."""
+    RESPONSE_SOURCE.labels(route, source).inc()
+
+
+def init_app(app):
+    """Times every request and records its response size, labelled by route rule rather than raw path."""
+    from flask import g, request
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _observe(response):
+        started = g.pop("metrics_started", None)
+        if started is None:
+            return response
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        # Streamed (SSE) responses are timed up to their headers; their size is unknown here.
+        REQUEST_LATENCY.labels(route, request.method, str(response.status_code)).observe(time.perf_counter() - started)
+        size = response.calculate_content_length()
+        if size is not None:
+            RESPONSE_BYTES.labels(route).observe(size)
+        return response
+
+
+def render():
+    """Returns (body, content_type) in the Prometheus text format."""
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,148 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from email.utils import formatdate
+from agropulse import logs
+
+
+log = logging.getLogger(__name__)
+
+NEWS_REFRESH_INTERVAL = int(os.getenv("NEWS_REFRESH_INTERVAL", "1800"))
+NEWS_CACHE_PATH = os.getenv("NEWS_CACHE_PATH", "agropulse_news.json")
+NEWS_RETRY_INTERVAL = int(os.getenv("NEWS_RETRY_INTERVAL", "120"))
+
+
+class NewsFeed:
+    """Last good /agri-news payload, refreshed in the background and mirrored to disk.
+
+    Requests are always answered from the in-memory body. A daemon thread calls
+    fetch() every NEWS_REFRESH_INTERVAL seconds; if it fails (NewsAPI down or
+    rate-limited) the previous payload keeps being served and the refresh is
+    retried after NEWS_RETRY_INTERVAL. The snapshot file is shared by every
+    worker: one that finds a recent enough snapshot on disk loads it instead of
+    calling NewsAPI itself, so the API sees about one call per interval in
+    total rather than one per worker.
+    """
+
+    def __init__(self, fetch, path=NEWS_CACHE_PATH, interval=NEWS_REFRESH_INTERVAL, retry_interval=NEWS_RETRY_INTERVAL):
+        self.fetch = fetch
+        self.path = path
+        self.interval = interval
+        self.retry_interval = retry_interval
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._thread = None
+        self._body = None
+        self.etag = None
+        self.last_modified = None
+        self.fetched_at = None
+        self.last_error = None
+        self.refreshes = 0
+        self.failures = 0
+        self.served = 0
+        self._load_from_disk()
+
+    def _set(self, articles, fetched_at, last_modified=None):
+        body = json.dumps({"articles": articles}, ensure_ascii=False).encode("utf-8")
+        etag = hashlib.sha1(body).hexdigest()
+        with self._lock:
+            if etag != self.etag:
+                self._body = body
+                self.etag = etag
+                self.last_modified = last_modified or fetched_at
+            self.fetched_at = fetched_at
+
+    def _load_from_disk(self):
+        """Adopts the on-disk snapshot if it is newer than ours. Returns True if it was."""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if self.fetched_at is not None and snapshot["fetched_at"] <= self.fetched_at:
+            return False
+        self._set(snapshot["articles"], snapshot["fetched_at"], snapshot.get("last_modified"))
+        return True
+
+    def _save_to_disk(self, articles):
+        snapshot = {"articles": articles, "fetched_at": self.fetched_at, "last_modified": self.last_modified}
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            log.warning("Could not write news snapshot", extra={"path": self.path, "error": str(e)})
+
+    def refresh(self, force=False):
+        """Fetches a new payload unless another worker's snapshot on disk is still fresh. Returns True on success."""
+        with self._refresh_lock:
+            if not force:
+                self._load_from_disk()
+                if self.fetched_at is not None and time.time() - self.fetched_at < self.interval:
+                    return True
+            try:
+                articles = self.fetch()
+            except Exception as e:
+                with self._lock:
+                    self.failures += 1
+                    self.last_error = logs.describe_error(e)
+                log.warning("News refresh failed, serving the previous feed", extra={"error": str(e)})
+                return False
+            self._set(articles, time.time())
+            with self._lock:
+                self.refreshes += 1
+                self.last_error = None
+            self._save_to_disk(articles)
+            return True
+
+    def _run(self):
+        while True:
+            age = time.time() - self.fetched_at if self.fetched_at else self.interval
+            if age >= self.interval:
+                ok = self.refresh()
+                delay = self.interval if ok else self.retry_interval
+            else:
+                delay = self.interval - age
+            time.sleep(max(delay, 1))
+
+    def start(self):
+        """Starts the refresher thread once per process (lazily, so it survives gunicorn's fork)."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="news-refresher", daemon=True)
+            self._thread.start()
+
+    def get(self):
+        """Returns (body_bytes, etag, last_modified_timestamp), or (None, None, None) if nothing was ever fetched."""
+        self.start()
+        if self._body is None:
+            # Cold start with no snapshot on disk: this one request waits for the first fetch.
+            self.refresh()
+        with self._lock:
+            self.served += 1
+            return self._body, self.etag, self.last_modified
+
+    def is_stale(self):
+        """True if the last refresh failed or the feed is older than one missed interval."""
+        if self.last_error is not None or self.fetched_at is None:
+            return True
+        return time.time() - self.fetched_at > self.interval + self.retry_interval
+
+    def stats(self):
+        with self._lock:
+            return {
+                "articles_cached": self._body is not None,
+                "age_seconds": round(time.time() - self.fetched_at, 3) if self.fetched_at else None,
+                "last_modified": formatdate(self.last_modified, usegmt=True) if self.last_modified else None,
+                "refresh_interval": self.interval,
+                "refreshes": self.refreshes,
+                "failures": self.failures,
+                "last_error": self.last_error,
+                "served": self.served,
+                "stale": self.is_stale(),
+            }
@@ -0,0 +1,440 @@
+"""Columnar price history and the vectorized analytics behind the /prices/* analytics routes.
+
+    python -m agropulse.price_history snapshot     # persist prices.json and the mandi store (cron-friendly)
+
+Every snapshot is one compressed NumPy partition per (date, source) in
+PRICE_HISTORY_DIR, holding parallel state / market / commodity / price_per_kg
+columns. On load the partitions are pivoted into a (market x commodity) by
+day matrix, so every query is a handful of array operations over all pairs
+at once rather than a loop over the nested district_prices lists.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import threading
+import numpy as np
+from agropulse import REPO_ROOT
+from agropulse import cache
+
+
+log = logging.getLogger(__name__)
+
+PRICE_HISTORY_DIR = os.getenv("PRICE_HISTORY_DIR", "price_history")
+PRICE_HISTORY_RELOAD_INTERVAL = float(os.getenv("PRICE_HISTORY_RELOAD_INTERVAL", "30"))
+# Only the most recent days are pivoted, which bounds memory at pairs x days floats.
+PRICE_HISTORY_DAYS = int(os.getenv("PRICE_HISTORY_DAYS", "400"))
+# A market's last price stands in for the following days up to this age, then it counts as missing.
+PRICE_HISTORY_MAX_AGE_DAYS = int(os.getenv("PRICE_HISTORY_MAX_AGE_DAYS", "7"))
+
+DEFAULT_PERCENTILES = (10, 25, 50, 75, 90)
+QUINTAL_KG = 100
+
+
+class NoPriceHistory(LookupError):
+    """Nothing is recorded for the requested commodity, market, state or date."""
+
+
+def commodity_key(name):
+    """'Tomato (தக்காளி)', 'tomato' and 'Paddy(Dhan)(Common)' -> 'tomato', 'tomato', 'paddy'."""
+    return cache.normalize_text(str(name or "").split("(", 1)[0])
+
+
+def _day(date_str):
+    """'yyyy-mm-dd' -> days since the epoch. Raises ValueError for anything else."""
+    return int(np.datetime64(date_str, "D").astype(np.int64))
+
+
+def _date(day):
+    return str(np.datetime64(int(day), "D"))
+
+
+# --- Partitions ---
+
+def partition_path(directory, date, source):
+    return os.path.join(directory, f"{date}.{source}.npz")
+
+
+def _partition_mtime(directory, date, source):
+    try:
+        return os.path.getmtime(partition_path(directory, date, source))
+    except OSError:
+        return None
+
+
+def write_partition(directory, date, source, rows):
+    """Atomically replaces the (date, source) partition with rows of (state, market, commodity_name, price_per_kg)."""
+    os.makedirs(directory, exist_ok=True)
+    states, markets, names, prices = zip(*rows) if rows else ((), (), (), ())
+    tmp_path = f"{partition_path(directory, date, source)}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez_compressed(
+            f,
+            date=np.array(date),
+            state=np.array(states, dtype=str),
+            market=np.array(markets, dtype=str),
+            commodity=np.array(names, dtype=str),
+            price_per_kg=np.array(prices, dtype=np.float64),
+        )
+    os.replace(tmp_path, partition_path(directory, date, source))
+    return len(rows)
+
+
+def snapshot_price_file(directory, path):
+    """Persists prices.json as its date's 'prices-json' partition, unless that partition is already newer than the file."""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    date = data.get("date")
+    if not date:
+        return 0
+    written_at = _partition_mtime(directory, date, "prices-json")
+    if written_at is not None and written_at >= os.path.getmtime(path):
+        return 0
+    state = data.get("state") or ""
+    rows = [
+        (state, district.get("district") or "", entry.get("name") or "", float(entry["price_per_kg"]))
+        for district in data.get("district_prices", [])
+        for entry in district.get("vegetables", [])
+        if isinstance(entry.get("price_per_kg"), (int, float))
+    ]
+    return write_partition(directory, date, "prices-json", rows)
+
+
+def snapshot_mandi(directory, store):
+    """Persists each arrival date in the mandi store as a 'mandi' partition (per-quintal prices become per-kg).
+
+    Dates whose rows have not changed since their partition was written are skipped.
+    """
+    written = 0
+    for arrival_date, last_ingested_at in store.arrival_dates():
+        written_at = _partition_mtime(directory, arrival_date, "mandi")
+        if written_at is not None and written_at >= last_ingested_at:
+            continue
+        rows = [
+            (state or "", market or "", commodity or "", modal_price / QUINTAL_KG)
+            for state, market, commodity, modal_price in store.rows_for_date(arrival_date)
+            if modal_price is not None
+        ]
+        written += write_partition(directory, arrival_date, "mandi", rows)
+    return written
+
+
+# --- Pivot ---
+
+class _View:
+    """One immutable load of the store: name tables, per-pair attributes and the pairs x days matrices."""
+
+    def __init__(self, columns):
+        day, states, markets, names, prices = columns
+        self.rows = len(prices)
+        # Names are normalized once per distinct value, then mapped back onto the rows.
+        distinct_markets, market_name_idx = np.unique(markets, return_inverse=True)
+        market_keys = np.array([cache.normalize_text(name) for name in distinct_markets], dtype=str)[market_name_idx]
+        distinct_names, name_idx = np.unique(names, return_inverse=True)
+        row_commodity_keys = np.array([commodity_key(name) for name in distinct_names], dtype=str)[name_idx]
+
+        self.market_keys, market_first, market_idx = np.unique(market_keys, return_index=True, return_inverse=True)
+        self.market_names = markets[market_first]
+        self.commodity_keys, commodity_first, commodity_idx = np.unique(
+            row_commodity_keys, return_index=True, return_inverse=True)
+        self.commodity_names = np.array([name.split("(", 1)[0].strip() for name in names[commodity_first]], dtype=str)
+        self.state_names, state_idx = np.unique(states, return_inverse=True)
+        self.state_keys = np.array([cache.normalize_text(name) for name in self.state_names], dtype=str)
+
+        pair_codes, pair_idx = np.unique(market_idx * len(self.commodity_keys) + commodity_idx, return_inverse=True)
+        self.pair_market = pair_codes // len(self.commodity_keys)
+        self.pair_commodity = pair_codes % len(self.commodity_keys)
+        self.pair_state = np.zeros(len(pair_codes), dtype=np.int64)
+        self.pair_state[pair_idx] = state_idx
+
+        self.first_day = int(day.min())
+        self.days = int(day.max()) - self.first_day + 1
+        pairs = len(pair_codes)
+        flat = pair_idx * self.days + (day - self.first_day)
+        # Several sources on the same day and pair are averaged.
+        sums = np.bincount(flat, weights=prices, minlength=pairs * self.days)
+        counts = np.bincount(flat, minlength=pairs * self.days)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.raw = np.where(counts > 0, sums / counts, np.nan).reshape(pairs, self.days)
+
+        # Forward fill: for each cell, the column of the last observed price at or before it.
+        observed = np.where(~np.isnan(self.raw), np.arange(self.days), -1)
+        self.last_seen = np.maximum.accumulate(observed, axis=1)
+        self.filled = np.take_along_axis(self.raw, np.maximum(self.last_seen, 0), axis=1)
+        self.filled[self.last_seen < 0] = np.nan
+
+    def day_index(self, date_str, rows):
+        """Column for a date, or the latest column with a real observation among `rows` when date_str is empty."""
+        if date_str:
+            try:
+                index = _day(date_str) - self.first_day
+            except ValueError:
+                raise ValueError("date must be yyyy-mm-dd")
+            if not 0 <= index < self.days:
+                raise NoPriceHistory(f"no prices recorded on {date_str}")
+            return index
+        observed_days = np.flatnonzero(~np.isnan(self.raw[rows]).all(axis=0))
+        return int(observed_days[-1])
+
+    def as_of(self, rows, index):
+        """(prices, observed_day_columns) for `rows` as of column `index`, NaN where older than the max age."""
+        if index < 0:
+            return np.full(len(rows), np.nan), np.full(len(rows), -1)
+        prices = self.filled[rows, index].copy()
+        seen = self.last_seen[rows, index]
+        prices[(seen < 0) | (index - seen > PRICE_HISTORY_MAX_AGE_DAYS)] = np.nan
+        return prices, seen
+
+    def commodity(self, name):
+        position = np.searchsorted(self.commodity_keys, commodity_key(name))
+        if position >= len(self.commodity_keys) or self.commodity_keys[position] != commodity_key(name):
+            raise NoPriceHistory(f"no price history for commodity '{name}'")
+        return position
+
+    def market(self, name):
+        key = cache.normalize_text(name)
+        position = np.searchsorted(self.market_keys, key)
+        if position >= len(self.market_keys) or self.market_keys[position] != key:
+            raise NoPriceHistory(f"no price history for market '{name}'")
+        return position
+
+    def pair_rows(self, commodity=None, market=None, state=None):
+        mask = np.ones(len(self.pair_market), dtype=bool)
+        if commodity:
+            mask &= self.pair_commodity == self.commodity(commodity)
+        if market:
+            mask &= self.pair_market == self.market(market)
+        if state:
+            mask &= self.state_keys[self.pair_state] == cache.normalize_text(state)
+        rows = np.flatnonzero(mask)
+        if len(rows) == 0:
+            raise NoPriceHistory("no price history matches those filters")
+        return rows
+
+    def describe(self, rows):
+        return self.market_names[self.pair_market[rows]], self.commodity_names[self.pair_commodity[rows]], \
+            self.state_names[self.pair_state[rows]]
+
+
+def _rolling_mean(matrix, window):
+    """NaN-aware trailing mean over the last `window` columns of every row, via cumulative sums."""
+    values = np.nan_to_num(matrix)
+    present = (~np.isnan(matrix)).astype(np.int64)
+    sums = np.cumsum(values, axis=1)
+    counts = np.cumsum(present, axis=1)
+    sums[:, window:] = sums[:, window:] - sums[:, :-window]
+    counts[:, window:] = counts[:, window:] - counts[:, :-window]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+def _value(x, digits=2):
+    return None if x is None or np.isnan(x) else round(float(x), digits)
+
+
+class PriceHistory:
+    """The partition directory, loaded lazily and re-pivoted when partitions change on disk.
+
+    If price_file is given, its current snapshot is persisted on load and
+    whenever it changes, so prices.json edits land in the history by themselves.
+    """
+
+    def __init__(self, directory=PRICE_HISTORY_DIR, price_file=None, reload_interval=PRICE_HISTORY_RELOAD_INTERVAL):
+        self.directory = directory
+        self.price_file = price_file
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._view = None
+        self._signature = None
+        self._checked_at = 0.0
+        self.loads = 0
+        self.load_seconds = None
+
+    def _partitions(self):
+        try:
+            names = sorted(name for name in os.listdir(self.directory) if name.endswith(".npz"))
+        except FileNotFoundError:
+            return []
+        return [(name, os.path.getmtime(os.path.join(self.directory, name))) for name in names]
+
+    def _read(self, partitions):
+        """Concatenates the newest PRICE_HISTORY_DAYS of partitions into flat columns."""
+        dates = sorted({name.split(".", 1)[0] for name, _ in partitions})
+        keep = set(dates[-PRICE_HISTORY_DAYS:])
+        days, states, markets, names, prices = [], [], [], [], []
+        for name, _ in partitions:
+            if name.split(".", 1)[0] not in keep:
+                continue
+            with np.load(os.path.join(self.directory, name), allow_pickle=False) as part:
+                count = len(part["price_per_kg"])
+                days.append(np.full(count, _day(str(part["date"])), dtype=np.int64))
+                states.append(part["state"])
+                markets.append(part["market"])
+                names.append(part["commodity"])
+                prices.append(part["price_per_kg"])
+        if not days or not sum(len(d) for d in days):
+            return None
+        return (np.concatenate(days), np.concatenate(states), np.concatenate(markets), np.concatenate(names),
+                np.concatenate(prices))
+
+    def view(self):
+        """The current pivot, rebuilt at most every reload_interval seconds if partitions changed. Raises NoPriceHistory when empty."""
+        now = time.monotonic()
+        if self._view is None or now - self._checked_at >= self.reload_interval:
+            with self._lock:
+                if self._view is None or now - self._checked_at >= self.reload_interval:
+                    self._checked_at = now
+                    if self.price_file:
+                        try:
+                            snapshot_price_file(self.directory, self.price_file)
+                        except (OSError, ValueError) as e:
+                            log.warning("Could not snapshot price file", extra={"path": self.price_file, "error": str(e)})
+                    partitions = self._partitions()
+                    if partitions != self._signature:
+                        started = time.perf_counter()
+                        columns = self._read(partitions)
+                        self._view = _View(columns) if columns is not None else None
+                        self._signature = partitions
+                        self.loads += 1
+                        self.load_seconds = time.perf_counter() - started
+        if self._view is None:
+            raise NoPriceHistory("no price history has been recorded yet")
+        return self._view
+
+    def record_mandi(self, store):
+        """Snapshots the mandi store and makes the next query pick the new partitions up."""
+        written = snapshot_mandi(self.directory, store)
+        if written:
+            self._checked_at = 0.0
+        return written
+
+    # --- Analytics ---
+
+    def extremes(self, commodity, date=None, n=5):
+        """The n cheapest and n most expensive markets for a commodity on a date (latest by default)."""
+        view = self.view()
+        rows = view.pair_rows(commodity=commodity)
+        index = view.day_index(date, rows)
+        prices, seen = view.as_of(rows, index)
+        valid = np.flatnonzero(~np.isnan(prices))
+        order = valid[np.argsort(prices[valid], kind="stable")]
+        markets, _, states = view.describe(rows)
+
+        def entries(positions):
+            return [{
+                "market": str(markets[i]),
+                "state": str(states[i]),
+                "price_per_kg": _value(prices[i]),
+                "as_of": _date(view.first_day + seen[i]),
+            } for i in positions]
+
+        return {
+            "commodity": str(view.commodity_names[view.commodity(commodity)]),
+            "date": _date(view.first_day + index),
+            "markets": int(len(valid)),
+            "cheapest": entries(order[:n]),
+            "most_expensive": entries(order[::-1][:n]),
+        }
+
+    def moving_average(self, commodity, market=None, window=7, days=30, date=None):
+        """Daily price and trailing `window`-day mean for one market, or the mean across all markets."""
+        view = self.view()
+        rows = view.pair_rows(commodity=commodity, market=market)
+        index = view.day_index(date, rows)
+        observed = view.raw[rows]
+        # Across markets: the per-day mean of whichever markets reported that day.
+        present = (~np.isnan(observed)).sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            series = np.where(present > 0, np.nansum(observed, axis=0) / present, np.nan)
+        averages = _rolling_mean(series[np.newaxis, :], window)[0]
+        start = max(index - days + 1, 0)
+        return {
+            "commodity": str(view.commodity_names[view.commodity(commodity)]),
+            "market": str(view.market_names[view.market(market)]) if market else None,
+            "window_days": window,
+            "series": [{
+                "date": _date(view.first_day + column),
+                "price_per_kg": _value(series[column]),
+                "moving_average": _value(averages[column]),
+            } for column in range(start, index + 1)],
+        }
+
+    def week_over_week(self, commodity=None, market=None, state=None, date=None, limit=50):
+        """Price change against seven days earlier for every matching pair, biggest rises first."""
+        view = self.view()
+        rows = view.pair_rows(commodity=commodity, market=market, state=state)
+        index = view.day_index(date, rows)
+        now, _ = view.as_of(rows, index)
+        before, _ = view.as_of(rows, index - 7)
+        change = now - before
+        with np.errstate(invalid="ignore", divide="ignore"):
+            change_pct = change / before * 100
+        valid = np.flatnonzero(~np.isnan(change_pct))
+        order = valid[np.argsort(-change_pct[valid], kind="stable")]
+        markets, commodities, states = view.describe(rows)
+        return {
+            "date": _date(view.first_day + index),
+            "compared_to": _date(view.first_day + index - 7),
+            "pairs": int(len(valid)),
+            "changes": [{
+                "market": str(markets[i]),
+                "commodity": str(commodities[i]),
+                "state": str(states[i]),
+                "price_per_kg": _value(now[i]),
+                "week_ago_price_per_kg": _value(before[i]),
+                "change": _value(change[i]),
+                "change_pct": _value(change_pct[i]),
+            } for i in order[:limit]],
+        }
+
+    def percentiles(self, commodity, state=None, date=None, q=DEFAULT_PERCENTILES):
+        """Distribution of a commodity's price across all markets (of one state, if given) on a date."""
+        view = self.view()
+        rows = view.pair_rows(commodity=commodity, state=state)
+        index = view.day_index(date, rows)
+        prices, _ = view.as_of(rows, index)
+        prices = prices[~np.isnan(prices)]
+        if len(prices) == 0:
+            raise NoPriceHistory("no current prices for that commodity")
+        return {
+            "commodity": str(view.commodity_names[view.commodity(commodity)]),
+            "state": state or None,
+            "date": _date(view.first_day + index),
+            "markets": int(len(prices)),
+            "min": _value(prices.min()),
+            "mean": _value(prices.mean()),
+            "max": _value(prices.max()),
+            "percentiles": {f"{p:g}": _value(v) for p, v in zip(q, np.percentile(prices, q))},
+        }
+
+    def stats(self):
+        view = self._view
+        return {
+            "partitions": len(self._signature or []),
+            "rows": view.rows if view else 0,
+            "markets": len(view.market_keys) if view else 0,
+            "commodities": len(view.commodity_keys) if view else 0,
+            "pairs": len(view.pair_market) if view else 0,
+            "first_date": _date(view.first_day) if view else None,
+            "last_date": _date(view.first_day + view.days - 1) if view else None,
+            "loads": self.loads,
+            "load_ms": round(self.load_seconds * 1000, 1) if self.load_seconds is not None else None,
+        }
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["snapshot"]:
+        print("Usage: python -m agropulse.price_history snapshot")
+        sys.exit(1)
+    from dotenv import load_dotenv
+    from agropulse import logs
+    from agropulse import mandi_store
+    load_dotenv()
+    logs.configure()
+    prices_path = os.path.join(REPO_ROOT, 'prices.json')
+    result = {
+        "prices_json_rows": snapshot_price_file(PRICE_HISTORY_DIR, prices_path),
+        "mandi_rows": snapshot_mandi(PRICE_HISTORY_DIR, mandi_store.MandiStore()),
+    }
+    print(f"Price history snapshot: {result}")
@@ -0,0 +1,136 @@
+import os
+import re
+import json
+import time
+import difflib
+import logging
+import threading
+
+
+log = logging.getLogger(__name__)
+
+PRICE_INDEX_RELOAD_INTERVAL = float(os.getenv("PRICE_INDEX_RELOAD_INTERVAL", "2"))
+PRICE_INDEX_FUZZY_CUTOFF = float(os.getenv("PRICE_INDEX_FUZZY_CUTOFF", "0.8"))
+
+
+def _normalize(value):
+    return re.sub(r"\s+", " ", str(value or "")).strip().lower()
+
+
+def vegetable_keys(name):
+    """Returns every lookup key for a bilingual name like 'Banana (Raw) (வாழைக்காய்)'.
+
+    The English base name, the base plus any English qualifiers ('banana raw'),
+    each Tamil name, and the full normalized string all point at the same entry.
+    """
+    full = _normalize(name)
+    base = _normalize(name.split("(", 1)[0])
+    keys = {full, base}
+    qualifiers = []
+    for group in re.findall(r"\(([^)]*)\)", name):
+        group = _normalize(group)
+        if not group:
+            continue
+        if group.isascii():
+            qualifiers.append(group)
+        else:
+            keys.add(group)
+    if qualifiers:
+        keys.add(" ".join([base] + qualifiers))
+        keys.add(" ".join(qualifiers + [base]))
+    keys.discard("")
+    return keys
+
+
+class PriceIndex:
+    """district -> vegetable key -> [entries] over prices.json, built on first lookup and reloaded when the file changes."""
+
+    def __init__(self, path):
+        self.path = path
+        self.data = None
+        self.mtime = None
+        self.districts = {}
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._loaded = False
+
+    def _ensure_loaded(self):
+        """Builds the index on first use; concurrent first lookups wait for it rather than seeing it empty."""
+        if self._loaded:
+            return
+        with self._load_lock:
+            if not self._loaded:
+                self.reload()
+                self._checked_at = time.monotonic()
+                self._loaded = True
+
+    def reload(self):
+        """(Re)builds the index from disk. A bad file keeps the previous index in place."""
+        try:
+            mtime = os.path.getmtime(self.path)
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            log.warning("Price file not found, /prices will have reduced functionality", extra={"path": self.path})
+            return False
+        except json.JSONDecodeError:
+            log.error("Could not decode price file, check its syntax", extra={"path": self.path})
+            return False
+
+        districts = {}
+        for district in data.get("district_prices", []):
+            vegetables = {}
+            for entry in district.get("vegetables", []):
+                for key in vegetable_keys(entry.get("name", "")):
+                    vegetables.setdefault(key, []).append(entry)
+            districts[_normalize(district.get("district"))] = {
+                "name": district.get("district"),
+                "vegetables": vegetables,
+            }
+
+        with self._lock:
+            self.data = data
+            self.mtime = mtime
+            self.districts = districts
+        log.info("Price file indexed", extra={"path": os.path.basename(self.path), "districts": len(districts)})
+        return True
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked_at < PRICE_INDEX_RELOAD_INTERVAL:
+            return
+        self._checked_at = now
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime != self.mtime:
+            self.reload()
+
+    def find_district(self, location):
+        """Exact, then fuzzy, match of a location against the indexed district names."""
+        districts = self.districts
+        key = _normalize(location)
+        district = districts.get(key)
+        if district is None:
+            close = difflib.get_close_matches(key, list(districts), n=1, cutoff=PRICE_INDEX_FUZZY_CUTOFF)
+            district = districts[close[0]] if close else None
+        return district
+
+    def lookup(self, vegetable, location):
+        """Returns (district name, [entries]) for a vegetable in a location, or None."""
+        self._ensure_loaded()
+        self._maybe_reload()
+        district = self.find_district(location)
+        if district is None:
+            return None
+        vegetables = district["vegetables"]
+        key = _normalize(vegetable)
+        entries = vegetables.get(key)
+        if entries is None:
+            close = difflib.get_close_matches(key, list(vegetables), n=1, cutoff=PRICE_INDEX_FUZZY_CUTOFF)
+            entries = vegetables[close[0]] if close else None
+        if not entries:
+            return None
+        return district["name"], entries
@@ -0,0 +1,419 @@
+import re
+import bisect
+import threading
+
+
+SEARCH_FIELDS = ("itemName", "category", "sellerLocation")
+MIN_FUZZY_LENGTH = 4
+# Most vocabulary terms one query token may expand to (as prefix or typo matches), so a short token like "t"
+# costs the same as a specific one.
+MAX_EXPANSIONS = 64
+# Result sets up to this many products are faceted by visiting each product; larger ones with a NumPy bincount.
+FACET_SCAN_LIMIT = 500
+# Answers kept per snapshot for repeated queries (autocomplete sends the same prefixes over and over).
+RESULT_CACHE_SIZE = 512
+_CHUNK_BITS = 1024
+_CHUNK_MASK = (1 << _CHUNK_BITS) - 1
+
+# Latin letters/digits plus Tamil (including its combining vowel signs), so
+# names like "Tomato (தக்காளி)" tokenize into both words.
+_TOKEN_RE = re.compile(r"[0-9a-z\u00c0-\u024f\u0b80-\u0bff]+")
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(str(text or "").lower())
+
+
+def _deletions(term):
+    """Every string one deletion away from term."""
+    return {term[:i] + term[i + 1:] for i in range(len(term))}
+
+
+def _within_one_edit(a, b):
+    """True if a and b differ by at most one insert, delete, substitution or adjacent swap."""
+    if a == b:
+        return True
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) == len(b):
+        diffs = [i for i in range(len(a)) if a[i] != b[i]]
+        if len(diffs) == 1:
+            return True
+        return (len(diffs) == 2 and diffs[1] == diffs[0] + 1
+                and a[diffs[0]] == b[diffs[1]] and a[diffs[1]] == b[diffs[0]])
+    shorter, longer = (a, b) if len(a) < len(b) else (b, a)
+    return any(longer[:i] + longer[i + 1:] == shorter for i in range(len(longer)))
+
+
+def _iter_bits(bits):
+    """Yields the positions of bits' set bits, lowest first, touching the big int once per chunk rather than per bit."""
+    base = 0
+    while bits:
+        skip = (bits & -bits).bit_length() - 1
+        bits >>= skip
+        base += skip
+        chunk = bits & _CHUNK_MASK
+        while chunk:
+            lowest = chunk & -chunk
+            yield base + lowest.bit_length() - 1
+            chunk ^= lowest
+        bits >>= _CHUNK_BITS
+        base += _CHUNK_BITS
+
+
+class _Snapshot:
+    """One version of the index. Writers change a copy and publish it; readers never see a half-applied write.
+
+    Each product has an ordinal, and every set of products (a term's postings,
+    a facet value, the live catalog) is an int bitmap over the ordinals, so
+    unions, intersections and counts are single C-level operations however many
+    products match.
+    """
+
+    def __init__(self):
+        self.docs = []          # ordinal -> product, None once removed
+        self.facet_keys = []    # ordinal -> (category key, location key)
+        self.ordinals = {}      # doc_id -> ordinal
+        self.doc_terms = {}     # doc_id -> frozenset of terms
+        self.postings = {}      # term -> bitmap
+        self.vocabulary = []    # sorted terms, for prefix lookups
+        self.deletes = {}       # one-deletion variant -> frozenset of terms
+        self.categories = {}    # lowercased category -> bitmap
+        self.locations = {}     # seller location as shown -> bitmap
+        self.live = 0
+        self.facet_counts = {"category": {}, "location": {}}
+        self.results = {}
+        self._codes = None
+
+    def copy(self):
+        snapshot = _Snapshot()
+        snapshot.docs = list(self.docs)
+        snapshot.facet_keys = list(self.facet_keys)
+        snapshot.ordinals = dict(self.ordinals)
+        snapshot.doc_terms = dict(self.doc_terms)
+        snapshot.postings = dict(self.postings)
+        snapshot.vocabulary = list(self.vocabulary)
+        snapshot.deletes = dict(self.deletes)
+        snapshot.categories = dict(self.categories)
+        snapshot.locations = dict(self.locations)
+        snapshot.live = self.live
+        return snapshot
+
+    # --- Maintenance (only ever on an unpublished copy) ---
+
+    def _index_term(self, term, bit):
+        postings = self.postings.get(term)
+        if postings is None:
+            bisect.insort(self.vocabulary, term)
+            if len(term) >= MIN_FUZZY_LENGTH:
+                for variant in _deletions(term):
+                    self.deletes[variant] = self.deletes.get(variant, frozenset()) | {term}
+            postings = 0
+        self.postings[term] = postings | bit
+
+    def _unindex_term(self, term, bit):
+        postings = self.postings.get(term)
+        if postings is None:
+            return
+        postings &= ~bit
+        if postings:
+            self.postings[term] = postings
+            return
+        del self.postings[term]
+        self.vocabulary.pop(bisect.bisect_left(self.vocabulary, term))
+        if len(term) >= MIN_FUZZY_LENGTH:
+            for variant in _deletions(term):
+                terms = self.deletes.get(variant, frozenset()) - {term}
+                if terms:
+                    self.deletes[variant] = terms
+                else:
+                    self.deletes.pop(variant, None)
+
+    @staticmethod
+    def _facet_keys(product):
+        category = product.get("category")
+        location = product.get("sellerLocation")
+        return (str(category).lower() if category else None, str(location).strip() if location else None)
+
+    @staticmethod
+    def _facet_add(facet, key, bit):
+        if key is not None:
+            facet[key] = facet.get(key, 0) | bit
+
+    @staticmethod
+    def _facet_remove(facet, key, bit):
+        if key is not None:
+            remaining = facet.get(key, 0) & ~bit
+            if remaining:
+                facet[key] = remaining
+            else:
+                facet.pop(key, None)
+
+    def add(self, doc_id, product):
+        ordinal = self.ordinals.get(doc_id)
+        if ordinal is None:
+            # New products go to the end, so equally ranked results keep catalog order.
+            ordinal = self.ordinals[doc_id] = len(self.docs)
+            self.docs.append(None)
+            self.facet_keys.append((None, None))
+        else:
+            self.remove(doc_id, keep_ordinal=True)
+        bit = 1 << ordinal
+        terms = set()
+        for field in SEARCH_FIELDS:
+            terms.update(tokenize(product.get(field)))
+        for term in terms:
+            self._index_term(term, bit)
+        category, location = self.facet_keys[ordinal] = self._facet_keys(product)
+        self._facet_add(self.categories, category, bit)
+        self._facet_add(self.locations, location, bit)
+        self.docs[ordinal] = dict(product, id=doc_id)
+        self.doc_terms[doc_id] = frozenset(terms)
+        self.live |= bit
+
+    def remove(self, doc_id, keep_ordinal=False):
+        ordinal = self.ordinals.get(doc_id)
+        if ordinal is None:
+            return
+        bit = 1 << ordinal
+        for term in self.doc_terms.pop(doc_id, ()):
+            self._unindex_term(term, bit)
+        category, location = self.facet_keys[ordinal]
+        self._facet_remove(self.categories, category, bit)
+        self._facet_remove(self.locations, location, bit)
+        self.docs[ordinal] = None
+        self.facet_keys[ordinal] = (None, None)
+        self.live &= ~bit
+        if not keep_ordinal:
+            del self.ordinals[doc_id]
+
+    def finish(self):
+        """Precomputes what a query with no text and no filter returns."""
+        self.facet_counts = {
+            "category": _ranked_counts((key, bits.bit_count()) for key, bits in self.categories.items()),
+            "location": _ranked_counts((key, bits.bit_count()) for key, bits in self.locations.items()),
+        }
+        return self
+
+
+    def codes(self):
+        """Per-ordinal facet codes as one NumPy array, built on first use per snapshot.
+
+        A product's code is category * (locations + 1) + location, with 0 for a
+        missing value, so one bincount gives the whole category x location table.
+        """
+        if self._codes is None:
+            import numpy as np
+            categories, locations = list(self.categories), list(self.locations)
+            category_code = {key: code for code, key in enumerate(categories, 1)}
+            location_code = {key: code for code, key in enumerate(locations, 1)}
+            width = len(locations) + 1
+            joint = np.fromiter(
+                (category_code.get(category, 0) * width + location_code.get(location, 0)
+                 for category, location in self.facet_keys),
+                np.int32, len(self.facet_keys),
+            )
+            self._codes = (categories, locations, joint)
+        return self._codes
+
+
+def _ranked_counts(counts):
+    return dict(sorted(((key, count) for key, count in counts if count), key=lambda item: (-item[1], item[0])))
+
+
+class SearchIndex:
+    """Inverted index over marketplace products with prefix, typo-tolerant and faceted search.
+
+    Every term keeps a posting bitmap of product ordinals. The vocabulary is
+    kept sorted for prefix lookups by bisection, and each term's one-deletion
+    variants point back to it (the SymSpell trick), so typo candidates are
+    found by hashing rather than by scanning the vocabulary.
+
+    Writes are copy-on-write: they are applied to a copy of the current
+    snapshot, which then replaces it in one assignment. Searches read whichever
+    snapshot is current without taking a lock, so they never wait on each
+    other or on a catalog reload.
+    """
+
+    def __init__(self):
+        self._write_lock = threading.Lock()
+        self._snapshot = _Snapshot()
+
+    # --- Maintenance ---
+
+    def add(self, doc_id, product):
+        """Indexes (or re-indexes) one product."""
+        with self._write_lock:
+            snapshot = self._snapshot.copy()
+            snapshot.add(doc_id, product)
+            self._snapshot = snapshot.finish()
+
+    def remove(self, doc_id):
+        with self._write_lock:
+            if doc_id not in self._snapshot.ordinals:
+                return
+            snapshot = self._snapshot.copy()
+            snapshot.remove(doc_id)
+            self._snapshot = snapshot.finish()
+
+    def replace(self, products):
+        """Syncs the index to a full {id: product} snapshot, touching only what changed."""
+        with self._write_lock:
+            current = self._snapshot
+            removed = set(current.ordinals) - set(products)
+            changed = sorted(
+                doc_id for doc_id, product in products.items()
+                if doc_id not in current.ordinals or dict(product, id=doc_id) != current.docs[current.ordinals[doc_id]]
+            )
+            if not removed and not changed:
+                return
+            if len(current.docs) > 2 * len(products):
+                # Mostly ordinals of removed products: start over rather than carry the holes.
+                snapshot, changed = _Snapshot(), sorted(products)
+            else:
+                snapshot = current.copy()
+                for doc_id in removed:
+                    snapshot.remove(doc_id)
+            for doc_id in changed:
+                snapshot.add(doc_id, products[doc_id])
+            self._snapshot = snapshot.finish()
+
+    def __len__(self):
+        return len(self._snapshot.ordinals)
+
+    # --- Querying ---
+
+    @staticmethod
+    def _expand(snapshot, token):
+        """Returns {term: weight} for exact (3), prefix (2) and one-typo (1) matches of token, at most MAX_EXPANSIONS."""
+        matches = {}
+        vocabulary = snapshot.vocabulary
+        start = bisect.bisect_left(vocabulary, token)
+        for term in vocabulary[start:start + MAX_EXPANSIONS]:
+            if not term.startswith(token):
+                break
+            matches[term] = 3 if term == token else 2
+
+        if len(token) >= MIN_FUZZY_LENGTH - 1 and len(matches) < MAX_EXPANSIONS:
+            candidates = set(snapshot.deletes.get(token, ()))
+            for variant in _deletions(token):
+                if variant in snapshot.postings:
+                    candidates.add(variant)
+                candidates.update(snapshot.deletes.get(variant, ()))
+            for term in sorted(candidates):
+                if term not in matches and _within_one_edit(token, term):
+                    matches[term] = 1
+                    if len(matches) == MAX_EXPANSIONS:
+                        break
+        return matches
+
+    @staticmethod
+    def _facet_filter(facet, value, normalize):
+        """Bitmap of the products whose facet value normalizes to value."""
+        bits = 0
+        for key, key_bits in facet.items():
+            if normalize(key) == value:
+                bits |= key_bits
+        return bits
+
+    def search(self, query="", category=None, location=None, limit=20):
+        """Returns (results, total, facets) for a query, with optional category/location facet filters.
+
+        Every query token must match (exactly, as a prefix, or within one typo).
+        Results are ranked by match quality, ties in catalog order; facets count
+        categories and locations over the matching set.
+        """
+        snapshot = self._snapshot
+        tokens = tuple(tokenize(query))
+        category = (category or "").strip().lower()
+        location = (location or "").strip().lower()
+        key = (tokens, category, location, limit)
+        answer = snapshot.results.get(key)
+        if answer is None:
+            answer = self._search(snapshot, tokens, category, location, limit)
+            if len(snapshot.results) >= RESULT_CACHE_SIZE:
+                snapshot.results.clear()
+            snapshot.results[key] = answer
+        top, total, facets = answer
+        return list(top), total, {name: dict(counts) for name, counts in facets.items()}
+
+    def _search(self, snapshot, tokens, category, location, limit):
+        # score -> bitmap of the products with that score.
+        levels = {0: snapshot.live}
+        for token in tokens:
+            # Each product scores its best match for the token: exact, then prefix, then typo.
+            by_weight = {}
+            for term, weight in self._expand(snapshot, token).items():
+                by_weight[weight] = by_weight.get(weight, 0) | snapshot.postings[term]
+            next_levels = {}
+            claimed = 0
+            for weight in (3, 2, 1):
+                bits = by_weight.get(weight, 0) & ~claimed
+                claimed |= bits
+                if not bits:
+                    continue
+                for score, level in levels.items():
+                    hit = level & bits
+                    if hit:
+                        next_levels[score + weight] = next_levels.get(score + weight, 0) | hit
+            levels = next_levels
+            if not levels:
+                break
+
+        matched = 0
+        for level in levels.values():
+            matched |= level
+        in_category = self._facet_filter(snapshot.categories, category, str) if category else -1
+        in_location = self._facet_filter(snapshot.locations, location, str.lower) if location else -1
+        selected = matched & in_category & in_location
+        if not tokens and not category and not location:
+            facets = snapshot.facet_counts
+        else:
+            facets = self._facets(snapshot, matched, category, location)
+
+        top = []
+        for score in sorted(levels, reverse=True):
+            if len(top) >= limit:
+                break
+            for ordinal in _iter_bits(levels[score] & selected):
+                top.append(snapshot.docs[ordinal])
+                if len(top) >= limit:
+                    break
+        return top, selected.bit_count(), facets
+
+    @staticmethod
+    def _facets(snapshot, matched, category, location):
+        """Category and location counts over matched, each with the other facet's filter applied but not its own,
+        so the UI can show how many results every alternative value would give."""
+        if matched.bit_count() <= FACET_SCAN_LIMIT:
+            categories, locations = {}, {}
+            for ordinal in _iter_bits(matched):
+                category_key, location_key = snapshot.facet_keys[ordinal]
+                in_this_category = not category or category_key == category
+                in_this_location = not location or (location_key is not None and location_key.lower() == location)
+                if category_key is not None and in_this_location:
+                    categories[category_key] = categories.get(category_key, 0) + 1
+                if location_key is not None and in_this_category:
+                    locations[location_key] = locations.get(location_key, 0) + 1
+            return {"category": _ranked_counts(categories.items()), "location": _ranked_counts(locations.items())}
+        # Too many to visit one by one: tabulate them all with one NumPy bincount.
+        import numpy as np
+        categories, locations, joint = snapshot.codes()
+        size = len(snapshot.docs)
+        rows = np.unpackbits(np.frombuffer(matched.to_bytes((size + 7) // 8, "little"), dtype=np.uint8),
+                             count=size, bitorder="little")
+        table = np.bincount(joint.take(np.flatnonzero(rows)), minlength=(len(categories) + 1) * (len(locations) + 1))
+        table = table.reshape(len(categories) + 1, len(locations) + 1)
+        if location:
+            columns = [code for code, key in enumerate(locations, 1) if key.lower() == location]
+            category_counts = table[1:, columns].sum(axis=1)
+        else:
+            category_counts = table[1:].sum(axis=1)
+        if category:
+            location_counts = table[[code for code, key in enumerate(categories, 1) if key == category], 1:].sum(axis=0)
+        else:
+            location_counts = table[:, 1:].sum(axis=0)
+        return {
+            "category": _ranked_counts(zip(categories, category_counts.tolist())),
+            "location": _ranked_counts(zip(locations, location_counts.tolist())),
+        }
@@ -0,0 +1,85 @@
+import threading
+from collections import Counter
+
+
+_registry_lock = threading.Lock()
+_groups = {}
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class Group:
+    """Collapses concurrent calls with the same key into one execution.
+
+    The first caller for a key runs fn; callers that arrive while it is still
+    running wait and receive the same result (or exception). Nothing is kept
+    once the call finishes, so this only removes duplicate in-flight work and
+    never serves stale data.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._executions = Counter()
+        self._coalesced = Counter()
+        with _registry_lock:
+            _groups[name] = self
+
+    def do(self, key, fn, label="default"):
+        """Runs fn() once for every concurrent caller with this key; label groups the counters (e.g. by host)."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._executions[label] += 1
+            else:
+                self._coalesced[label] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            labels = set(self._executions) | set(self._coalesced)
+            return {
+                "in_flight": len(self._calls),
+                "by_label": {
+                    label: {
+                        "executions": self._executions[label],
+                        "coalesced": self._coalesced[label],
+                    }
+                    for label in sorted(labels)
+                },
+                "executions": sum(self._executions.values()),
+                "coalesced": sum(self._coalesced.values()),
+            }
+
+
+def stats():
+    """Counters for every single-flight group in the process."""
+    with _registry_lock:
+        groups = dict(_groups)
+    return {name: group.stats() for name, group in groups.items()}
@@ -0,0 +1,83 @@
+import re
+import json
+from flask import Response, stream_with_context
+from agropulse import upstream
+
+
+_SECTION_HEADING_RE = re.compile(r"^\s*###\s*(.+?)\s*###\s*$")
+
+
+def wants_stream(request):
+    """True if the client opted into Server-Sent Events (?stream=1 or Accept: text/event-stream)."""
+    if request.args.get("stream", "").lower() in ("1", "true", "yes"):
+        return True
+    return "text/event-stream" in request.headers.get("Accept", "")
+
+
+def sse_event(event, data):
+    """Formats one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def sse_response(events):
+    """Wraps an iterator of formatted events in an unbuffered text/event-stream response.
+
+    A comment is sent first so the client (and any proxy) sees the first byte
+    immediately, before the model has produced anything.
+    """
+    def generate():
+        yield ": connected\n\n"
+        yield from events
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def stream_gemini_text(stream_url, payload, timeout):
+    """Yields text chunks from Gemini's streamGenerateContent (alt=sse) as they arrive."""
+    response = upstream.post(stream_url, json=payload, timeout=timeout, stream=True)
+    try:
+        response.raise_for_status()
+        response.encoding = "utf-8"
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            chunk = json.loads(line[len("data:"):].strip())
+            for candidate in chunk.get("candidates", [])[:1]:
+                for part in candidate.get("content", {}).get("parts", []):
+                    if part.get("text"):
+                        yield part["text"]
+    finally:
+        response.close()
+
+
+def split_sections(chunks):
+    """Regroups streamed text into (heading, body) pairs, each yielded as soon as it is complete.
+
+    A section is complete once the next '### HEADING ###' line (or the end of the
+    stream) arrives. Text before the first heading is yielded with heading None.
+    """
+    heading, body, pending = None, [], ""
+    for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            match = _SECTION_HEADING_RE.match(line)
+            if match:
+                if heading is not None or "".join(body).strip():
+                    yield heading, "\n".join(body).strip()
+                heading, body = match.group(1), []
+            else:
+                body.append(line)
+    match = _SECTION_HEADING_RE.match(pending)
+    if match:
+        if heading is not None or "".join(body).strip():
+            yield heading, "\n".join(body).strip()
+        heading, body = match.group(1), []
+    elif pending:
+        body.append(pending)
+    if heading is not None or "".join(body).strip():
+        yield heading, "\n".join(body).strip()
@@ -0,0 +1,276 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, urlunsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3 import PoolManager
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import MaxRetryError
+from urllib3.util.retry import Retry
+from agropulse import breakers
+from agropulse import logs
+from agropulse import metrics
+from agropulse import singleflight
+
+
+# --- Pool / timeout / retry settings (overridable from .env) ---
+UPSTREAM_POOL_CONNECTIONS = int(os.getenv("UPSTREAM_POOL_CONNECTIONS", "10"))
+UPSTREAM_POOL_MAXSIZE = int(os.getenv("UPSTREAM_POOL_MAXSIZE", "20"))
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "5"))
+UPSTREAM_READ_TIMEOUT = float(os.getenv("UPSTREAM_READ_TIMEOUT", "20"))
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "2"))
+UPSTREAM_BACKOFF_FACTOR = float(os.getenv("UPSTREAM_BACKOFF_FACTOR", "0.5"))
+# Longest a retry waits on an upstream's Retry-After header.
+UPSTREAM_RETRY_AFTER_MAX = int(os.getenv("UPSTREAM_RETRY_AFTER_MAX", "5"))
+UPSTREAM_FANOUT_WORKERS = int(os.getenv("UPSTREAM_FANOUT_WORKERS", "16"))
+# Sends every outbound call to one base URL (keeping path and query), e.g. a
+# local fake upstream for load tests. Never set this in production.
+UPSTREAM_BASE_URL_OVERRIDE = os.getenv("UPSTREAM_BASE_URL_OVERRIDE")
+# Identical GET/POST calls already in flight are shared instead of repeated.
+UPSTREAM_SINGLE_FLIGHT = os.getenv("UPSTREAM_SINGLE_FLIGHT", "1").lower() not in ("0", "false", "no")
+
+
+_stats_lock = threading.Lock()
+_host_stats = {}
+_pool_stats = {"pools_created": 0, "pool_hits": 0}
+
+
+def _host_counter(host):
+    """Returns the mutable counter dict for a host. Caller must hold _stats_lock."""
+    counter = _host_stats.get(host)
+    if counter is None:
+        counter = {"requests": 0, "new_connections": 0}
+        _host_stats[host] = counter
+    return counter
+
+
+class _CountingPoolMixin:
+    """Counts connection checkouts and freshly opened connections per host."""
+
+    def _get_conn(self, timeout=None):
+        with _stats_lock:
+            _host_counter(self.host)["requests"] += 1
+        return super()._get_conn(timeout=timeout)
+
+    def _new_conn(self):
+        with _stats_lock:
+            _host_counter(self.host)["new_connections"] += 1
+        return super()._new_conn()
+
+
+class _CountingHTTPConnectionPool(_CountingPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class _CountingHTTPSConnectionPool(_CountingPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+class _CountingPoolManager(PoolManager):
+    """PoolManager that records whether a request found an existing host pool."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool_classes_by_scheme = {
+            "http": _CountingHTTPConnectionPool,
+            "https": _CountingHTTPSConnectionPool,
+        }
+
+    def connection_from_pool_key(self, pool_key, request_context):
+        with self.pools.lock:
+            existed = pool_key in self.pools
+        with _stats_lock:
+            _pool_stats["pool_hits" if existed else "pools_created"] += 1
+        return super().connection_from_pool_key(pool_key, request_context)
+
+
+class _PooledAdapter(HTTPAdapter):
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+        self.poolmanager = _CountingPoolManager(
+            num_pools=connections, maxsize=maxsize, block=block, **pool_kwargs
+        )
+
+
+# When the call running on this thread must be finished by (time.monotonic()), set by _request.
+_call_deadline = threading.local()
+
+
+class _DeadlineRetry(Retry):
+    """Retry that never starts another attempt once the call's own timeout has been used up.
+
+    A call's deadline is its connect plus read timeout from when it started.
+    Giving up here looks like running out of retries: the last response is
+    returned, or the last connection error raised.
+    """
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        retry = super().increment(method, url, response, error, _pool, _stacktrace)
+        deadline = getattr(_call_deadline, "at", None)
+        if deadline is not None:
+            wait = retry.get_retry_after(response) if response is not None and retry.respect_retry_after_header else None
+            if time.monotonic() + (wait if wait is not None else retry.get_backoff_time()) >= deadline:
+                raise MaxRetryError(_pool, url, error or "call deadline reached")
+        return retry
+
+
+def _build_session():
+    """Creates the keep-alive session used for every outbound call."""
+    retry = _DeadlineRetry(
+        total=UPSTREAM_MAX_RETRIES,
+        connect=UPSTREAM_MAX_RETRIES,
+        # A read timeout already cost the caller its whole timeout; retrying it would multiply that.
+        read=0,
+        status=UPSTREAM_MAX_RETRIES,
+        backoff_factor=UPSTREAM_BACKOFF_FACTOR,
+        status_forcelist=(429, 500, 502, 503, 504),
+        # POST (Gemini) is only retried on connection errors, never after the
+        # request body may have been processed.
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+        respect_retry_after_header=True,
+        retry_after_max=UPSTREAM_RETRY_AFTER_MAX,
+        raise_on_status=False,
+    )
+    adapter = _PooledAdapter(
+        pool_connections=UPSTREAM_POOL_CONNECTIONS,
+        pool_maxsize=UPSTREAM_POOL_MAXSIZE,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+session = _build_session()
+
+# Bounded pool for routes that fan out several independent upstream calls.
+executor = ThreadPoolExecutor(max_workers=UPSTREAM_FANOUT_WORKERS, thread_name_prefix="upstream")
+
+
+def _timeout(timeout):
+    """Normalizes a read timeout into the (connect, read) tuple requests expects."""
+    if isinstance(timeout, tuple):
+        return timeout
+    return (UPSTREAM_CONNECT_TIMEOUT, timeout if timeout is not None else UPSTREAM_READ_TIMEOUT)
+
+
+def _resolve(url):
+    if not UPSTREAM_BASE_URL_OVERRIDE:
+        return url
+    base = urlsplit(UPSTREAM_BASE_URL_OVERRIDE)
+    parts = urlsplit(url)
+    return urlunsplit((base.scheme, base.netloc, parts.path, parts.query, parts.fragment))
+
+
+_flights = singleflight.Group("upstream")
+_COALESCIBLE_KWARGS = {"params", "json", "data", "headers"}
+
+
+def _flight_key(method, url, timeout, kwargs):
+    """Identifies a request by method, URL, body and timeout, or returns None if it must not be shared.
+
+    The timeout is part of the key so a caller never waits on a leader with a
+    longer deadline than its own.
+    """
+    if not UPSTREAM_SINGLE_FLIGHT or not set(kwargs) <= _COALESCIBLE_KWARGS:
+        return None  # streamed responses can only be read by one caller
+    try:
+        body = json.dumps([_timeout(timeout), kwargs], sort_keys=True, default=str)
+    except (TypeError, ValueError):
+        return None
+    return (method, url, hashlib.sha1(body.encode("utf-8")).hexdigest())
+
+
+def _request(method, url, timeout, kwargs):
+    url = _resolve(url)
+    key = _flight_key(method, url, timeout, kwargs)
+
+    name = metrics.upstream_name(url)
+    breaker = breakers.get(name) if breakers.BREAKER_ENABLED else None
+
+    def send():
+        # Raises CircuitOpenError straight away while the upstream's breaker is open.
+        probe = breaker.before_call() if breaker is not None else False
+        started = time.perf_counter()
+        recorded = False
+        call_timeout = _timeout(timeout)
+        _call_deadline.at = time.monotonic() + sum(t for t in call_timeout if t is not None)
+        try:
+            response = session.request(method, url, timeout=call_timeout, **kwargs)
+            if kwargs.get("stream"):
+                # Only the headers have arrived; the body is read later by the caller.
+                response_bytes = response.headers.get("Content-Length")
+                response_bytes = int(response_bytes) if response_bytes and response_bytes.isdigit() else None
+            else:
+                response_bytes = len(response.content)
+            body = response.request.body
+            recorded = True
+            metrics.observe_upstream(
+                name, time.perf_counter() - started, status=response.status_code,
+                request_bytes=len(body) if body is not None else None, response_bytes=response_bytes,
+            )
+            if breaker is not None:
+                # 4xx answers (unknown city, bad key) mean the upstream is up; 429 and 5xx mean it is not.
+                healthy = response.status_code < 500 and response.status_code != 429
+                breaker.record(healthy, time.perf_counter() - started, probe=probe, error=f"HTTP {response.status_code}")
+            return response
+        except BaseException as e:
+            # Anything, including a body cut off mid-read or a gevent Timeout/GreenletExit,
+            # is recorded exactly once, so a half-open probe slot is never leaked.
+            if not recorded:
+                metrics.observe_upstream(name, time.perf_counter() - started, error=type(e).__name__)
+                if breaker is not None:
+                    breaker.record(False, probe=probe, error=logs.describe_error(e))
+            raise
+
+    if key is None:
+        return send()
+    # Followers get the leader's Response object; its body is already read,
+    # so .json(), .text and .raise_for_status() work for every caller.
+    return _flights.do(key, send, label=urlsplit(url).netloc)
+
+
+@contextmanager
+def tracked(name, request_bytes=None):
+    """Wraps a call to an upstream with its own client (CSE, Cloudinary, Firestore) in its breaker and metrics."""
+    with breakers.guard(name), metrics.track_upstream(name, request_bytes=request_bytes):
+        yield
+
+
+def get(url, timeout=None, **kwargs):
+    """GET through the shared pooled session with a bounded timeout, coalesced with identical in-flight calls."""
+    return _request("GET", url, timeout, kwargs)
+
+
+def post(url, timeout=None, **kwargs):
+    """POST through the shared pooled session with a bounded timeout, coalesced with identical in-flight calls."""
+    return _request("POST", url, timeout, kwargs)
+
+
+def stats():
+    """Returns pool-hit and connection-reuse counters for every upstream host."""
+    with _stats_lock:
+        hosts = {}
+        for host, counter in _host_stats.items():
+            reused = max(counter["requests"] - counter["new_connections"], 0)
+            hosts[host] = {
+                "requests": counter["requests"],
+                "new_connections": counter["new_connections"],
+                "reused_connections": reused,
+                "reuse_ratio": round(reused / counter["requests"], 3) if counter["requests"] else 0.0,
+            }
+        return {
+            "pools_created": _pool_stats["pools_created"],
+            "pool_hits": _pool_stats["pool_hits"],
+            "pool_maxsize": UPSTREAM_POOL_MAXSIZE,
+            "hosts": hosts,
+            "single_flight": singleflight.stats(),
+        }
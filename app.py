@@ -1,109 +1,194 @@
 import os         
+import hmac
+import math
 import base64
 import json
+import time
+import logging
 import requests
-from flask import Flask, request, jsonify, render_template, url_for
+from flask import Blueprint, Flask, current_app, request, jsonify, render_template
 from flask_cors import CORS
-import cloudinary
-import cloudinary.uploader
-import firebase_admin
-from firebase_admin import credentials, firestore
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
-# --- NEW --- Import the required Google library
-from googleapiclient.discovery import build
+from agropulse import upstream
+from agropulse import breakers
+from agropulse import bulkheads
+from agropulse import cache
+from agropulse import clients
+from agropulse import logs
+from agropulse import metrics
+from agropulse import jobs
+from agropulse.price_index import PriceIndex
+from agropulse import marketplace
+from agropulse import streaming
+from agropulse.search_index import SearchIndex
+from agropulse.leaf_cache import PredictionCache
+from agropulse.news_feed import NewsFeed
+from agropulse.image_search import ImageSearch
 
 load_dotenv()
+logs.configure()
 
-app = Flask(__name__)
-CORS(app)
+log = logging.getLogger("agropulse")
+
+bp = Blueprint("agropulse", __name__)
 
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
 NEWS_API_KEY = os.getenv("NEWS_API_KEY")
 DATA_GOV_API_KEY = os.getenv("DATA_GOV_API_KEY")
-FIREBASE_CREDENTIALS_PATH = os.getenv("FIREBASE_CREDENTIALS_PATH")
-# --- NEW --- Add these lines to get your Google Search API keys
 GOOGLE_CSE_API_KEY = os.getenv("GOOGLE_CSE_API_KEY")
 GOOGLE_CSE_ID = os.getenv("GOOGLE_CSE_ID")
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
 
 
-try:
-    cloudinary.config(
-        cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
-        api_key=os.getenv("CLOUDINARY_API_KEY"),
-        api_secret=os.getenv("CLOUDINARY_API_SECRET"),
-        secure=True
-    )
-    print("Cloudinary configured successfully.")
-except Exception as e:
-    print(f"Error configuring Cloudinary: {e}")
-
-try:
-    if not FIREBASE_CREDENTIALS_PATH or not os.path.exists(FIREBASE_CREDENTIALS_PATH):
-        raise FileNotFoundError(f"Firebase credentials file not found at path: {FIREBASE_CREDENTIALS_PATH}. Check your .env file.")
-    cred = credentials.Certificate(FIREBASE_CREDENTIALS_PATH)
-    firebase_admin.initialize_app(cred)
-    db = firestore.client()
-    print("Firestore initialized successfully.")
-except Exception as e:
-    print(f"Error initializing Firestore: {e}")
-    db = None
-
-try:
-    with open('prices.json', 'r', encoding='utf-8') as f:
-        all_prices_data = json.load(f)
-    print("prices.json loaded successfully.")
-except FileNotFoundError:
-    all_prices_data = None
-    print("WARNING: prices.json not found. The /prices endpoint might have reduced functionality.")
-except json.JSONDecodeError:
-    all_prices_data = None
-    print("ERROR: Could not decode prices.json. Check syntax.")
+# Firestore, Cloudinary, Pillow, the CSE client, the catalog snapshot and
+# prices.json are all set up on first use (see agropulse/clients.py), so a cold start
+# only pays for what its first request needs.
+
+# Mirrors the catalog snapshot, so it is rebuilt on reloads and updated by /add-item.
+product_search = SearchIndex()
+
+
+@clients.lazy("catalog")
+def catalog_cache():
+    """The /get-items catalog snapshot, with the search index subscribed to it. Raises without a database."""
+    db = clients.firestore_db.get()
+    catalog = marketplace.CatalogCache(db)
+    catalog.subscribe(product_search)
+    if marketplace.CATALOG_LISTENER:
+        try:
+            catalog.start_listener()
+            log.info("Catalog listener started")
+        except Exception as e:
+            log.warning("Could not start catalog listener, falling back to CATALOG_MAX_AGE refreshes", extra={"error": str(e)})
+    return catalog
+
+
+@clients.lazy("pillow")
+def image_pipeline():
+    """image_prep, imported on the first /predict so Pillow stays out of the startup path."""
+    from agropulse import image_prep
+    return image_prep
+
+@clients.lazy("mandi")
+def mandi_prices():
+    """The ingested data.gov.in mandi prices, with the background ingestion started if MANDI_INGEST_INTERVAL is set."""
+    from agropulse import mandi_store
+    store = mandi_store.MandiStore()
+    if DATA_GOV_API_KEY:
+        mandi_store.IngestScheduler(store, mandi_store.data_gov_pages(DATA_GOV_API_KEY),
+                                    on_complete=lambda: price_history_store.get().record_mandi(store)).start()
+    return store
+
+@clients.lazy("jobs")
+def background_jobs():
+    """The SQLite job queue behind ?async=1, with this process's worker pool started on first use."""
+    return jobs.JobWorkers(jobs.JobQueue(), {"predict": run_prediction_job, "planner": run_planner_job}).start()
+
+PRICES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'prices.json')
+
+# Indexed on the first lookup and re-indexed automatically when the file changes on disk.
+price_index = PriceIndex(PRICES_PATH)
+
+
+@clients.lazy("price_history")
+def price_history_store():
+    """The columnar price history behind the /prices analytics routes; NumPy is only imported here."""
+    from agropulse import price_history
+    return price_history.PriceHistory(price_file=PRICES_PATH)
+
+
+@clients.lazy("market_locations")
+def market_locations():
+    """The KD-tree of market coordinates shipped in market_locations.json."""
+    from agropulse import market_geo
+    return market_geo.MarketLocations()
 
 
 MODEL_NAME = "gemini-2.5-flash"
 GEMINI_API_URL = f"https://generativelanguage.googleapis.com/v1beta/models/{MODEL_NAME}:generateContent?key={GEMINI_API_KEY}"
+GEMINI_STREAM_URL = f"https://generativelanguage.googleapis.com/v1beta/models/{MODEL_NAME}:streamGenerateContent?alt=sse&key={GEMINI_API_KEY}"
+# Upstream errors carry the Gemini URL and its key, so clients and stored job results only get this.
+PREDICTION_UNAVAILABLE = "Failed to connect to the prediction service. Please try again later."
 
+# Gemini-backed responses are cached per endpoint; TTLs are in seconds.
+vegetable_info_cache = cache.ResponseCache("vegetable-info", int(os.getenv("CACHE_TTL_VEGETABLE_INFO", str(7 * 24 * 3600))))
+planner_cache = cache.ResponseCache("planner", int(os.getenv("CACHE_TTL_PLANNER", str(24 * 3600))))
+price_estimate_cache = cache.ResponseCache("price-estimate", int(os.getenv("CACHE_TTL_PRICE_ESTIMATE", str(6 * 3600))))
+# Near-identical leaf photos (retries, re-shared copies) get the stored analysis instead of a new Gemini call.
+prediction_cache = PredictionCache()
 
-# --- NEW --- This is the helper function from your friend's code to find an image
-def get_image_url_from_google(query):
-    """Searches for an image using Google Custom Search API and returns the first result."""
+
+def stream_token_events(payload, timeout, finish, error_message):
+    """SSE events for a streamed Gemini call: one 'token' per chunk, then 'done' with finish(full_text)."""
+    chunks = []
     try:
-        if not GOOGLE_CSE_API_KEY or not GOOGLE_CSE_ID:
-            print("WARNING: Google CSE API Key or ID is not set. Cannot search for image.")
-            return None
-            
-        service = build("customsearch", "v1", developerKey=GOOGLE_CSE_API_KEY)
-        res = service.cse().list(
-            q=query,
-            cx=GOOGLE_CSE_ID,
-            searchType='image',
-            num=1,
-            safe='high'
-        ).execute()
-
-        if 'items' in res and len(res['items']) > 0:
-            return res['items'][0]['link']
-        else:
-            return None
+        for text in streaming.stream_gemini_text(GEMINI_STREAM_URL, payload, timeout):
+            chunks.append(text)
+            yield streaming.sse_event("token", {"text": text})
+        yield streaming.sse_event("done", finish("".join(chunks)))
     except Exception as e:
-        print(f"ERROR during Google Image Search: {e}")
-        return None
+        log.error("Streaming failed", extra={"route": request.path, "error": str(e)})
+        yield streaming.sse_event("error", {"error": f"{error_message}. Please try again later."})
+
+
+def stream_section_events(payload, timeout, finish):
+    """SSE events for /predict: one 'section' per completed ### HEADING ###, then 'done' with finish(full_text)."""
+    chunks = []
+
+    def recorded_chunks():
+        for text in streaming.stream_gemini_text(GEMINI_STREAM_URL, payload, timeout):
+            chunks.append(text)
+            yield text
+
+    try:
+        for heading, text in streaming.split_sections(recorded_chunks()):
+            yield streaming.sse_event("section", {"heading": heading, "text": text})
+        yield streaming.sse_event("done", finish("".join(chunks)))
+    except Exception as e:
+        log.error("Streaming failed", extra={"route": "/predict", "error": str(e)})
+        yield streaming.sse_event("error", {"error": PREDICTION_UNAVAILABLE})
 
 
-@app.route("/")
+def cached_jsonify(payload, hit):
+    """Returns a JSON response tagged with an X-Cache HIT/MISS header."""
+    response = jsonify(payload)
+    response.headers["X-Cache"] = "HIT" if hit else "MISS"
+    return response
+
+
+def circuit_open_response(e):
+    """503 with Retry-After for a call refused by an open circuit breaker, sent without waiting on the upstream."""
+    response = jsonify({"error": f"The {e.upstream} service is temporarily unavailable. Please try again shortly."})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(max(math.ceil(e.retry_after), 1))
+    return response
+
+
+@clients.lazy("image_search")
+def vegetable_images():
+    """Vegetable photos from Google CSE, through a persistent name -> URL cache."""
+    return ImageSearch(GOOGLE_CSE_API_KEY, GOOGLE_CSE_ID)
+
+
+@bp.route("/")
 def index():
     """Renders the main page."""
     return render_template("index.html")
 
-@app.route('/buyer')
+@bp.route('/buyer')
 def buyer_page():
     """Renders the buyer marketplace page."""
     return render_template('index2.html')
 
-@app.route("/ask-agro-assistant", methods=["POST"])
+@bp.route("/upstream-stats", methods=["GET"])
+def upstream_stats():
+    """Reports connection-pool, keep-alive reuse and single-flight counters for outbound calls."""
+    return jsonify(upstream.stats())
+
+@bp.route("/ask-agro-assistant", methods=["POST"])
 def ask_agro_assistant():
     """Handles chatbot queries using the Gemini API."""
     try:
@@ -142,20 +227,27 @@ def ask_agro_assistant():
             ]
         }
 
-        response = requests.post(GEMINI_API_URL, json=gemini_payload, timeout=45)
+        if streaming.wants_stream(request):
+            return streaming.sse_response(stream_token_events(
+                gemini_payload, 45, lambda text: {"answer": text}, "Could not connect to the AI service"))
+
+        response = upstream.post(GEMINI_API_URL, json=gemini_payload, timeout=45)
         response.raise_for_status()
 
         result_text = response.json()['candidates'][0]['content']['parts'][0]['text']
 
         return jsonify({"answer": result_text})
 
+    except breakers.CircuitOpenError as e:
+        return circuit_open_response(e)
     except requests.exceptions.RequestException as e:
-        return jsonify({"error": f"Could not connect to the AI service: {e}"}), 503
+        log.warning("Chatbot request failed", extra={"error": str(e)})
+        return jsonify({"error": "Could not connect to the AI service. Please try again later."}), 503
     except Exception as e:
-        print(f"CHATBOT ERROR: {e}")
+        log.exception("Chatbot request failed")
         return jsonify({"error": f"An unexpected error occurred: {e}"}), 500
 
-@app.route("/upload-item-image", methods=["POST"])
+@bp.route("/upload-item-image", methods=["POST"])
 def upload_item_image():
     """Handles image uploads for marketplace items to Cloudinary."""
     if 'item_image' not in request.files:
@@ -164,80 +256,165 @@ def upload_item_image():
     if file_to_upload.filename == '':
         return jsonify({"error": "No file selected"}), 400
     try:
-        upload_result = cloudinary.uploader.upload(file_to_upload, folder="agri_assistant_items")
+        uploader = clients.cloudinary_uploader.get()
+        with upstream.tracked("cloudinary", request_bytes=request.content_length):
+            upload_result = uploader.upload(file_to_upload, folder="agri_assistant_items")
         return jsonify({"imageUrl": upload_result.get('secure_url')})
     except Exception as e:
-        print(f"CLOUDINARY UPLOAD ERROR: {e}")
+        log.error("Cloudinary item upload failed", extra={"error": str(e)})
         return jsonify({"error": f"Failed to upload image: {e}"}), 500
-@app.route('/upload-profile-image', methods=['POST'])
+@bp.route('/upload-profile-image', methods=['POST'])
 def upload_profile_image():
     """Handles profile image uploads to Cloudinary with debugging."""
-    print("INFO: Received request for /upload-profile-image") 
     if 'profile_image' not in request.files:
-        print("ERROR: 'profile_image' not in request.files") 
+        log.warning("Profile upload without a 'profile_image' file part")
         return jsonify({'error': 'No file part in the request'}), 400
     
     file = request.files['profile_image']
 
     if file.filename == '':
-        print("ERROR: No file selected by user")
+        log.warning("Profile upload with no file selected")
         return jsonify({'error': 'No selected file'}), 400
 
     if file:
         try:
-            print("INFO: Uploading file to Cloudinary...")
             # Upload the file to Cloudinary in a specific folder for profiles
-            upload_result = cloudinary.uploader.upload(file, folder="agro_assistant_profiles")
+            uploader = clients.cloudinary_uploader.get()
+            with upstream.tracked("cloudinary", request_bytes=request.content_length):
+                upload_result = uploader.upload(file, folder="agro_assistant_profiles")
             
             # Get the secure URL of the uploaded image
             secure_url = upload_result.get('secure_url')
-            print(f"SUCCESS: Cloudinary URL is {secure_url}")
+            log.info("Profile image uploaded", extra={"url": secure_url})
 
             # Return the URL to the frontend
             return jsonify({'message': 'Image uploaded successfully', 'secure_url': secure_url}), 200
 
         except Exception as e:
-            print(f"CLOUDINARY PROFILE UPLOAD ERROR: {e}") 
+            log.error("Cloudinary profile upload failed", extra={"error": str(e)})
             return jsonify({'error': str(e)}), 500
 
     return jsonify({'error': 'An unknown error occurred'}), 500
 
-@app.route('/add-item', methods=['POST'])
+@bp.route('/add-item', methods=['POST'])
 def add_item():
     """Adds a new product item to the Firestore database."""
+    db = clients.firestore_db.get_or_none()
     if not db:
         return jsonify({"error": "Database not initialized"}), 500
     try:
         data = request.get_json()
         if not data:
             return jsonify({"error": "No data received in request"}), 400
-        db.collection('products').add(data)
+        data.update(marketplace.search_fields(data))
+        with upstream.tracked("firestore"):
+            _, doc_ref = db.collection(marketplace.PRODUCTS_COLLECTION).add(data)
+        catalog_cache.get().add(doc_ref.id, data)
         return jsonify({"success": True, "message": "Item added successfully"}), 201
     except Exception as e:
-        print(f"ERROR in /add-item endpoint: {e}")
+        log.exception("Could not add item")
         return jsonify({"error": f"Failed to add item: {e}"}), 500
 
-@app.route('/get-items', methods=['GET'])
+@bp.route('/get-items', methods=['GET'])
 def get_items():
-    """Retrieves all product items from the Firestore database."""
+    """Retrieves product items from the catalog snapshot, or a filtered page from Firestore.
+
+    Without paging parameters the full catalog snapshot is served with an ETag,
+    so repeat visits cost a 304 and no Firestore reads. Pages support category,
+    name (prefix), location (prefix), sort, page_size and start_after (the id of
+    the last item on the previous page); the next page's cursor is returned in
+    the X-Next-Cursor header.
+    """
+    db = clients.firestore_db.get_or_none()
     if not db:
         return jsonify({"error": "Database not initialized"}), 500
+    if any(param in request.args for param in marketplace.PAGE_PARAMS):
+        return get_items_page(db)
+    catalog = catalog_cache.get()
     try:
-        products_ref = db.collection('products').stream()
-        products_list = []
-        for doc in products_ref:
-            product_data = doc.to_dict()
-            product_data['id'] = doc.id
-            products_list.append(product_data)
-        return jsonify(products_list)
+        body, etag = catalog.get()
     except Exception as e:
         return jsonify({"error": f"Failed to get items: {e}"}), 500
 
-@app.route("/agri-news", methods=["GET"])
-def agri_news():
-    if not NEWS_API_KEY:
-        return jsonify({"error": "News API key is not configured."}), 500
+    response = current_app.response_class(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.make_conditional(request)
+    if response.status_code == 304:
+        catalog.count_not_modified()
+    return response
+
+def get_items_page(db):
+    """Serves one filtered page of /get-items."""
+    sort = request.args.get('sort', marketplace.DEFAULT_SORT)
+    if sort not in marketplace.SORT_ORDERS:
+        return jsonify({"error": f"sort must be one of: {', '.join(marketplace.SORT_ORDERS)}"}), 400
+    try:
+        page_size = int(request.args.get('page_size', marketplace.MARKETPLACE_DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"error": "page_size must be a number"}), 400
+    if not 1 <= page_size <= marketplace.MARKETPLACE_MAX_PAGE_SIZE:
+        return jsonify({"error": f"page_size must be between 1 and {marketplace.MARKETPLACE_MAX_PAGE_SIZE}"}), 400
 
+    try:
+        products_list, next_cursor = marketplace.fetch_products_page(
+            db,
+            category=request.args.get('category', '').strip() or None,
+            name_prefix=request.args.get('name', '').strip() or None,
+            location_prefix=request.args.get('location', '').strip() or None,
+            sort=sort,
+            page_size=page_size,
+            start_after_id=request.args.get('start_after', '').strip() or None,
+        )
+    except KeyError:
+        return jsonify({"error": "start_after does not match an existing item"}), 400
+    except Exception as e:
+        return jsonify({"error": f"Failed to get items: {e}"}), 500
+
+    response = jsonify(products_list)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response
+
+@bp.route('/catalog-stats', methods=['GET'])
+def catalog_stats():
+    """Reports the size, age and hit rate of the /get-items catalog snapshot."""
+    catalog = catalog_cache.get_or_none()
+    if not catalog:
+        return jsonify({"error": "Database not initialized"}), 500
+    return jsonify(catalog.stats())
+
+@bp.route('/search-items', methods=['GET'])
+def search_items():
+    """Full-text, typo-tolerant product search with category and location facets."""
+    catalog = catalog_cache.get_or_none()
+    if not catalog:
+        return jsonify({"error": "Database not initialized"}), 500
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), 100)
+    except ValueError:
+        return jsonify({"error": "limit must be a number"}), 400
+
+    try:
+        catalog.get()  # loads or refreshes the snapshot the index mirrors
+    except Exception as e:
+        return jsonify({"error": f"Failed to load items: {e}"}), 500
+
+    started = time.perf_counter()
+    results, total, facets = product_search.search(
+        request.args.get('q', ''),
+        category=request.args.get('category'),
+        location=request.args.get('location'),
+        limit=limit,
+    )
+    return jsonify({
+        "results": results,
+        "total": total,
+        "facets": facets,
+        "took_ms": round((time.perf_counter() - started) * 1000, 3),
+    })
+
+def fetch_agri_news():
+    """Calls NewsAPI for the fixed agriculture query and returns up to 20 articles."""
     search_query = ('("agriculture" AND "india") OR '
                     '("farming" AND "india") OR '
                     '("indian farmers") OR '
@@ -252,18 +429,135 @@ def agri_news():
            f"&sortBy=publishedAt"
            f"&apiKey={NEWS_API_KEY}")
 
+    response = upstream.get(url)
+    response.raise_for_status()
+    news_data = response.json()
+    filtered_articles = [article for article in news_data.get("articles", []) if article.get("title") != "[Removed]"]
+    return filtered_articles[:20]
+
+
+# The query never changes, so every user gets the same feed from memory.
+news_feed = NewsFeed(fetch_agri_news)
+
+
+@bp.route("/agri-news", methods=["GET"])
+def agri_news():
+    """Serves the agriculture news feed kept fresh by a background refresher.
+
+    Answers from memory with an ETag and Last-Modified so browsers can
+    revalidate with a 304. If NewsAPI is down the last good feed is served
+    with X-Cache: STALE.
+    """
+    if not NEWS_API_KEY:
+        return jsonify({"error": "News API key is not configured."}), 500
+
+    body, etag, last_modified = news_feed.get()
+    if body is None:
+        return jsonify({"error": "Could not retrieve news data. Please try again later."}), 502
+
+    response = current_app.response_class(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.public = True
+    response.cache_control.max_age = 60
+    stale = news_feed.is_stale()
+    metrics.record_source("/agri-news", "stale" if stale else "fresh")
+    response.headers["X-Cache"] = "STALE" if stale else "HIT"
+    return response.make_conditional(request)
+
+@bp.route("/image-search-stats", methods=["GET"])
+def image_search_stats():
+    """Reports the vegetable image cache hit rate and how many paid CSE queries were made."""
+    return jsonify(vegetable_images.get().stats())
+
+@bp.route("/news-stats", methods=["GET"])
+def news_stats():
+    """Reports the age, refresh count and last error of the /agri-news feed."""
+    return jsonify(news_feed.stats())
+
+def prediction_payload(image_b64, mime_type):
+    """The Gemini request for a leaf image: the image plus the farming-guide prompt."""
+    prompt_text = """
+    You are an expert agricultural scientist for Indian farming conditions. Analyze the provided plant leaf image and generate a complete, practical farming guide.
+    Your entire output must be a single block of human-readable plain text. Do NOT use JSON or markdown formatting.
+    Use the exact headings provided below, each on a new line, to structure your response.
+
+    ### DISEASE ANALYSIS ###
+    - Identify the disease on the leaf. If healthy, state "The leaf appears to be healthy."
+    - Provide 3 clear, step-by-step remedies for the disease.
+
+    ### HEALTHY LEAF TIPS ###
+    - If the leaf is healthy, provide 3 practical care tips for the plant. If it is diseased, skip this section entirely.
+    
+    ### SOIL SUITABILITY ###
+    - Describe the ideal soil type for this plant (e.g., Loamy, Sandy, Clay).
+    - State the optimal soil pH range (e.g., 6.0-7.0).
+
+    ### WATERING GUIDE ###
+    - Provide a clear watering schedule (e.g., "Water deeply once a week, more in summer.").
+    - Mention a simple method to check for soil moisture.
+    
+    ### FERTILIZER RECOMMENDATION ###
+    - Suggest a suitable NPK ratio (e.g., 10-10-10) or type of organic manure.
+    - Specify when and how often to apply the fertilizer.
+    
+    ### PEST CONTROL ###
+    - List 2-3 common pests that affect this plant.
+    - For each pest, suggest one organic and one chemical control method.
+    
+    ### PLANTING GUIDE ###
+    - Recommend the ideal spacing between individual plants.
+    - Suggest the proper planting depth for seeds or saplings.
+    """
+
+    return {
+        "contents": [{"parts": [{"inlineData": {"mime_type": mime_type, "data": image_b64}}, {"text": prompt_text}]}]
+    }
+
+
+def request_prediction(gemini_payload):
+    """Calls Gemini for a leaf analysis; returns {"prediction_text"}, or None when it gave no candidates."""
+    response = upstream.post(GEMINI_API_URL, json=gemini_payload, timeout=60)
+    response.raise_for_status()
+
+    gemini_response_data = response.json()
+    if 'candidates' not in gemini_response_data or not gemini_response_data['candidates']:
+        log.error("Gemini returned no candidates", extra={"response": gemini_response_data})
+        return None
+    return {"prediction_text": gemini_response_data['candidates'][0]['content']['parts'][0]['text']}
+
+
+def run_prediction_job(job):
+    """/predict?async=1 in a job worker; returns the (status, body) the synchronous route would have sent."""
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        news_data = response.json()
-        filtered_articles = [article for article in news_data.get("articles", []) if article.get("title") != "[Removed]"]
-        return jsonify({"articles": filtered_articles[:20]})
+        result = request_prediction(prediction_payload(job["image_b64"], job["mime_type"]))
+    except breakers.CircuitOpenError:
+        raise
     except requests.exceptions.RequestException as e:
-        return jsonify({"error": f"Could not retrieve news data: {e}"}), 502
-    except Exception as e:
-        return jsonify({"error": f"An unexpected error occurred: {e}"}), 500
+        log.error("Prediction service request failed", extra={"error": str(e)})
+        return 502, {"error": PREDICTION_UNAVAILABLE}
+    if result is None:
+        return 500, {"error": "Gemini API did not provide a valid analysis."}
+    prediction_cache.set(job["image_hash"], result)
+    return 200, result
+
 
-@app.route("/predict", methods=["POST"])
+def job_accepted_response(kind, payload):
+    """202 with the id of a newly queued job, or 503 with Retry-After when the queue is full."""
+    try:
+        job_id = background_jobs.get().queue.submit(kind, payload)
+    except jobs.QueueFull as e:
+        response = jsonify({"error": "Too many requests are waiting to be processed. Please try again shortly."})
+        response.status_code = 503
+        response.headers["Retry-After"] = str(math.ceil(e.retry_after))
+        return response
+    response = jsonify({"job_id": job_id, "status": jobs.QUEUED, "status_url": f"/jobs/{job_id}"})
+    response.status_code = 202
+    response.headers["Location"] = f"/jobs/{job_id}"
+    return response
+
+
+@bp.route("/predict", methods=["POST"])
 def predict():
     """Analyzes a leaf image and returns a comprehensive farming guide."""
     if 'leaf' not in request.files:
@@ -273,66 +567,140 @@ def predict():
     if file.filename == '':
         return jsonify({"error": "No file selected"}), 400
 
+    image_prep = image_pipeline.get()
     try:
-        image_bytes = file.read()
+        try:
+            image_bytes, mime_type, image_info = image_prep.prepare(file.stream)
+        except image_prep.ImageRejected as e:
+            return jsonify({"error": str(e)}), 400
+        log.info("Leaf image prepared", extra={key: image_info[key] for key in ("source_format", "bytes_in", "bytes_out", "width", "height")})
+        metrics.observe_predict_image(image_info["bytes_in"], image_info["bytes_out"])
+
+        image_hash = image_info["dhash"]
+        bypass_cache = request.args.get("nocache", "").lower() in ("1", "true", "yes")
+        if bypass_cache:
+            prediction_cache.record_bypass()
+        else:
+            cached_prediction, distance = prediction_cache.get(image_hash)
+            if cached_prediction is not None:
+                log.info("Prediction cache hit", extra={"distance": distance})
+                metrics.record_source("/predict", "cache")
+                if streaming.wants_stream(request):
+                    return streaming.sse_response(iter([streaming.sse_event("done", cached_prediction)]))
+                return cached_jsonify(cached_prediction, hit=True)
+
+        metrics.record_source("/predict", "gemini")
         image_b64 = base64.b64encode(image_bytes).decode("utf-8")
 
-        prompt_text = """
-        You are an expert agricultural scientist for Indian farming conditions. Analyze the provided plant leaf image and generate a complete, practical farming guide.
-        Your entire output must be a single block of human-readable plain text. Do NOT use JSON or markdown formatting.
-        Use the exact headings provided below, each on a new line, to structure your response.
+        gemini_payload = prediction_payload(image_b64, mime_type)
 
-        ### DISEASE ANALYSIS ###
-        - Identify the disease on the leaf. If healthy, state "The leaf appears to be healthy."
-        - Provide 3 clear, step-by-step remedies for the disease.
-
-        ### HEALTHY LEAF TIPS ###
-        - If the leaf is healthy, provide 3 practical care tips for the plant. If it is diseased, skip this section entirely.
-        
-        ### SOIL SUITABILITY ###
-        - Describe the ideal soil type for this plant (e.g., Loamy, Sandy, Clay).
-        - State the optimal soil pH range (e.g., 6.0-7.0).
-
-        ### WATERING GUIDE ###
-        - Provide a clear watering schedule (e.g., "Water deeply once a week, more in summer.").
-        - Mention a simple method to check for soil moisture.
-        
-        ### FERTILIZER RECOMMENDATION ###
-        - Suggest a suitable NPK ratio (e.g., 10-10-10) or type of organic manure.
-        - Specify when and how often to apply the fertilizer.
-        
-        ### PEST CONTROL ###
-        - List 2-3 common pests that affect this plant.
-        - For each pest, suggest one organic and one chemical control method.
-        
-        ### PLANTING GUIDE ###
-        - Recommend the ideal spacing between individual plants.
-        - Suggest the proper planting depth for seeds or saplings.
-        """
+        if jobs.wants_async(request):
+            return job_accepted_response("predict", {"image_b64": image_b64, "mime_type": mime_type, "image_hash": image_hash})
 
-        gemini_payload = {
-            "contents": [{"parts": [{"inlineData": {"mime_type": "image/jpeg", "data": image_b64}}, {"text": prompt_text}]}]
-        }
+        if streaming.wants_stream(request):
+            def finish_prediction(full_text):
+                result = {"prediction_text": full_text}
+                prediction_cache.set(image_hash, result)
+                return result
 
-        response = requests.post(GEMINI_API_URL, json=gemini_payload, timeout=60)
-        response.raise_for_status()
+            return streaming.sse_response(stream_section_events(gemini_payload, 60, finish_prediction))
 
-        gemini_response_data = response.json()
-        if 'candidates' not in gemini_response_data or not gemini_response_data['candidates']:
-            print(f"GEMINI API ERROR: No candidates returned. Response: {gemini_response_data}")
+        result = request_prediction(gemini_payload)
+        if result is None:
             return jsonify({"error": "Gemini API did not provide a valid analysis."}), 500
 
-        prediction_report_text = gemini_response_data['candidates'][0]['content']['parts'][0]['text']
-        return jsonify({"prediction_text": prediction_report_text})
+        prediction_cache.set(image_hash, result)
+        return cached_jsonify(result, hit=False)
 
+    except breakers.CircuitOpenError as e:
+        return circuit_open_response(e)
     except requests.exceptions.RequestException as e:
-        print(f"NETWORK/REQUEST ERROR: {e}")
-        return jsonify({"error": f"Failed to connect to the prediction service: {e}"}), 502
+        log.error("Prediction service request failed", extra={"error": str(e)})
+        return jsonify({"error": PREDICTION_UNAVAILABLE}), 502
     except Exception as e:
-        print(f"PREDICTION ERROR: {e}")
+        log.exception("Prediction failed")
         return jsonify({"error": f"An unexpected error occurred on the server: {e}"}), 500
 
-@app.route("/weather", methods=["GET"])
+@bp.route("/predict-stats", methods=["GET"])
+def predict_stats():
+    """Reports /predict upload shrinkage and perceptual-hash cache hit rate."""
+    return jsonify(dict(image_pipeline.get().stats(), cache=prediction_cache.stats()))
+
+WEATHER_GRID_PRECISION = int(os.getenv("WEATHER_GRID_PRECISION", "2"))
+# City names OpenWeatherMap doesn't know are remembered this long, so retyping a misspelling doesn't call it again.
+CACHE_TTL_GEOCODE_MISS = int(os.getenv("CACHE_TTL_GEOCODE_MISS", "3600"))
+
+
+@clients.lazy("geocode_cache")
+def geocode_store():
+    """Geocoding results barely ever change, so they live in a persistent store of their own."""
+    return cache.ResponseCache(
+        "geocode",
+        int(os.getenv("CACHE_TTL_GEOCODE", str(90 * 24 * 3600))),
+        store=cache.build_backend(os.getenv("GEOCODE_CACHE_BACKEND", "sqlite"), os.getenv("GEOCODE_CACHE_PATH", "agropulse_geocode.sqlite3")),
+    )
+
+
+# Short-lived, so a burst of farmers in one district costs a single upstream round trip.
+weather_cache = cache.ResponseCache("weather", int(os.getenv("CACHE_TTL_WEATHER", "600")))
+# The last good answer per cell, served marked STALE while OpenWeatherMap is down or its breaker is open.
+weather_last_good_cache = cache.ResponseCache("weather-last-good", int(os.getenv("CACHE_TTL_WEATHER_STALE", str(6 * 3600))))
+
+
+def grid_point(lat, lon):
+    """Rounds coordinates to the weather grid (2 decimals is roughly 1 km). Raises ValueError if they aren't numbers."""
+    return round(float(lat), WEATHER_GRID_PRECISION), round(float(lon), WEATHER_GRID_PRECISION)
+
+
+def grid_cell(lat, lon):
+    """grid_point() as the "lat,lon" cache key of its cell. Upstream calls use the same rounded point."""
+    return "%s,%s" % grid_point(lat, lon)
+
+
+def geocode_city(city_name):
+    """Resolves a city name to {'lat', 'lon'}, or None if OpenWeatherMap does not know it."""
+    city_key = cache.normalize_text(city_name)
+    location = geocode_store.get().get("direct", city_key)
+    if location is not None:
+        return location or None
+
+    geo_url = f"http://api.openweathermap.org/geo/1.0/direct?q={city_name}&limit=1&appid={OPENWEATHER_API_KEY}"
+    geo_response = upstream.get(geo_url)
+    geo_response.raise_for_status()
+    geo_data = geo_response.json()
+    if not geo_data:
+        geocode_store.get().set({}, "direct", city_key, ttl=CACHE_TTL_GEOCODE_MISS)
+        return None
+    location = {"lat": geo_data[0]['lat'], "lon": geo_data[0]['lon']}
+    geocode_store.get().set(location, "direct", city_key)
+    return location
+
+
+def reverse_geocode(lat, lon):
+    """Resolves coordinates to a city name, cached per grid cell."""
+    cell = grid_cell(lat, lon)
+    lat, lon = grid_point(lat, lon)
+    place = geocode_store.get().get("reverse", cell)
+    if place is not None:
+        return place["name"]
+
+    reverse_geo_url = f"http://api.openweathermap.org/geo/1.0/reverse?lat={lat}&lon={lon}&limit=1&appid={OPENWEATHER_API_KEY}"
+    reverse_geo_response = upstream.get(reverse_geo_url)
+    reverse_geo_response.raise_for_status()
+    reverse_geo_data = reverse_geo_response.json()
+    place = {"name": reverse_geo_data[0]['name'] if reverse_geo_data else None}
+    geocode_store.get().set(place, "reverse", cell)
+    return place["name"]
+
+
+def fetch_json(url):
+    """GETs an upstream URL and returns its decoded JSON body."""
+    response = upstream.get(url)
+    response.raise_for_status()
+    return response.json()
+
+
+@bp.route("/weather", methods=["GET"])
 def weather():
     """Fetches comprehensive weather data from OpenWeatherMap OneCall API."""
     lat = request.args.get("lat")
@@ -343,50 +711,70 @@ def weather():
         return jsonify({"error": "Weather API key not configured"}), 500
     
     final_city_name = city_name_query
+    reverse_future = None
+    cell = None
 
     try:
         if city_name_query:
-            geo_url = f"http://api.openweathermap.org/geo/1.0/direct?q={city_name_query}&limit=1&appid={OPENWEATHER_API_KEY}"
-            geo_response = requests.get(geo_url)
-            geo_response.raise_for_status()
-            geo_data = geo_response.json()
-            if not geo_data:
+            location = geocode_city(city_name_query)
+            if not location:
                 return jsonify({"error": f"City '{city_name_query}' not found. Please check spelling."}), 404
-            lat = geo_data[0]['lat']
-            lon = geo_data[0]['lon']
-        
-        elif lat and lon:
-            # THIS IS THE FIX: Reverse geocode to get city name from lat/lon
-            reverse_geo_url = f"http://api.openweathermap.org/geo/1.0/reverse?lat={lat}&lon={lon}&limit=1&appid={OPENWEATHER_API_KEY}"
-            reverse_geo_response = requests.get(reverse_geo_url)
-            reverse_geo_response.raise_for_status()
-            reverse_geo_data = reverse_geo_response.json()
-            if reverse_geo_data:
-                final_city_name = reverse_geo_data[0]['name']
+            lat = location['lat']
+            lon = location['lon']
 
         if not lat or not lon:
             return jsonify({"error": "City name or latitude/longitude are required"}), 400
 
-        # Fetch detailed weather data
-        one_call_url = f"https://api.openweathermap.org/data/3.0/onecall?lat={lat}&lon={lon}&exclude=minutely&units=metric&appid={OPENWEATHER_API_KEY}"
-        weather_response = requests.get(one_call_url)
-        weather_response.raise_for_status()
-        weather_data = weather_response.json()
-
-        # Fetch air pollution data
-        air_pollution_url = f"http://api.openweathermap.org/data/2.5/air_pollution?lat={lat}&lon={lon}&appid={OPENWEATHER_API_KEY}"
-        air_response = requests.get(air_pollution_url)
-        air_response.raise_for_status()
-        air_data = air_response.json()
-
-        # Combine the data
-        weather_data['air_quality'] = air_data.get('list', [{}])[0]
+        try:
+            cell = grid_cell(lat, lon)
+        except ValueError:
+            return jsonify({"error": "Latitude and longitude must be numbers"}), 400
+        lat, lon = grid_point(lat, lon)
+
+        if not city_name_query:
+            # Reverse geocode to get city name from lat/lon, alongside the weather calls
+            reverse_future = upstream.executor.submit(reverse_geocode, lat, lon)
+
+        cached_weather = weather_cache.get(cell)
+        if cached_weather is not None:
+            weather_data = dict(cached_weather)
+        else:
+            # OneCall and air pollution only depend on lat/lon, so fetch them in parallel
+            one_call_url = f"https://api.openweathermap.org/data/3.0/onecall?lat={lat}&lon={lon}&exclude=minutely&units=metric&appid={OPENWEATHER_API_KEY}"
+            air_pollution_url = f"http://api.openweathermap.org/data/2.5/air_pollution?lat={lat}&lon={lon}&appid={OPENWEATHER_API_KEY}"
+            weather_future = upstream.executor.submit(fetch_json, one_call_url)
+            air_future = upstream.executor.submit(fetch_json, air_pollution_url)
+            weather_data = weather_future.result()
+            air_data = air_future.result()
+
+            # Combine the data
+            weather_data['air_quality'] = air_data.get('list', [{}])[0]
+            weather_cache.set(dict(weather_data), cell)
+            weather_last_good_cache.set(dict(weather_data), cell)
+
+        if reverse_future is not None:
+            try:
+                final_city_name = reverse_future.result()
+            except requests.exceptions.RequestException as e:
+                # Only the name is missing; the weather itself is good, so it is not served as STALE.
+                log.warning("Reverse geocoding failed", extra={"error": str(e)})
         weather_data['city_name'] = final_city_name or weather_data.get('timezone', 'Unknown').split('/')[-1].replace('_', ' ')
 
-        return jsonify(weather_data)
+        return cached_jsonify(weather_data, hit=cached_weather is not None)
 
     except requests.exceptions.RequestException as e:
-        return jsonify({"error": f"Could not connect to weather service: {e}"}), 502
+        last_good = weather_last_good_cache.get(cell) if cell is not None else None
+        if last_good is None:
+            if isinstance(e, breakers.CircuitOpenError):
+                return circuit_open_response(e)
+            log.warning("Weather request failed", extra={"error": str(e)})
+            return jsonify({"error": "Could not connect to weather service. Please try again later."}), 502
+        metrics.record_source("/weather", "stale")
+        weather_data = dict(last_good)
+        weather_data['city_name'] = final_city_name or weather_data.get('timezone', 'Unknown').split('/')[-1].replace('_', ' ')
+        response = jsonify(weather_data)
+        response.headers["X-Cache"] = "STALE"
+        return response
     except Exception as e:
         return jsonify({"error": f"An unexpected error occurred: {e}"}), 500
 
@@ -395,7 +783,38 @@ def weather():
 # ******** NEW SECTION FOR WEATHER HISTORY ADDED BELOW ********
 # ***************************************************************
 
-@app.route("/weather-history", methods=["GET"])
+# Past days never change, so the per-day history cache only needs to outlive the 7-day window.
+weather_history_day_cache = cache.ResponseCache("weather-history-day", int(os.getenv("CACHE_TTL_WEATHER_HISTORY_DAY", str(30 * 24 * 3600))))
+
+
+def fetch_history_day(lat, lon, past_date):
+    """Fetches and summarizes one past day from the OpenWeatherMap Timemachine API."""
+    timestamp = int(past_date.timestamp())
+    history_url = f"https://api.openweathermap.org/data/3.0/onecall/timemachine?lat={lat}&lon={lon}&dt={timestamp}&units=metric&appid={OPENWEATHER_API_KEY}"
+
+    response = upstream.get(history_url)
+    response.raise_for_status()
+    day_data = response.json()
+
+    # The API returns data for the whole day, we'll process the first entry as representative
+    if not day_data or not day_data.get('data'):
+        return None
+
+    # We need to find the max and min temp from the hourly data provided for that day
+    hourly_temps = [hour['temp'] for hour in day_data['data'][0]['hourly']]
+    daily_summary = day_data['data'][0]
+    return {
+        "date": past_date.strftime('%Y-%m-%d'),
+        "temp_max": max(hourly_temps) if hourly_temps else None,
+        "temp_min": min(hourly_temps) if hourly_temps else None,
+        "condition": daily_summary['weather'][0]['main'],
+        "icon": daily_summary['weather'][0]['icon'],
+        "humidity": daily_summary['humidity'],
+        "wind_speed": daily_summary['wind_speed']
+    }
+
+
+@bp.route("/weather-history", methods=["GET"])
 def weather_history():
     """Fetches historical weather data for the last 7 days."""
     lat = request.args.get("lat")
@@ -407,93 +826,178 @@ def weather_history():
     if not OPENWEATHER_API_KEY:
         return jsonify({"error": "Weather API key not configured"}), 500
 
-    historical_data = []
-    today = datetime.utcnow()
-
     try:
-        # Loop to get data for each of the last 7 days
-        for i in range(1, 8):
-            # Calculate the timestamp for the past day
-            past_date = today - timedelta(days=i)
-            timestamp = int(past_date.timestamp())
-            
-            # Call the OpenWeatherMap Timemachine API
-            history_url = f"https://api.openweathermap.org/data/3.0/onecall/timemachine?lat={lat}&lon={lon}&dt={timestamp}&units=metric&appid={OPENWEATHER_API_KEY}"
-            
-            response = requests.get(history_url)
-            response.raise_for_status()
-            day_data = response.json()
-
-            # The API returns data for the whole day, we'll process the first entry as representative
-            if day_data and day_data.get('data'):
-                # We need to find the max and min temp from the hourly data provided for that day
-                hourly_temps = [hour['temp'] for hour in day_data['data'][0]['hourly']]
-                max_temp = max(hourly_temps) if hourly_temps else None
-                min_temp = min(hourly_temps) if hourly_temps else None
-                
-                # Extract daily summary
-                daily_summary = day_data['data'][0]
-                
-                historical_data.append({
-                    "date": past_date.strftime('%Y-%m-%d'),
-                    "temp_max": max_temp,
-                    "temp_min": min_temp,
-                    "condition": daily_summary['weather'][0]['main'],
-                    "icon": daily_summary['weather'][0]['icon'],
-                    "humidity": daily_summary['humidity'],
-                    "wind_speed": daily_summary['wind_speed']
-                })
-
-        # The data is from newest to oldest, reverse it for chronological order
-        return jsonify({"history": historical_data[::-1]})
+        cell = grid_cell(lat, lon)
+    except ValueError:
+        return jsonify({"error": "Latitude and longitude must be numbers"}), 400
+    lat, lon = grid_point(lat, lon)
 
-    except requests.exceptions.RequestException as e:
-        return jsonify({"error": f"Could not connect to weather history service: {e}"}), 502
-    except Exception as e:
-        print(f"WEATHER HISTORY ERROR: {e}")
-        return jsonify({"error": f"An unexpected error occurred while fetching history: {e}"}), 500
+    today = datetime.utcnow()
+    past_dates = [today - timedelta(days=i) for i in range(1, 8)]
+    days_by_date = {}
+    pending = {}
+
+    # Only days not already stored are fetched, all of them concurrently.
+    for past_date in past_dates:
+        date_key = past_date.strftime('%Y-%m-%d')
+        cached_day = weather_history_day_cache.get(cell, date_key)
+        if cached_day is not None:
+            days_by_date[date_key] = cached_day
+        else:
+            pending[date_key] = upstream.executor.submit(fetch_history_day, lat, lon, past_date)
+
+    missing_dates = []
+    first_error = None
+    for date_key, future in pending.items():
+        try:
+            day_summary = future.result()
+        except Exception as e:
+            log.warning("Weather history day failed", extra={"date": date_key, "error": str(e)})
+            missing_dates.append(date_key)
+            first_error = first_error or e
+            continue
+        if day_summary:
+            weather_history_day_cache.set(day_summary, cell, date_key)
+            days_by_date[date_key] = day_summary
+
+    if first_error is not None and not days_by_date:
+        if isinstance(first_error, requests.exceptions.RequestException):
+            return jsonify({"error": f"Could not connect to weather history service: {first_error}"}), 502
+        return jsonify({"error": f"An unexpected error occurred while fetching history: {first_error}"}), 500
+
+    # Oldest first, for chronological order
+    result = {"history": [days_by_date[d] for d in sorted(days_by_date)]}
+    if missing_dates:
+        result["missing_dates"] = sorted(missing_dates)
+    return jsonify(result)
+
+
+DATA_GOV_RESOURCE_ID = "9ef84268-d588-465a-a308-a864a43d0070"
+DATA_GOV_PAGE_LIMIT = int(os.getenv("DATA_GOV_PAGE_LIMIT", "1000"))
+DATA_GOV_MAX_PAGES = int(os.getenv("DATA_GOV_MAX_PAGES", "5"))
+PRICES_BATCH_MAX_CELLS = int(os.getenv("PRICES_BATCH_MAX_CELLS", "200"))
+# /prices with lat/lon (or a town it can geocode) answers from the closest markets within this radius.
+PRICES_NEAREST_K = int(os.getenv("PRICES_NEAREST_K", "3"))
+PRICES_NEAREST_MAX_KM = float(os.getenv("PRICES_NEAREST_MAX_KM", "100"))
+
+
+def format_local_prices(district_name, entries):
+    """Shapes price index entries like the rest of the /prices responses."""
+    return [{
+        "name": entry.get('name'),
+        "location": district_name,
+        "price": f"₹ {entry.get('price_per_kg', 0):.2f} per Kg"
+    } for entry in entries]
+
+
+def format_mandi_price(record):
+    """Shapes a data.gov.in mandi record (live or from the mandi store) like the rest of the /prices responses."""
+    return {
+        "name": record.get('commodity'),
+        "location": record.get('market'),
+        "price": f"₹ {record.get('modal_price', 'N/A')} per Quintal",
+        "arrival_date": record.get('arrival_date'),
+    }
 
 
-@app.route("/prices", methods=["GET"])
+def nearest_market_prices(vegetable, lat, lon, k):
+    """Prices for a vegetable at the k closest markets that have it, within PRICES_NEAREST_MAX_KM."""
+    mandi = mandi_prices.get()
+    has_mandi = mandi.is_fresh()
+    found, markets = [], 0
+    for market, distance_km in market_locations.get().nearest(lat, lon, max_km=PRICES_NEAREST_MAX_KM):
+        local_match = price_index.lookup(vegetable, market["district"])
+        if local_match:
+            market_prices = format_local_prices(*local_match)
+        else:
+            latest_record = mandi.latest(market["market"], vegetable) if has_mandi else None
+            if not latest_record:
+                continue
+            market_prices = [format_mandi_price(latest_record)]
+        for price in market_prices:
+            price["distance_km"] = round(distance_km, 1)
+        found.extend(market_prices)
+        markets += 1
+        if markets == k:
+            break
+    return found
+
+
+@bp.route("/prices", methods=["GET"])
 def prices():
     """Fetches vegetable prices using a smart, two-step approach."""
     location_query = request.args.get('location', '').strip()
     vegetable_query = request.args.get('vegetable', '').strip()
 
-    if not location_query or not vegetable_query:
-        return jsonify({"error": "Location and vegetable parameters are required."}), 400
-
+    coordinates = None
     try:
-        print(f"INFO: Attempting to fetch real-time price for {vegetable_query} in {location_query}...")
-        resource_id = "9ef84268-d588-465a-a308-a864a43d0070"
-        gov_api_url = (f"https://api.data.gov.in/resource/{resource_id}?"
-                       f"api-key={DATA_GOV_API_KEY}&format=json&"
-                       f"filters[market]={location_query.title()}&"
-                       f"filters[commodity]={vegetable_query.title()}")
-
-        response = requests.get(gov_api_url, timeout=20)
-
-        if response.status_code == 200:
-            data = response.json()
-            records = data.get('records', [])
-            if records:
-                print("SUCCESS: Found real-time price.")
-                latest_record = records[-1]
-                found_price = latest_record.get('modal_price', 'N/A')
-                result = {
-                    "prices": [{
-                        "name": latest_record.get('commodity'),
-                        "location": latest_record.get('market'),
-                        "price": f"₹ {found_price} per Quintal"
-                    }]
-                }
-                return jsonify(result)
-    except requests.exceptions.RequestException as e:
-        print(f"WARNING: Real-time API request failed: {e}. Proceeding to AI fallback.")
-        pass
+        if request.args.get('lat') or request.args.get('lon'):
+            coordinates = (float(request.args.get('lat', '')), float(request.args.get('lon', '')))
+            if not (-90 <= coordinates[0] <= 90 and -180 <= coordinates[1] <= 180):
+                raise ValueError
+        nearest_k = bounded_int_arg('k', PRICES_NEAREST_K, 1, 10)
+    except ValueError:
+        return jsonify({"error": "lat/lon must be valid coordinates and k a number between 1 and 10."}), 400
+
+    if not vegetable_query or not (location_query or coordinates):
+        return jsonify({"error": "A vegetable and a location or lat/lon are required."}), 400
+
+    if location_query:
+        local_match = price_index.lookup(vegetable_query, location_query)
+        if local_match:
+            metrics.record_source("/prices", "local")
+            return jsonify({"prices": format_local_prices(*local_match)})
+
+        mandi = mandi_prices.get()
+        if mandi.is_fresh():
+            # Ingested by agropulse/mandi_store.py, so this is an indexed read rather than a live data.gov.in call.
+            # An empty or stale store (ingestion stopped) takes the live call below instead.
+            latest_record = mandi.latest(location_query, vegetable_query)
+            if latest_record:
+                metrics.record_source("/prices", "mandi_store")
+                return jsonify({"prices": [format_mandi_price(latest_record)]})
+        else:
+            try:
+                log.info("Fetching real-time price", extra={"vegetable": vegetable_query, "location": location_query})
+                gov_api_url = (f"https://api.data.gov.in/resource/{DATA_GOV_RESOURCE_ID}?"
+                               f"api-key={DATA_GOV_API_KEY}&format=json&"
+                               f"filters[market]={location_query.title()}&"
+                               f"filters[commodity]={vegetable_query.title()}")
+
+                response = upstream.get(gov_api_url, timeout=20)
+
+                if response.status_code == 200:
+                    records = response.json().get('records', [])
+                    if records:
+                        metrics.record_source("/prices", "data_gov")
+                        # The API does not order records, so pick the latest arrival explicitly.
+                        return jsonify({"prices": [format_mandi_price(max(records, key=arrival_sort_key))]})
+            except requests.exceptions.RequestException as e:
+                log.warning("Real-time price request failed, falling back to Gemini", extra={"error": str(e)})
+
+        if coordinates is None and OPENWEATHER_API_KEY:
+            # A small town or a spelling no market uses: place it on the map and use the markets around it.
+            try:
+                location = geocode_city(location_query)
+                if location:
+                    coordinates = (location['lat'], location['lon'])
+            except requests.exceptions.RequestException as e:
+                log.warning("Could not geocode price location", extra={"location": location_query, "error": str(e)})
+
+    if coordinates is not None:
+        nearby_prices = nearest_market_prices(vegetable_query, *coordinates, nearest_k)
+        if nearby_prices:
+            metrics.record_source("/prices", "nearest")
+            return jsonify({"prices": nearby_prices})
+        location_query = location_query or grid_cell(*coordinates)
+
+    cached_result = price_estimate_cache.get(cache.normalize_text(vegetable_query), cache.normalize_text(location_query))
+    if cached_result is not None:
+        metrics.record_source("/prices", "gemini_cache")
+        return cached_jsonify(cached_result, hit=True)
 
     try:
-        print("INFO: Real-time price not found. Using Gemini AI for estimation...")
+        log.info("Real-time price not found, estimating with Gemini", extra={"vegetable": vegetable_query, "location": location_query})
         prompt = f"""
         As an agricultural market expert, provide a single, average estimated market price for '{vegetable_query}' in the '{location_query}' region of India.
         Your entire response MUST be only a single, valid JSON object with no markdown or any other text.
@@ -503,7 +1007,7 @@ def prices():
             "contents": [{"parts": [{"text": prompt}]}],
             "generationConfig": {"response_mime_type": "application/json"}
         }
-        gemini_response = requests.post(GEMINI_API_URL, json=payload, timeout=45)
+        gemini_response = upstream.post(GEMINI_API_URL, json=payload, timeout=45)
         gemini_response.raise_for_status()
 
         ai_data = gemini_response.json()
@@ -511,7 +1015,7 @@ def prices():
         price_data = json.loads(cleaned_text)
         estimated_price = price_data.get("estimated_price", "Could not estimate.")
 
-        print(f"SUCCESS: AI estimated price: {estimated_price}")
+        metrics.record_source("/prices", "gemini")
         result = {
             "prices": [{
                 "name": vegetable_query.title(),
@@ -519,18 +1023,280 @@ def prices():
                 "price": f"{estimated_price} (Estimated)"
             }]
         }
-        return jsonify(result)
+        price_estimate_cache.set(result, cache.normalize_text(vegetable_query), cache.normalize_text(location_query))
+        return cached_jsonify(result, hit=False)
+    except breakers.CircuitOpenError as e:
+        metrics.record_source("/prices", "circuit_open")
+        return circuit_open_response(e)
     except Exception as e:
-        print(f"ERROR: Both real-time API and AI fallback failed. Error: {e}")
+        log.error("Both real-time API and Gemini fallback failed", extra={"vegetable": vegetable_query, "location": location_query, "error": str(e)})
+        metrics.record_source("/prices", "error")
         return jsonify({"error": f"Sorry, could not find or estimate the price for {vegetable_query}."}), 500
 
-@app.route("/vegetable-info", methods=["GET"])
+def fetch_market_records(market):
+    """Pages through every data.gov.in mandi record for one market."""
+    records = []
+    for page in range(DATA_GOV_MAX_PAGES):
+        gov_api_url = (f"https://api.data.gov.in/resource/{DATA_GOV_RESOURCE_ID}?"
+                       f"api-key={DATA_GOV_API_KEY}&format=json&"
+                       f"limit={DATA_GOV_PAGE_LIMIT}&offset={page * DATA_GOV_PAGE_LIMIT}&"
+                       f"filters[market]={market.title()}")
+        response = upstream.get(gov_api_url, timeout=20)
+        response.raise_for_status()
+        page_records = response.json().get('records', [])
+        records.extend(page_records)
+        if len(page_records) < DATA_GOV_PAGE_LIMIT:
+            break
+    return records
+
+
+def arrival_sort_key(record):
+    """Sorts data.gov.in records by their dd/mm/yyyy arrival_date (unparseable dates first)."""
+    try:
+        return datetime.strptime(record.get('arrival_date', ''), '%d/%m/%Y')
+    except ValueError:
+        return datetime.min
+
+
+def batch_estimate_list(parsed):
+    """Gemini's batch answer as a list of estimates, however it wrapped them.
+
+    The prompt asks for a bare array, but the model sometimes returns
+    {"prices": [...]} or, for one pair, a single object.
+    """
+    if isinstance(parsed, list):
+        return parsed
+    if isinstance(parsed, dict):
+        list_values = [value for value in parsed.values() if isinstance(value, list)]
+        if len(list_values) == 1:
+            return list_values[0]
+        return [parsed]
+    return []
+
+
+def estimate_prices_batch(pairs):
+    """Asks Gemini for every (vegetable, location) pair in one prompt; returns {pair: estimated_price}."""
+    pair_lines = "\n".join(f'- "{vegetable}" in "{location}"' for vegetable, location in pairs)
+    prompt = f"""
+    As an agricultural market expert, provide an average estimated market price in India for each of these vegetable and location pairs:
+    {pair_lines}
+    Your entire response MUST be only a single, valid JSON array with no markdown or any other text, with one object per pair in the same order.
+    Use this exact structure: [{{"vegetable": "Tomato", "location": "Salem", "estimated_price": "Approx. ₹Z per Kg"}}]
+    """
+    payload = {
+        "contents": [{"parts": [{"text": prompt}]}],
+        "generationConfig": {"response_mime_type": "application/json"}
+    }
+    gemini_response = upstream.post(GEMINI_API_URL, json=payload, timeout=60)
+    gemini_response.raise_for_status()
+    estimates = batch_estimate_list(json.loads(gemini_response.json()['candidates'][0]['content']['parts'][0]['text']))
+
+    by_name = {
+        (cache.normalize_text(item.get("vegetable")), cache.normalize_text(item.get("location"))): item.get("estimated_price")
+        for item in estimates if isinstance(item, dict)
+    }
+    results = {}
+    for position, (vegetable, location) in enumerate(pairs):
+        estimated_price = by_name.get((cache.normalize_text(vegetable), cache.normalize_text(location)))
+        if estimated_price is None and position < len(estimates) and isinstance(estimates[position], dict):
+            estimated_price = estimates[position].get("estimated_price")
+        if estimated_price:
+            results[(vegetable, location)] = estimated_price
+    return results
+
+
+@bp.route("/prices/batch", methods=["POST"])
+def prices_batch():
+    """Resolves a vegetables x markets price matrix in a couple of upstream round trips.
+
+    Each cell is answered from the local index first, then from one paginated
+    data.gov.in query per market, and any remaining gaps from a single Gemini prompt.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "The request body must be a JSON object."}), 400
+    vegetables = data.get("vegetables", data.get("commodities", []))
+    markets = data.get("markets", data.get("locations", []))
+    for field, values in (("vegetables", vegetables), ("markets", markets)):
+        # A bare string would otherwise be iterated one character at a time.
+        if not isinstance(values, list) or not all(isinstance(value, str) for value in values):
+            return jsonify({"error": f"'{field}' must be a list of strings."}), 400
+    vegetables = [v.strip() for v in vegetables if v.strip()]
+    markets = [m.strip() for m in markets if m.strip()]
+
+    if not vegetables or not markets:
+        return jsonify({"error": "Non-empty 'vegetables' and 'markets' lists are required."}), 400
+    if len(vegetables) * len(markets) > PRICES_BATCH_MAX_CELLS:
+        return jsonify({"error": f"At most {PRICES_BATCH_MAX_CELLS} vegetable/market combinations per request."}), 400
+
+    results = []
+    gaps = []
+    for market in markets:
+        for vegetable in vegetables:
+            local_match = price_index.lookup(vegetable, market)
+            if local_match:
+                results.extend(dict(price, source="local") for price in format_local_prices(*local_match))
+            else:
+                gaps.append((vegetable, market))
+
+    # One paginated data.gov.in query per market that still has gaps, all in parallel
+    gap_markets = sorted({market for _, market in gaps})
+    mandi = mandi_prices.get()
+    latest_by_market = None
+    if gap_markets and mandi.is_fresh():
+        # One indexed read per market from the ingested copy, no upstream call.
+        latest_by_market = {market: mandi.latest_by_commodity(market) for market in gap_markets}
+    elif gap_markets and DATA_GOV_API_KEY:
+        market_futures = {market: upstream.executor.submit(fetch_market_records, market) for market in gap_markets}
+        latest_by_market = {}
+        for market, future in market_futures.items():
+            try:
+                records = future.result()
+            except requests.exceptions.RequestException as e:
+                log.warning("Real-time batch request failed", extra={"market": market, "error": str(e)})
+                records = []
+            latest_by_market[market] = {
+                cache.normalize_text(record.get('commodity')): record for record in sorted(records, key=arrival_sort_key)
+            }
+    if latest_by_market is not None:
+        still_missing = []
+        for vegetable, market in gaps:
+            latest_record = latest_by_market[market].get(cache.normalize_text(vegetable))
+            if latest_record:
+                results.append(dict(format_mandi_price(latest_record), source="data.gov.in"))
+            else:
+                still_missing.append((vegetable, market))
+        gaps = still_missing
+
+    # Whatever is left goes to Gemini in a single prompt, reusing earlier single-item estimates
+    to_estimate = []
+    for vegetable, market in gaps:
+        cached_result = price_estimate_cache.get(cache.normalize_text(vegetable), cache.normalize_text(market))
+        if cached_result is not None:
+            results.extend(dict(price, source="estimated") for price in cached_result["prices"])
+        else:
+            to_estimate.append((vegetable, market))
+
+    unresolved = []
+    if to_estimate:
+        try:
+            estimates = estimate_prices_batch(to_estimate)
+        except Exception as e:
+            log.error("Batch Gemini price estimation failed", extra={"error": str(e)})
+            estimates = {}
+        for vegetable, market in to_estimate:
+            estimated_price = estimates.get((vegetable, market))
+            if not estimated_price:
+                unresolved.append({"vegetable": vegetable, "location": market})
+                continue
+            price = {"name": vegetable.title(), "location": market.title(), "price": f"{estimated_price} (Estimated)"}
+            price_estimate_cache.set({"prices": [price]}, cache.normalize_text(vegetable), cache.normalize_text(market))
+            results.append(dict(price, source="estimated"))
+
+    for price in results:
+        metrics.record_source("/prices/batch", price["source"])
+    for _ in unresolved:
+        metrics.record_source("/prices/batch", "unresolved")
+    return jsonify({"prices": results, "unresolved": unresolved})
+
+
+def bounded_int_arg(name, default, low, high):
+    """Reads an integer query parameter, raising ValueError unless it is within [low, high]."""
+    try:
+        value = int(request.args.get(name, default))
+    except ValueError:
+        raise ValueError(f"{name} must be a number")
+    if not low <= value <= high:
+        raise ValueError(f"{name} must be between {low} and {high}")
+    return value
+
+
+def price_analytics(compute):
+    """Runs one price history query, mapping bad parameters to 400 and nothing-recorded to 404."""
+    from agropulse import price_history
+    try:
+        return jsonify(compute(price_history_store.get()))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except price_history.NoPriceHistory as e:
+        return jsonify({"error": str(e)}), 404
+
+
+@bp.route("/prices/extremes", methods=["GET"])
+def price_extremes():
+    """Cheapest and most expensive markets for a commodity on a date (latest by default)."""
+    commodity = request.args.get('commodity', '').strip()
+    if not commodity:
+        return jsonify({"error": "commodity is required."}), 400
+    return price_analytics(lambda history: history.extremes(
+        commodity, date=request.args.get('date'), n=bounded_int_arg('n', 5, 1, 100)))
+
+
+@bp.route("/prices/moving-average", methods=["GET"])
+def price_moving_average():
+    """Daily price and trailing moving average for a commodity, in one market or averaged across all of them."""
+    commodity = request.args.get('commodity', '').strip()
+    if not commodity:
+        return jsonify({"error": "commodity is required."}), 400
+    return price_analytics(lambda history: history.moving_average(
+        commodity,
+        market=request.args.get('market', '').strip() or None,
+        window=bounded_int_arg('window', 7, 1, 90),
+        days=bounded_int_arg('days', 30, 1, 366),
+        date=request.args.get('date'),
+    ))
+
+
+@bp.route("/prices/week-over-week", methods=["GET"])
+def price_week_over_week():
+    """Seven-day price change for every matching market/commodity pair, biggest rises first."""
+    return price_analytics(lambda history: history.week_over_week(
+        commodity=request.args.get('commodity', '').strip() or None,
+        market=request.args.get('market', '').strip() or None,
+        state=request.args.get('state', '').strip() or None,
+        date=request.args.get('date'),
+        limit=bounded_int_arg('limit', 50, 1, 5000),
+    ))
+
+
+@bp.route("/prices/percentiles", methods=["GET"])
+def price_percentiles():
+    """Distribution of a commodity's price across a state's markets (all states by default)."""
+    commodity = request.args.get('commodity', '').strip()
+    if not commodity:
+        return jsonify({"error": "commodity is required."}), 400
+
+    def compute(history):
+        q = request.args.get('q')
+        try:
+            percentiles = [float(p) for p in q.split(',')] if q else list(history.DEFAULT_PERCENTILES)
+        except ValueError:
+            raise ValueError("q must be a comma-separated list of numbers")
+        if not all(0 <= p <= 100 for p in percentiles):
+            raise ValueError("q values must be between 0 and 100")
+        return history.percentiles(commodity, state=request.args.get('state', '').strip() or None,
+                                   date=request.args.get('date'), q=percentiles)
+
+    return price_analytics(compute)
+
+
+@bp.route("/price-history-stats", methods=["GET"])
+def price_history_stats():
+    """Reports the size and date range of the price history and how long its last load took."""
+    return jsonify(price_history_store.get().stats())
+
+
+@bp.route("/vegetable-info", methods=["GET"])
 def vegetable_info():
     """Fetches detailed information about a vegetable using the Gemini API."""
     vegetable_name = request.args.get('name', '').strip()
     if not vegetable_name:
         return jsonify({"error": "Vegetable name is required."}), 400
 
+    cached_data = vegetable_info_cache.get(cache.normalize_text(vegetable_name))
+    if cached_data is not None:
+        return cached_jsonify(cached_data, hit=True)
+
     try:
         prompt = f"""
         Provide a detailed guide for the vegetable '{vegetable_name}'.
@@ -559,24 +1325,26 @@ def vegetable_info():
             "generationConfig": {"response_mime_type": "application/json"}
         }
 
-        gemini_response = requests.post(GEMINI_API_URL, json=payload, timeout=45)
+        gemini_response = upstream.post(GEMINI_API_URL, json=payload, timeout=45)
         gemini_response.raise_for_status()
 
         ai_data_text = gemini_response.json()['candidates'][0]['content']['parts'][0]['text']
         veg_data = json.loads(ai_data_text)
         
-        # --- MODIFIED SECTION ---
-        # This part now uses the Google Search function to find a reliable image.
+        # Names warmed with `python -m agropulse.image_search warm` never reach CSE here.
         search_term = veg_data.get("image_search_term", vegetable_name)
-        image_url = get_image_url_from_google(search_term)
+        image_url = vegetable_images.get().lookup(vegetable_name, search_term)
         
         # If Google search fails, it falls back to the old Unsplash link.
         veg_data["image_url"] = image_url or f"https://source.unsplash.com/400x400/?{vegetable_name.replace(' ', '+')}"
 
-        return jsonify(veg_data)
+        vegetable_info_cache.set(veg_data, cache.normalize_text(vegetable_name))
+        return cached_jsonify(veg_data, hit=False)
 
-    except Exception as e:
-        print(f"VEGETABLE INFO ERROR: {e}")
+    except breakers.CircuitOpenError as e:
+        return circuit_open_response(e)
+    except Exception:
+        log.exception("Vegetable info failed", extra={"vegetable": vegetable_name})
         return jsonify({"error": f"Could not retrieve details for {vegetable_name}."}), 500
 
 
@@ -590,17 +1358,8 @@ def get_current_indian_season():
     else:
         return "Zaid (Summer Crop)"
 
-@app.route("/planner", methods=["GET"])
-def planner():
-    """Generates a detailed, location-specific farming plan."""
-    crop = request.args.get("crop", "").strip()
-    area = request.args.get("area", "").strip()
-    location = request.args.get("location", "").strip()
-
-    if not all([crop, area, location]):
-        return jsonify({"error": "Crop, area, and location are required"}), 400
-
-    current_season = get_current_indian_season()
+def planner_payload(crop, area, location, current_season):
+    """The Gemini request for a farming plan, answered as JSON."""
     prompt = f"""
     As a master agricultural planner for India, create a highly detailed and practical farming plan.
 
@@ -647,15 +1406,142 @@ def planner():
         "contents": [{"parts": [{"text": prompt}]}],
         "generationConfig": {"response_mime_type": "application/json"}
     }
+    return payload
+
+
+def request_plan(payload):
+    """Calls Gemini for a farming plan and returns the decoded plan."""
+    response = upstream.post(GEMINI_API_URL, json=payload, timeout=60)
+    response.raise_for_status()
+    plan_data_string = response.json()['candidates'][0]['content']['parts'][0]['text']
+    return json.loads(plan_data_string)
+
+
+def run_planner_job(job):
+    """/planner?async=1 in a job worker; returns the (status, body) the synchronous route would have sent."""
     try:
-        response = requests.post(GEMINI_API_URL, json=payload, timeout=60)
-        response.raise_for_status()
-        plan_data_string = response.json()['candidates'][0]['content']['parts'][0]['text']
-        return jsonify(json.loads(plan_data_string))
-    except Exception as e:
-        print(f"PLANNER ERROR: {e}")
-        return jsonify({"error": f"Failed to generate plan: {e}"}), 500
+        plan_data = request_plan(planner_payload(job["crop"], job["area"], job["location"], job["season"]))
+    except breakers.CircuitOpenError:
+        raise
+    except Exception:
+        log.exception("Planner failed")
+        return 500, {"error": "Failed to generate plan. Please try again later."}
+    planner_cache.set(plan_data, *job["cache_parts"])
+    return 200, plan_data
+
+
+@bp.route("/planner", methods=["GET"])
+def planner():
+    """Generates a detailed, location-specific farming plan."""
+    crop = request.args.get("crop", "").strip()
+    area = request.args.get("area", "").strip()
+    location = request.args.get("location", "").strip()
+
+    if not all([crop, area, location]):
+        return jsonify({"error": "Crop, area, and location are required"}), 400
+
+    current_season = get_current_indian_season()
+    cache_parts = (cache.normalize_text(crop), cache.normalize_area(area), cache.normalize_text(location), current_season)
+    cached_plan = planner_cache.get(*cache_parts)
+    if cached_plan is not None:
+        if streaming.wants_stream(request):
+            return streaming.sse_response(iter([streaming.sse_event("done", cached_plan)]))
+        return cached_jsonify(cached_plan, hit=True)
+
+    payload = planner_payload(crop, area, location, current_season)
+    if jobs.wants_async(request):
+        return job_accepted_response("planner", {"crop": crop, "area": area, "location": location,
+                                                 "season": current_season, "cache_parts": cache_parts})
+    if streaming.wants_stream(request):
+        def finish_plan(plan_data_string):
+            plan_data = json.loads(plan_data_string)
+            planner_cache.set(plan_data, *cache_parts)
+            return plan_data
+
+        return streaming.sse_response(stream_token_events(payload, 60, finish_plan, "Failed to generate plan"))
+
+    try:
+        plan_data = request_plan(payload)
+        planner_cache.set(plan_data, *cache_parts)
+        return cached_jsonify(plan_data, hit=False)
+    except breakers.CircuitOpenError as e:
+        return circuit_open_response(e)
+    except Exception:
+        log.exception("Planner failed")
+        return jsonify({"error": "Failed to generate plan. Please try again later."}), 500
+
+@bp.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    """Status of a /predict or /planner job; once finished, `result` holds the response the route would have sent."""
+    job = background_jobs.get().queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found or its result has expired."}), 404
+    response = jsonify(job)
+    if job["status"] in (jobs.QUEUED, jobs.RUNNING):
+        response.headers["Retry-After"] = str(max(math.ceil(jobs.JOB_POLL_INTERVAL), 1) * 2)
+    return response
+
+@bp.route("/jobs-stats", methods=["GET"])
+def jobs_stats():
+    """Reports queue depth by status, the oldest queued job's age and this process's workers."""
+    return jsonify(background_jobs.get().stats())
+
+@bp.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Prometheus scrape target: per-route latency and sizes, per-upstream latency/errors/sizes, and fallback counts."""
+    body, content_type = metrics.render()
+    return current_app.response_class(body, content_type=content_type)
+
+@bp.route("/mandi-stats", methods=["GET"])
+def mandi_stats():
+    """Reports the ingested mandi store's size, newest arrival date and last ingestion run."""
+    return jsonify(mandi_prices.get().stats())
+
+@bp.before_request
+def admin_only():
+    """/admin/* needs `Authorization: Bearer <ADMIN_TOKEN>`; with no token configured it only answers local callers."""
+    if not request.path.startswith("/admin/"):
+        return None
+    if ADMIN_TOKEN:
+        supplied = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+        if hmac.compare_digest(supplied.encode(), ADMIN_TOKEN.encode()):
+            return None
+    elif request.remote_addr in ("127.0.0.1", "::1"):
+        return None
+    return jsonify({"error": "Not authorized."}), 403
+
+@bp.route("/admin/breakers", methods=["GET"])
+def breaker_states():
+    """Reports each upstream's circuit breaker state, failure rate and rejected calls in this worker."""
+    return jsonify(breakers.stats())
+
+@bp.route("/admin/bulkheads", methods=["GET"])
+def bulkhead_states():
+    """Reports each route class's concurrency limit, slots in use, queue depth and shed requests in this worker."""
+    return jsonify(bulkheads.stats())
+
+@bp.route("/clients-stats", methods=["GET"])
+def clients_stats():
+    """Reports which lazily created clients this worker has built and what each cost."""
+    return jsonify(clients.stats())
+
+
+def create_app():
+    """Builds the Flask app. No client is created here; each is built by the first request that needs it."""
+    app = Flask(__name__)
+    # Uploads larger than this are refused with 413 before they are read; smaller
+    # ones are spooled to a temporary file by Werkzeug rather than held in memory.
+    app.config["MAX_CONTENT_LENGTH"] = int(os.getenv("MAX_UPLOAD_MB", "25")) * 1024 * 1024
+    CORS(app, expose_headers=["X-Cache", "X-Next-Cursor", "Retry-After", "Location"])
+    metrics.init_app(app)
+    bulkheads.init_app(app)
+    app.register_blueprint(bp)
+    return app
+
+
+# Entry point for `gunicorn app:app` and `python app.py`.
+app = create_app()
 
 if __name__ == "__main__":
-    print("Starting Flask server...")
+    log.info("Starting Flask server")
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,130 @@
+"""Measures cold-start cost: importing the app, then each route's first request.
+
+Every route runs in a fresh Python process, as a new serverless instance
+would. Upstream calls go to a zero-latency fake and Firestore is the
+in-memory fake, so the numbers are the app's own startup and first-use
+cost. Prints one JSON report; RSS is the process's peak resident memory.
+
+    python benchmarks/cold_start.py
+    python benchmarks/cold_start.py --routes /prices,/weather --repeat 3
+"""
+import io
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+import statistics
+
+from fake_upstream import FakeUpstream
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# path -> (method, path with query, request kwargs for the Flask test client)
+ROUTES = {
+    "/": ("GET", "/", {}),
+    "/get-items": ("GET", "/get-items", {}),
+    "/search-items": ("GET", "/search-items?q=tomato", {}),
+    "/prices": ("GET", "/prices?vegetable=Tomato&location=Salem", {}),
+    "/weather": ("GET", "/weather?city=Salem", {}),
+    "/agri-news": ("GET", "/agri-news", {}),
+    "/vegetable-info": ("GET", "/vegetable-info?name=Okra", {}),
+    "/planner": ("GET", "/planner?crop=Tomato&area=1%20acre&location=Salem", {}),
+    "/ask-agro-assistant": ("POST", "/ask-agro-assistant", {"json": {"question": "What can this app do?"}}),
+    "/predict": ("POST", "/predict", {"leaf": True}),
+}
+
+
+def _peak_rss_mb():
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _leaf_upload():
+    """A small multipart JPEG upload, built without importing Pillow into the measured process."""
+    with open(os.path.join(REPO_ROOT, "Marketplace.jpg"), "rb") as f:
+        return {"data": {"leaf": (io.BytesIO(f.read()), "leaf.jpg")}, "content_type": "multipart/form-data"}
+
+
+def measure_child(route):
+    """Runs inside the fresh process: times `import app` (via offline_app) and the route's first request."""
+    import time
+    started = time.perf_counter()
+    import offline_app as app_module
+    import_ms = (time.perf_counter() - started) * 1000
+    rss_after_import = _peak_rss_mb()
+
+    method, path, kwargs = ROUTES[route]
+    if kwargs.get("leaf"):
+        kwargs = _leaf_upload()
+    client = app_module.app.test_client()
+    started = time.perf_counter()
+    response = client.open(path, method=method, **kwargs)
+    first_request_ms = (time.perf_counter() - started) * 1000
+
+    return {
+        "route": route,
+        "status": response.status_code,
+        "import_ms": round(import_ms, 1),
+        "first_request_ms": round(first_request_ms, 1),
+        "rss_after_import_mb": rss_after_import,
+        "rss_after_first_request_mb": _peak_rss_mb(),
+        "clients_built": sorted(name for name, client in app_module.clients.stats().items() if client["initialized"]),
+    }
+
+
+def run_route(route, env):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", route],
+        cwd=REPO_ROOT, env=env, capture_output=True, text=True, timeout=120,
+    )
+    for line in reversed(output.stdout.splitlines()):
+        if line.startswith("{"):
+            return json.loads(line)
+    raise RuntimeError(f"{route} failed:\n{output.stderr[-2000:]}")
+
+
+def summarize(samples):
+    result = dict(samples[0])
+    for field in ("import_ms", "first_request_ms", "rss_after_import_mb", "rss_after_first_request_mb"):
+        result[field] = round(statistics.median(sample[field] for sample in samples), 1)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--routes", default=",".join(ROUTES), help="comma-separated route names")
+    parser.add_argument("--repeat", type=int, default=1, help="processes per route; the median is reported")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure_child(args.child)))
+        sys.exit(0)
+
+    fake = FakeUpstream(latency=0).start()
+    scratch = tempfile.mkdtemp(prefix="agropulse-cold-start-")
+    env = dict(
+        os.environ,
+        UPSTREAM_BASE_URL_OVERRIDE=fake.url,
+        FAKE_FIRESTORE_SEED=os.path.join(REPO_ROOT, "fixtures", "marketplace_products.json"),
+        GEMINI_API_KEY="fake", OPENWEATHER_API_KEY="fake", NEWS_API_KEY="fake", DATA_GOV_API_KEY="fake",
+        # Nothing carried over between runs, so every process starts cold.
+        CACHE_BACKEND="memory", GEOCODE_CACHE_BACKEND="memory", IMAGE_CACHE_BACKEND="memory",
+        NEWS_CACHE_PATH=os.path.join(scratch, "news.json"), MANDI_DB_PATH=":memory:",
+    )
+    results = []
+    try:
+        for route in args.routes.split(","):
+            samples = []
+            for _ in range(args.repeat):
+                if os.path.exists(env["NEWS_CACHE_PATH"]):
+                    os.remove(env["NEWS_CACHE_PATH"])
+                samples.append(run_route(route, env))
+            results.append(summarize(samples))
+    finally:
+        fake.stop()
+    print(json.dumps({"python": sys.version.split()[0], "repeat": args.repeat, "routes": results}, indent=2))
@@ -0,0 +1,200 @@
+"""In-memory stand-in for the subset of the Firestore client this app uses.
+
+The benchmark harnesses inject it through offline_app.py (optionally seeded
+from FAKE_FIRESTORE_SEED=products.json, a JSON object of {collection:
+[documents]}) to run the marketplace routes offline. For the official
+emulator, set FIRESTORE_EMULATOR_HOST instead; the real client picks that up
+on its own.
+"""
+import json
+import uuid
+import threading
+
+
+DOCUMENT_ID = "__name__"
+
+_OPERATORS = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+    "in": lambda a, b: a in b,
+    "array-contains": lambda a, b: isinstance(a, list) and b in a,
+}
+
+
+class DocumentSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+    def get(self, field):
+        if field == DOCUMENT_ID:
+            return self.id
+        return (self._data or {}).get(field)
+
+
+class DocumentReference:
+    def __init__(self, collection, doc_id):
+        self._collection = collection
+        self.id = doc_id
+
+    def get(self):
+        with self._collection._lock:
+            data = self._collection._docs.get(self.id)
+        return DocumentSnapshot(self, dict(data) if data is not None else None)
+
+    def set(self, data, merge=False):
+        with self._collection._lock:
+            existing = self._collection._docs.get(self.id) if merge else None
+            self._collection._docs[self.id] = {**(existing or {}), **data}
+        self._collection._notify()
+
+    def update(self, data):
+        self.set(data, merge=True)
+
+    def delete(self):
+        with self._collection._lock:
+            self._collection._docs.pop(self.id, None)
+        self._collection._notify()
+
+
+class Query:
+    def __init__(self, collection, filters=(), orders=(), limit_count=None, cursor=None):
+        self._collection = collection
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit_count
+        self._cursor = cursor
+
+    def _copy(self, **changes):
+        values = {
+            "filters": self._filters, "orders": self._orders,
+            "limit_count": self._limit, "cursor": self._cursor,
+        }
+        values.update(changes)
+        return Query(self._collection, **values)
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction="ASCENDING"):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._copy(limit_count=count)
+
+    def start_after(self, snapshot):
+        return self._copy(cursor=snapshot)
+
+    @staticmethod
+    def _is_after(orders, snapshot, cursor):
+        """True if snapshot sorts strictly after cursor under the given orders."""
+        for field, direction in orders:
+            a, b = snapshot.get(field), cursor.get(field)
+            if a == b:
+                continue
+            return a < b if direction == "DESCENDING" else a > b
+        return False
+
+    def stream(self):
+        with self._collection._lock:
+            snapshots = [
+                DocumentSnapshot(DocumentReference(self._collection, doc_id), dict(data))
+                for doc_id, data in self._collection._docs.items()
+            ]
+
+        for field, op, value in self._filters:
+            snapshots = [s for s in snapshots if s.get(field) is not None and _OPERATORS[op](s.get(field), value)]
+
+        # Like Firestore: documents missing an ordered field are left out, and
+        # the document id is the implicit final tie-breaker.
+        orders = list(self._orders)
+        if not any(field == DOCUMENT_ID for field, _ in orders):
+            last_direction = orders[-1][1] if orders else "ASCENDING"
+            orders.append((DOCUMENT_ID, last_direction))
+        snapshots = [s for s in snapshots if all(s.get(field) is not None for field, _ in orders)]
+        for field, direction in reversed(orders):
+            snapshots.sort(key=lambda s: s.get(field), reverse=direction == "DESCENDING")
+
+        if self._cursor is not None:
+            snapshots = [s for s in snapshots if self._is_after(orders, s, self._cursor)]
+
+        if self._limit is not None:
+            snapshots = snapshots[:self._limit]
+        return iter(snapshots)
+
+    def get(self):
+        return list(self.stream())
+
+
+class CollectionReference(Query):
+    def __init__(self, name):
+        self.id = name
+        self._docs = {}
+        self._lock = threading.RLock()
+        self._listeners = []
+        super().__init__(self)
+
+    def document(self, doc_id=None):
+        return DocumentReference(self, doc_id or uuid.uuid4().hex[:20])
+
+    def add(self, data):
+        reference = self.document()
+        reference.set(data)
+        return None, reference
+
+    def on_snapshot(self, callback):
+        """Calls callback(snapshots, changes, read_time) now and after every write."""
+        self._listeners.append(callback)
+        callback(list(Query(self).stream()), [], None)
+        return _Watch(self, callback)
+
+    def _notify(self):
+        if not self._listeners:
+            return
+        snapshots = list(Query(self).stream())
+        for callback in list(self._listeners):
+            callback(snapshots, [], None)
+
+
+class _Watch:
+    def __init__(self, collection, callback):
+        self._collection = collection
+        self._callback = callback
+
+    def unsubscribe(self):
+        if self._callback in self._collection._listeners:
+            self._collection._listeners.remove(self._callback)
+
+
+class Client:
+    def __init__(self, seed_path=None):
+        self._collections = {}
+        self._lock = threading.Lock()
+        if seed_path:
+            with open(seed_path, 'r', encoding='utf-8') as f:
+                seed = json.load(f)
+            for name, documents in seed.items():
+                collection = self.collection(name)
+                for document in documents:
+                    document = dict(document)
+                    collection.document(document.pop("id", None)).set(document)
+
+    def collection(self, name):
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = CollectionReference(name)
+            return self._collections[name]
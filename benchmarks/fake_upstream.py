@@ -0,0 +1,221 @@
+"""Local stand-in for Gemini, OpenWeatherMap, NewsAPI, data.gov.in, Google CSE and Cloudinary.
+
+Point the app at it with UPSTREAM_BASE_URL_OVERRIDE=http://127.0.0.1:<port>;
+the app keeps the real paths and query strings, and this server answers each
+one with a small, well-formed payload after a configurable delay.
+
+    python benchmarks/fake_upstream.py --port 9100 --latency 0.5 --jitter 0.1 --error-rate 0.01
+"""
+import os
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from urllib.parse import parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+GEMINI_TEXT = json.dumps({
+    "estimated_price": "Approx. ₹32 per Kg",
+    "name": "Tomato",
+    "image_search_term": "Fresh tomato",
+    "history": "Fake history.",
+    "plan_summary": {"title": "Fake plan", "suitability": "Suitable."},
+})
+PREDICTION_TEXT = (
+    "### DISEASE ANALYSIS ###\n- The leaf appears to be healthy.\n"
+    "### SOIL SUITABILITY ###\n- Loamy soil, pH 6.0-7.0.\n"
+    "### PLANTING GUIDE ###\n- 45 cm spacing.\n"
+)
+
+
+# A recorded page of the data.gov.in mandi resource, served with its offset/limit/filters honoured.
+with open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fixtures", "mandi_records.json"),
+          encoding="utf-8") as _f:
+    MANDI_RECORDED = json.load(_f)
+
+
+def _mandi_page(query):
+    params = {key: values[-1] for key, values in parse_qs(query).items()}
+    records = MANDI_RECORDED["records"]
+    for field in ("market", "commodity"):
+        wanted = params.get(f"filters[{field}]")
+        if wanted:
+            records = [record for record in records if record[field].lower() == wanted.lower()]
+    offset = int(params.get("offset", 0))
+    limit = int(params.get("limit", 10))
+    page = records[offset:offset + limit]
+    return dict(MANDI_RECORDED, records=page, total=len(records), count=len(page), offset=offset, limit=limit)
+
+
+def _gemini_body(text):
+    return {"candidates": [{"content": {"parts": [{"text": text}]}}]}
+
+
+# The /prices/batch prompt lists its pairs as `- "Tomato" in "Salem"` and asks for a JSON array back.
+_BATCH_PAIR = re.compile(r'- \\?"([^"\\]+)\\?" in \\?"([^"\\]+)\\?"')
+
+
+def _gemini_text(request_body):
+    """GEMINI_TEXT, or one estimate per pair when the prompt is a /prices/batch prompt."""
+    pairs = _BATCH_PAIR.findall(request_body.decode("utf-8", "replace"))
+    if not pairs:
+        return GEMINI_TEXT
+    return json.dumps([{"vegetable": vegetable, "location": location, "estimated_price": "Approx. ₹32 per Kg"}
+                       for vegetable, location in pairs])
+
+
+def _route(path, query, request_body=b""):
+    """Returns (status, payload) for an upstream path."""
+    if ":generateContent" in path:
+        return 200, _gemini_body(_gemini_text(request_body))
+    if path.startswith("/geo/1.0/direct"):
+        return 200, [{"name": "Fakeville", "lat": 11.0168, "lon": 76.9558}]
+    if path.startswith("/geo/1.0/reverse"):
+        return 200, [{"name": "Fakeville"}]
+    if path.startswith("/data/3.0/onecall/timemachine"):
+        return 200, {"data": [{
+            "hourly": [{"temp": 24.0}, {"temp": 31.5}],
+            "weather": [{"main": "Clouds", "icon": "03d"}],
+            "humidity": 70, "wind_speed": 3.2,
+        }]}
+    if path.startswith("/data/3.0/onecall"):
+        return 200, {"timezone": "Asia/Kolkata", "current": {"temp": 29.0, "weather": [{"main": "Clear"}]},
+                     "hourly": [], "daily": []}
+    if path.startswith("/data/2.5/air_pollution"):
+        return 200, {"list": [{"main": {"aqi": 2}, "components": {}}]}
+    if path.startswith("/v2/everything"):
+        return 200, {"articles": [
+            {"title": f"Fake agri headline {i}", "url": f"https://example.com/{i}", "publishedAt": "2025-01-01T00:00:00Z"}
+            for i in range(25)
+        ]}
+    if path.startswith("/resource/"):
+        return 200, _mandi_page(query)
+    if path.startswith("/customsearch/v1"):
+        return 200, {"items": [{"link": "https://example.com/fake-vegetable.jpg"}]}
+    if path.endswith("/image/upload"):
+        return 200, {"secure_url": "https://example.com/fake-upload.jpg", "public_id": "fake"}
+    return 404, {"error": f"No fake for {path}"}
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # listen() backlog; the default of 5 drops load-test bursts
+
+
+class FakeUpstream:
+    """Threaded fake upstream server with latency, jitter and error injection.
+
+    Tracks total requests and the peak number in flight, which is how a load
+    test can tell how much concurrency the app actually achieved.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.2, jitter=0.0, error_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.httpd = _Server((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _respond(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                request_body = self.rfile.read(length) if length else b""
+                with fake._lock:
+                    fake.requests += 1
+                    fake.in_flight += 1
+                    fake.peak_in_flight = max(fake.peak_in_flight, fake.in_flight)
+                    delay = max(0.0, fake.latency + fake._random.uniform(-fake.jitter, fake.jitter))
+                    fail = fake._random.random() < fake.error_rate
+                try:
+                    time.sleep(delay)
+                    path, _, query = self.path.partition("?")
+                    if fail:
+                        with fake._lock:
+                            fake.errors += 1
+                        status, payload = 503, {"error": "injected failure"}
+                    elif ":streamGenerateContent" in path:
+                        return self._stream_gemini(b"inlineData" in request_body)
+                    else:
+                        status, payload = _route(path, query, request_body)
+                    body = json.dumps(payload).encode("utf-8")
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                finally:
+                    with fake._lock:
+                        fake.in_flight -= 1
+
+            def _stream_gemini(self, is_image_prompt):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                text = PREDICTION_TEXT if is_image_prompt else GEMINI_TEXT
+                for start in range(0, len(text), 24):
+                    event = json.dumps(_gemini_body(text[start:start + 24]))
+                    self.wfile.write(f"data: {event}\r\n\r\n".encode("utf-8"))
+                    self.wfile.flush()
+                    time.sleep(fake.latency / 10)
+                self.close_connection = True
+
+            do_GET = _respond
+            do_POST = _respond
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "peak_in_flight": self.peak_in_flight,
+            }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- seconds of uniform jitter")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    args = parser.parse_args()
+    server = FakeUpstream(args.host, args.port, args.latency, args.jitter, args.error_rate)
+    print(f"Fake upstream listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
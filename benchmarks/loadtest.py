@@ -0,0 +1,130 @@
+"""Compares sync and async (gevent) serving against a local fake upstream.
+
+Starts the fake upstream, then runs gunicorn with the same worker count in
+each AGRO_SERVING_MODE, fires the same burst of concurrent requests at one
+route, and prints a JSON report. peak_upstream_in_flight is the number of
+upstream calls the app had open at the same time.
+
+    python benchmarks/loadtest.py --route ask --requests 100 --concurrency 100 --latency 0.25
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+from fake_upstream import FakeUpstream
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Each request is made unique so no response cache can answer it.
+ROUTES = {
+    "ask": lambda i: ("POST", "/ask-agro-assistant", {"json": {"question": f"How do I use feature {i}?"}}),
+    "weather": lambda i: ("GET", f"/weather?lat={10 + i * 0.05:.2f}&lon=77.00", {}),
+    "planner": lambda i: ("GET", f"/planner?crop=crop{i}&area=1&location=Salem", {}),
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def start_app(mode, workers, upstream_url, extra_env=None):
+    """Launches gunicorn in the given serving mode and waits until it answers."""
+    port = free_port()
+    env = dict(
+        os.environ,
+        AGRO_SERVING_MODE=mode,
+        GUNICORN_WORKERS=str(workers),
+        GUNICORN_BIND=f"127.0.0.1:{port}",
+        UPSTREAM_BASE_URL_OVERRIDE=upstream_url,
+        UPSTREAM_POOL_MAXSIZE="500",
+        **(extra_env or {}),
+    )
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--pythonpath", "benchmarks", "offline_app:app"],
+        cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            requests.get(f"{base_url}/upstream-stats", timeout=1)
+            return process, base_url
+        except requests.exceptions.RequestException:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"gunicorn ({mode}) did not start")
+
+
+def fire(base_url, route, total, concurrency):
+    """Sends `total` requests with `concurrency` in flight; returns latencies and error count."""
+    def one(i):
+        method, path, kwargs = ROUTES[route](i)
+        started = time.perf_counter()
+        try:
+            response = requests.request(method, base_url + path, timeout=120, **kwargs)
+            ok = response.status_code < 500
+        except requests.exceptions.RequestException:
+            ok = False
+        return time.perf_counter() - started, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    return time.perf_counter() - started, [r[0] for r in results], sum(1 for r in results if not r[1])
+
+
+def run_mode(mode, args):
+    fake = FakeUpstream(latency=args.latency).start()
+    process, base_url = start_app(mode, args.workers, fake.url)
+    try:
+        elapsed, latencies, errors = fire(base_url, args.route, args.requests, args.concurrency)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+        fake.stop()
+    return {
+        "mode": mode,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(args.requests / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "errors": errors,
+        "peak_upstream_in_flight": fake.stats()["peak_in_flight"],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--route", choices=sorted(ROUTES), default="ask")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.25, help="fake upstream latency in seconds")
+    parser.add_argument("--modes", default="sync,async")
+    args = parser.parse_args()
+
+    report = {
+        "route": args.route,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "workers": args.workers,
+        "upstream_latency_s": args.latency,
+        "results": [run_mode(mode, args) for mode in args.modes.split(",")],
+    }
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,24 @@
+"""The app with the in-memory fake_firestore.py in place of Firestore, for the benchmark harnesses.
+
+FAKE_FIRESTORE_SEED (a JSON object of {collection: [documents]}) preloads it.
+
+    gunicorn -c gunicorn.conf.py --pythonpath benchmarks offline_app:app
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agropulse import clients
+import fake_firestore
+
+
+def fake_firestore_client():
+    db = fake_firestore.Client(seed_path=os.getenv("FAKE_FIRESTORE_SEED"))
+    clients.log.info("Using in-memory fake Firestore")
+    return db
+
+
+clients.firestore_db.use(fake_firestore_client)
+
+from app import app, create_app  # noqa: E402,F401
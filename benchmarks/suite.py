@@ -0,0 +1,247 @@
+"""Load-test every route against local fakes and report latency, throughput and memory as JSON.
+
+Runs the app under gunicorn with the in-memory Firestore fake, pointed at
+fake_upstream.py, which stands in for Gemini, OpenWeatherMap, NewsAPI,
+data.gov.in, Google CSE and Cloudinary. Each route is driven in turn at the
+given concurrency, while the gunicorn workers' resident memory is sampled.
+
+    python benchmarks/suite.py --concurrency 20 --requests 200 --output results.json
+    python benchmarks/suite.py --mode async --latency 0.3 --jitter 0.1 --error-rate 0.02
+    python benchmarks/suite.py --baseline results.json   # exits 1 if a route regressed
+
+Requests cycle over a small pool of inputs per route (a few cities,
+vegetables and crops), so caches warm up the way they would under real
+traffic.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import threading
+import subprocess
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+from fake_upstream import FakeUpstream
+from loadtest import REPO_ROOT, start_app, percentile
+
+
+CITIES = ["Salem", "Coimbatore", "Madurai", "Erode", "Tiruppur"]
+VEGETABLES = ["Tomato", "Onion", "Brinjal", "Okra", "Carrot"]
+CROPS = ["Tomato", "Paddy", "Groundnut", "Sugarcane"]
+
+with open(os.path.join(REPO_ROOT, "Marketplace.jpg"), "rb") as _f:
+    LEAF_JPEG = _f.read()
+
+# route name -> request i -> (method, path, requests kwargs)
+ROUTES = {
+    "/": lambda i: ("GET", "/", {}),
+    "/get-items": lambda i: ("GET", "/get-items", {}),
+    "/get-items?page": lambda i: ("GET", "/get-items?sort=price_asc&page_size=5", {}),
+    "/search-items": lambda i: ("GET", f"/search-items?q={VEGETABLES[i % 5].lower()[:4]}", {}),
+    "/add-item": lambda i: ("POST", "/add-item", {"json": {
+        "itemName": f"{VEGETABLES[i % 5]} {i}", "category": "vegetables", "itemPrice": 20 + i % 30,
+        "sellerLocation": CITIES[i % 5],
+    }}),
+    "/upload-item-image": lambda i: ("POST", "/upload-item-image", {"files": {"item_image": ("item.jpg", LEAF_JPEG)}}),
+    "/prices": lambda i: ("GET", f"/prices?vegetable={VEGETABLES[i % 5]}&location={CITIES[i % 5]}", {}),
+    "/prices/batch": lambda i: ("POST", "/prices/batch", {"json": {"vegetables": VEGETABLES, "markets": CITIES}}),
+    "/weather": lambda i: ("GET", f"/weather?city={CITIES[i % 5]}", {}),
+    "/weather-history": lambda i: ("GET", f"/weather-history?lat={11 + i % 5}&lon=77", {}),
+    "/agri-news": lambda i: ("GET", "/agri-news", {}),
+    "/vegetable-info": lambda i: ("GET", f"/vegetable-info?name={VEGETABLES[i % 5]}", {}),
+    "/planner": lambda i: ("GET", f"/planner?crop={CROPS[i % 4]}&area=1%20acre&location={CITIES[i % 5]}", {}),
+    "/ask-agro-assistant": lambda i: ("POST", "/ask-agro-assistant", {"json": {"question": f"How do I use feature {i % 10}?"}}),
+    "/predict": lambda i: ("POST", "/predict", {"files": {"leaf": ("leaf.jpg", LEAF_JPEG)}}),
+}
+
+
+def worker_pids(master_pid):
+    """gunicorn's worker processes (Linux /proc); empty elsewhere."""
+    try:
+        with open(f"/proc/{master_pid}/task/{master_pid}/children") as f:
+            return [int(pid) for pid in f.read().split()]
+    except OSError:
+        return []
+
+
+def rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class MemorySampler:
+    """Samples the summed RSS of every gunicorn worker while a route is under load."""
+
+    def __init__(self, master_pid, interval=0.1):
+        self.master_pid = master_pid
+        self.interval = interval
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self):
+        sizes = [rss_mb(pid) for pid in worker_pids(self.master_pid)]
+        sizes = [size for size in sizes if size is not None]
+        return sum(sizes) if sizes else None
+
+    def _run(self):
+        while not self._stop.is_set():
+            current = self._sample()
+            if current is not None and (self.peak is None or current > self.peak):
+                self.peak = current
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.current = self._sample()
+
+
+def drive(base_url, route, total, concurrency):
+    """Sends `total` requests to one route with `concurrency` in flight."""
+    local = threading.local()
+
+    def one(i):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        method, path, kwargs = ROUTES[route](i)
+        started = time.perf_counter()
+        try:
+            status = session.request(method, base_url + path, timeout=120, **kwargs).status_code
+        except requests.exceptions.RequestException as e:
+            status = type(e).__name__
+        return time.perf_counter() - started, status
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    return time.perf_counter() - started, results
+
+
+def run_route(base_url, master_pid, route, args):
+    with MemorySampler(master_pid) as memory:
+        elapsed, results = drive(base_url, route, args.requests, args.concurrency)
+    latencies = [latency * 1000 for latency, _ in results]
+    statuses = Counter(str(status) for _, status in results)
+    errors = sum(count for status, count in statuses.items() if not status.isdigit() or int(status) >= 500)
+    return {
+        "route": route,
+        "requests": len(results),
+        "errors": errors,
+        "status_counts": dict(statuses),
+        "throughput_rps": round(len(results) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(max(latencies), 2),
+        "peak_rss_mb": round(memory.peak, 1) if memory.peak is not None else None,
+        "rss_after_mb": round(memory.current, 1) if memory.current is not None else None,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline, tolerance):
+    """Lists routes whose p95 grew or throughput fell by more than `tolerance` (a fraction) vs the baseline."""
+    previous = {entry["route"]: entry for entry in baseline["routes"]}
+    regressions = []
+    for entry in report["routes"]:
+        old = previous.get(entry["route"])
+        if old is None:
+            continue
+        if old["p95_ms"] and entry["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{entry['route']}: p95 {old['p95_ms']} -> {entry['p95_ms']} ms")
+        if old["throughput_rps"] and entry["throughput_rps"] < old["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{entry['route']}: throughput {old['throughput_rps']} -> {entry['throughput_rps']} req/s")
+        if entry["errors"] > old["errors"]:
+            regressions.append(f"{entry['route']}: errors {old['errors']} -> {entry['errors']}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--routes", default=",".join(ROUTES), help="comma-separated route names (default: all)")
+    parser.add_argument("--requests", type=int, default=200, help="requests per route")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--mode", choices=["sync", "async"], default="async", help="AGRO_SERVING_MODE for gunicorn")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=0.2, help="fake upstream latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.05, help="+/- seconds of uniform jitter")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of upstream calls answered with 503")
+    parser.add_argument("--seed", type=int, default=1, help="seed for jitter and error injection")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    parser.add_argument("--baseline", help="earlier report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression vs the baseline (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    unknown = [route for route in args.routes.split(",") if route not in ROUTES]
+    if unknown:
+        parser.error(f"unknown routes: {', '.join(unknown)}")
+
+    fake = FakeUpstream(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, seed=args.seed).start()
+    extra_env = {
+        "FAKE_FIRESTORE_SEED": os.path.join(REPO_ROOT, "fixtures", "marketplace_products.json"),
+        "GEMINI_API_KEY": "fake", "OPENWEATHER_API_KEY": "fake", "NEWS_API_KEY": "fake",
+        "DATA_GOV_API_KEY": "fake", "GOOGLE_CSE_API_KEY": "fake", "GOOGLE_CSE_ID": "fake",
+        "CLOUDINARY_CLOUD_NAME": "fake", "CLOUDINARY_API_KEY": "fake", "CLOUDINARY_API_SECRET": "fake",
+        # Keep the run self-contained: no caches read from or left on disk.
+        "CACHE_BACKEND": "memory", "GEOCODE_CACHE_BACKEND": "memory", "IMAGE_CACHE_BACKEND": "memory",
+        "NEWS_CACHE_PATH": os.devnull, "MANDI_DB_PATH": ":memory:",
+    }
+    process, base_url = start_app(args.mode, args.workers, fake.url, extra_env)
+    routes = []
+    try:
+        for route in args.routes.split(","):
+            routes.append(run_route(base_url, process.pid, route, args))
+            print(f"{route}: p95 {routes[-1]['p95_ms']} ms, {routes[-1]['throughput_rps']} req/s", file=sys.stderr)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+        fake.stop()
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "mode": args.mode,
+            "workers": args.workers,
+            "concurrency": args.concurrency,
+            "requests_per_route": args.requests,
+            "upstream": {"latency_s": args.latency, "jitter_s": args.jitter, "error_rate": args.error_rate},
+        },
+        "routes": routes,
+        "upstream_stats": fake.stats(),
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION: {line}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
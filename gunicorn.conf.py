@@ -0,0 +1,64 @@
+# Gunicorn settings: gunicorn -c gunicorn.conf.py app:app
+#
+# AGRO_SERVING_MODE=sync  (default) classic worker per request, as before.
+# AGRO_SERVING_MODE=async gevent workers: every socket operation (requests,
+#   urllib3, sqlite waits, Firestore gRPC) yields instead of blocking, so one
+#   process can hold hundreds of in-flight upstream calls. The Flask routes
+#   and their JSON are unchanged.
+#
+# Bulkheads (BULKHEADS_ENABLED=1, off by default) limit concurrency per
+# process, and a sync worker only ever holds one request, so they only engage
+# with async. Turning them on under sync logs a warning at startup.
+import os
+import multiprocessing
+
+# Parsed here rather than imported from agropulse/bulkheads.py, which would load prometheus_client into the master.
+bulkheads_enabled = os.getenv("BULKHEADS_ENABLED", "0").lower() not in ("0", "false", "no")
+serving_mode = os.getenv("AGRO_SERVING_MODE", "sync").lower()
+
+bind = os.getenv("GUNICORN_BIND", f"0.0.0.0:{os.getenv('PORT', '5000')}")
+workers = int(os.getenv("GUNICORN_WORKERS", str(min(multiprocessing.cpu_count() * 2 + 1, 8))))
+# Gemini calls can take up to 60s; leave headroom above the longest upstream timeout.
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "90"))
+keepalive = 5
+
+if serving_mode == "async":
+    worker_class = "gevent"
+    worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "1000"))
+else:
+    worker_class = "sync"
+
+
+def post_fork(server, worker):
+    if serving_mode != "async":
+        return
+    # Patch before the app (and its Firestore gRPC channel) is imported in this worker.
+    from gevent import monkey
+    monkey.patch_all()
+    try:
+        import grpc.experimental.gevent as grpc_gevent
+        grpc_gevent.init_gevent()
+    except ImportError:
+        pass
+
+
+# With PROMETHEUS_MULTIPROC_DIR set, every worker writes its metrics to that
+# directory and /metrics merges them. Files left by an earlier run are cleared
+# on start, and a dead worker's live-only samples are dropped.
+def on_starting(server):
+    if bulkheads_enabled and serving_mode != "async":
+        server.log.warning("AGRO_SERVING_MODE=%s serves one request per worker, so the bulkheads never engage; "
+                           "use AGRO_SERVING_MODE=async or leave BULKHEADS_ENABLED unset", serving_mode)
+    multiproc_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if not multiproc_dir:
+        return
+    os.makedirs(multiproc_dir, exist_ok=True)
+    for name in os.listdir(multiproc_dir):
+        if name.endswith(".db"):
+            os.remove(os.path.join(multiproc_dir, name))
+
+
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)